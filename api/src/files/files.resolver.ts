@@ -18,8 +18,7 @@ import { getLogger } from 'log4js';
 import { checkAccessLevel } from '../auth/checkAccess';
 import { queryMinLength } from '../shared/variables';
 import { Language } from '../schema/misc/language';
-import { predictLanguage, predictLibrary } from '../nlp/nlpBridge';
-import { pairwiseDifference } from '../utils/math';
+import { predict, NLPPredictOutput } from '../nlp/nlpBridge';
 import { configData } from '../utils/config';
 import parseQueryLanguage, { languageKey } from './queryLanguage';
 import esb from 'elastic-builder';
@@ -247,47 +246,42 @@ export const search = async (user: User | null, args: FilesArgs, repositoryData?
   }
 
   const languageFilters: esb.Query[] = [];
+  const addQueryLanguageFilters = (query: string): void => {
+    // query language handler
+    const queryLanguageRes = parseQueryLanguage(query);
+    if (queryLanguageRes.hasData) {
+      for (const language of queryLanguageRes.data[languageKey]) {
+        languageFilters.push(esb.termQuery('language', language));
+      }
+    }
+  };
   if (!oneFile) {
     if (args.languages) {
       for (const language of args.languages) {
         languageFilters.push(esb.termQuery('language', language));
       }
     } else if (args.query && configData.CONNECT_NLP) {
-      // get the language from nlp
-      const languagePrediction = await predictLanguage({
-        query: args.query
-      });
-      if (languagePrediction.data.length > 0) {
-        const scores = languagePrediction.data.map(elem => elem.score);
-        const pairwiseDiff = pairwiseDifference(scores);
-        if (pairwiseDiff > minPairwiseDifference) {
-          // TODO - change to have a weight for all the languages
-          const bestLanguage = languagePrediction.data.reduce(
-            (prev, curr) => curr.score > prev.score ? {
-              ...curr,
-              name: curr.name as Language
-            } : prev, {
-            name: Language.none,
-            score: 0
-          });
-          languageFilters.push(esb.termQuery('language', bestLanguage.name));
-          const libraryPrediction = await predictLibrary({
-            query: args.query,
-            language: bestLanguage.name,
-            package_manager: 'maven',
-          });
-          // eslint-disable-next-line no-console
-          console.log(`Library Prediction: ${libraryPrediction} `);
-        }
+      // get the language and libraries from nlp in a single round trip
+      let prediction: NLPPredictOutput | undefined;
+      try {
+        prediction = await predict({
+          query: args.query,
+          package_manager: 'maven',
+          min_pairwise_difference: minPairwiseDifference,
+        });
+      } catch (err) {
+        // nlp is overloaded or unavailable, don't let search wait on it
+        logger.warn(`nlp prediction failed, using query language: ${err.message}`);
+        addQueryLanguageFilters(args.query);
       }
-    } else if (args.query) {
-      // query language handler
-      const queryLanguageRes = parseQueryLanguage(args.query);
-      if (queryLanguageRes.hasData) {
-        for (const language of queryLanguageRes.data[languageKey]) {
-          languageFilters.push(esb.termQuery('language', language));
-        }
+      if (prediction && prediction.language) {
+        // TODO - change to have a weight for all the languages
+        languageFilters.push(esb.termQuery('language', prediction.language as Language));
+        // eslint-disable-next-line no-console
+        console.log(`Library Prediction: ${prediction.libraries} `);
       }
+    } else if (args.query) {
+      addQueryLanguageFilters(args.query);
     }
   }
 
@@ -12,7 +12,7 @@ let nlpClient: AxiosInstance;
 
 const defaultLimitPredict = 5;
 
-interface NLPPredictLanguageOutput {
+export interface NLPPredictLanguageOutput {
   data: components['schemas']['Prediction'][];
 };
 interface NLPPredictLibraryOutput {
@@ -28,7 +28,51 @@ interface NLPPredictLibraryInput {
   package_manager: string,
 };
 
+export interface NLPPredictOutput {
+  languages: components['schemas']['Prediction'][];
+  pairwise_difference: number;
+  language: string | null;
+  libraries: Record<string, unknown> | null;
+  related_libraries: string[];
+  error?: boolean;
+  error_msg?: Record<string, string>;
+};
+interface NLPPredictInput {
+  query: string,
+  limit?: number;
+  library_limit?: number;
+  related_limit?: number;
+  package_manager?: string;
+  min_pairwise_difference?: number;
+};
+
+interface NLPPredictLanguageBatchOutput {
+  data: components['schemas']['Prediction'][][];
+};
+interface NLPPredictLibraryBatchOutput {
+  // one elasticsearch search response per query, in order
+  data: Record<string, unknown>[];
+};
+interface NLPPredictRelatedLibraryBatchOutput {
+  data: string[][];
+};
+interface NLPPredictLanguageBatchInput {
+  queries: string[],
+  limit?: number;
+};
+interface NLPPredictLibraryBatchInput {
+  queries: string[],
+  language: string,
+  package_manager: string,
+};
+interface NLPPredictRelatedLibraryBatchInput {
+  queries: string[],
+  limit?: number;
+};
+
 const pingRetryAfter = 5;
+// ms. also sent to nlp so it can shed requests we stopped waiting for
+const nlpTimeout = 3000;
 
 export const predictLanguage = async(input: NLPPredictLanguageInput): Promise<NLPPredictLanguageOutput> => {
   if (!input.limit) {
@@ -56,6 +100,53 @@ export const predictLibrary = async (input: NLPPredictLibraryInput): Promise<NLP
   return processOutput.data;
 };
 
+export const predict = async (input: NLPPredictInput): Promise<NLPPredictOutput> => {
+  if (!input.query) {
+    throw new Error('No query found for predict');
+  }
+  if (!input.limit) {
+    input.limit = defaultLimitPredict;
+  }
+  const processOutput = await nlpClient.put<NLPPredictOutput>('/predict', input);
+  if (!processOutput.data) {
+    throw new Error('cannot find predict data');
+  }
+  return processOutput.data;
+};
+
+export const predictLanguageBatch = async (input: NLPPredictLanguageBatchInput): Promise<NLPPredictLanguageBatchOutput> => {
+  if (!input.limit) {
+    input.limit = defaultLimitPredict;
+  }
+  const processOutput = await nlpClient.put<NLPPredictLanguageBatchOutput>('/predictLanguageBatch', input);
+  if (!processOutput.data) {
+    throw new Error('cannot find predict language batch data');
+  }
+  return processOutput.data;
+};
+
+export const predictLibraryBatch = async (input: NLPPredictLibraryBatchInput): Promise<NLPPredictLibraryBatchOutput> => {
+  if (!input.language) {
+    throw new Error('No language found for predict library batch');
+  }
+  const processOutput = await nlpClient.put<NLPPredictLibraryBatchOutput>('/predictLibraryBatch', input);
+  if (!processOutput.data) {
+    throw new Error('Cannot find output data for predict library batch');
+  }
+  return processOutput.data;
+};
+
+export const predictRelatedLibraryBatch = async (input: NLPPredictRelatedLibraryBatchInput): Promise<NLPPredictRelatedLibraryBatchOutput> => {
+  if (!input.limit) {
+    input.limit = defaultLimitPredict;
+  }
+  const processOutput = await nlpClient.put<NLPPredictRelatedLibraryBatchOutput>('/predictRelatedLibraryBatch', input);
+  if (!processOutput.data) {
+    throw new Error('Cannot find output data for predict related library batch');
+  }
+  return processOutput.data;
+};
+
 export const pingNLP = async (): Promise<boolean> => {
   try {
     const res = await nlpClient.get('/ping');
@@ -82,9 +173,10 @@ export const initializeNLP = async (): Promise<boolean> => {
         'Cache-Control': 'no-cache, no-store, must-revalidate',
         [contentTypeHeader]: 'application/json',
         Pragma: 'no-cache',
+        'X-Request-Timeout': nlpTimeout,
       },
     },
-    timeout: 3000,
+    timeout: nlpTimeout,
   });
   for (;;) {
     try {
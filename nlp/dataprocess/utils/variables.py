@@ -58,6 +58,18 @@ batch_size: int = 32
 # we_tf_data_folder: str = "tf_dataset"
 
 language_prediction_data_folder = "language_prediction"
+language_prediction_checkpoints_folder = "language_prediction_model_checkpoints"
+language_prediction_training_checkpoints_folder = "language_prediction_training_checkpoints"
+language_prediction_serving_folder = "language_prediction_model_serving"
+language_prediction_tokenizer_folder = "language_prediction_tokenizer"
+language_prediction_tokenizer_config_file = "language_prediction_tokenizer.yml"
+language_prediction_features_folder = "language_prediction_features"
+language_prediction_tfrecord_folder = "language_prediction_tfrecords"
+language_prediction_split_folder = "language_prediction_splits"
+language_prediction_tflite_file = "language_prediction_model.tflite"
+language_prediction_fast_model_file = "language_prediction_fast_model.npz"
+# names of the serving signature inputs, in the order of the keras model inputs
+serving_input_names = ["input_ids", "input_masks_ids", "input_segments"]
 base_library_prediction_data_folder = "base_library_prediction"
 related_library_prediction_data_folder = "related_library_prediction"
 
@@ -0,0 +1,6 @@
+"""
+pytest configuration
+
+the directory of this file is added to sys.path, so that tests import the
+server modules as src.* like the server does
+"""
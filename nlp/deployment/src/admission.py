@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+admission control
+
+bounds the number of in-flight requests per route with a short wait
+queue. requests beyond that, requests that waited too long and requests
+whose client deadline has passed fail fast with 503 and Retry-After
+instead of piling up in front of the model
+"""
+
+import time
+import asyncio
+
+from typing import Awaitable, Callable, Dict, Optional
+from aiohttp import web
+from prometheus_client import Counter, Gauge
+from src.tracing import record_phase, ADMISSION_WAIT_PHASE
+
+# time budget of the request in milliseconds, relative to when it was received
+DEADLINE_HEADER: str = 'X-Request-Timeout'
+
+QUEUE_FULL_REASON: str = 'queue_full'
+QUEUE_TIMEOUT_REASON: str = 'queue_timeout'
+DEADLINE_REASON: str = 'deadline_exceeded'
+
+REJECTIONS = Counter('nlp_admission_rejections_total',
+                     'Requests rejected by admission control', ['route', 'reason'])
+QUEUED = Gauge('nlp_admission_queued', 'Requests waiting for admission', ['route'])
+
+
+class AdmissionController:
+    """
+    in-flight limit with a bounded wait queue for a single route
+    """
+
+    def __init__(self, route: str, max_in_flight: int, max_queue: int,
+                 max_wait_ms: float, retry_after: int):
+        if max_in_flight < 1:
+            raise ValueError('max in-flight requests must be at least 1')
+        self.route = route
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000.
+        self.retry_after = retry_after
+        self.in_flight: int = 0
+        self.queued: int = 0
+        self.rejections: Dict[str, int] = {
+            QUEUE_FULL_REASON: 0,
+            QUEUE_TIMEOUT_REASON: 0,
+            DEADLINE_REASON: 0,
+        }
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        QUEUED.labels(route).set_function(lambda: self.queued)
+
+    def _reject(self, reason: str) -> web.HTTPServiceUnavailable:
+        self.rejections[reason] += 1
+        REJECTIONS.labels(self.route, reason).inc()
+        return web.HTTPServiceUnavailable(
+            reason=f'request rejected: {reason}',
+            headers={'Retry-After': str(self.retry_after)})
+
+    async def acquire(self, deadline: Optional[float]) -> None:
+        """
+        wait for an in-flight slot. deadline is a time.monotonic() timestamp.
+        raises HTTPServiceUnavailable when the request should be shed
+        """
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                raise self._reject(QUEUE_FULL_REASON)
+            wait = self.max_wait
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), max(wait, 0))
+            except asyncio.TimeoutError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise self._reject(DEADLINE_REASON)
+                raise self._reject(QUEUE_TIMEOUT_REASON)
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+        if deadline is not None and time.monotonic() >= deadline:
+            # nobody is waiting for the answer anymore, don't spend model time on it
+            self._semaphore.release()
+            raise self._reject(DEADLINE_REASON)
+        self.in_flight += 1
+
+    def release(self) -> None:
+        """
+        give the in-flight slot back
+        """
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, object]:
+        """
+        admission statistics
+        """
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'rejections': dict(self.rejections),
+        }
+
+
+def _read_deadline(request: web.Request) -> Optional[float]:
+    timeout = request.headers.get(DEADLINE_HEADER)
+    if timeout is None:
+        return None
+    try:
+        return time.monotonic() + float(timeout) / 1000.
+    except ValueError:
+        raise web.HTTPBadRequest(reason=f'{DEADLINE_HEADER} must be a number of milliseconds')
+
+
+def admission_middleware(controllers: Dict[str, AdmissionController]):
+    """
+    middleware applying the admission controller of the matched route, keyed by path
+    """
+    @web.middleware
+    async def middleware(request: web.Request,
+                         handler: Callable[[web.Request], Awaitable[web.StreamResponse]]
+                         ) -> web.StreamResponse:
+        controller = controllers.get(request.path)
+        if controller is None:
+            return await handler(request)
+        start = time.perf_counter()
+        await controller.acquire(_read_deadline(request))
+        record_phase(ADMISSION_WAIT_PHASE, time.perf_counter() - start)
+        try:
+            return await handler(request)
+        finally:
+            controller.release()
+    return middleware
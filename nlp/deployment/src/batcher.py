@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+dynamic micro-batching
+
+collects concurrent prediction requests for a short window and runs them
+through the model as a single batch, scattering the results back to the
+waiting requests
+"""
+
+import time
+import asyncio
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from src.inference import run_inference
+from src.tracing import RequestTrace, TraceGroup, current_trace, use_trace, BATCH_WAIT_PHASE
+
+# input, future of its prediction, trace of its request and when it was queued
+_QueueItem = Tuple[Any, 'asyncio.Future[Any]', Optional[RequestTrace], float]
+
+
+class PredictionBatcher:
+    """
+    batches individual inputs for a blocking batch prediction function
+    """
+
+    def __init__(self, predict_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int, max_wait_ms: float):
+        """
+        predict_batch takes a list of inputs and returns a list of outputs in
+        the same order. it is run on the inference executor
+        """
+        if max_batch_size < 1:
+            raise ValueError('max batch size must be at least 1')
+        if max_wait_ms < 0:
+            raise ValueError('max batch wait must not be negative')
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.
+        self._queue: Optional['asyncio.Queue[_QueueItem]'] = None
+        self._collector: Optional['asyncio.Task[None]'] = None
+        self.num_batches: int = 0
+        self.num_inputs: int = 0
+
+    def start(self) -> None:
+        """
+        start collecting batches on the running event loop
+        """
+        self._queue = asyncio.Queue()
+        self._collector = asyncio.ensure_future(self._collect())
+
+    async def stop(self) -> None:
+        """
+        stop collecting batches
+        """
+        if self._collector is None:
+            return
+        self._collector.cancel()
+        try:
+            await self._collector
+        except asyncio.CancelledError:
+            pass
+        self._collector = None
+
+    async def predict(self, value: Any) -> Any:
+        """
+        queue a single input and wait for its prediction
+        """
+        if self._queue is None:
+            raise RuntimeError('batcher not started')
+        future: 'asyncio.Future[Any]' = asyncio.get_event_loop().create_future()
+        await self._queue.put((value, future, current_trace(), time.perf_counter()))
+        return await future
+
+    def stats(self) -> Dict[str, float]:
+        """
+        batching statistics
+        """
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.,
+            'batches': self.num_batches,
+            'mean_batch_size': self.num_inputs / self.num_batches if self.num_batches > 0 else 0.,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    async def _collect(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_event_loop()
+        while True:
+            batch: List[_QueueItem] = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # take whatever is already queued before waiting on the clock
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # run batches concurrently, the inference executor bounds parallelism
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[_QueueItem]) -> None:
+        values = [value for value, _, _, _ in batch]
+        self.num_batches += 1
+        self.num_inputs += len(values)
+        # the phases of the batch count for every traced request in it
+        traces: List[RequestTrace] = []
+        now = time.perf_counter()
+        for _, _, trace, queued in batch:
+            if trace is not None:
+                trace.add(BATCH_WAIT_PHASE, now - queued)
+                traces.append(trace)
+        try:
+            with use_trace(TraceGroup(traces) if len(traces) > 0 else None):
+                results = await run_inference(self.predict_batch, values)
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f'batch prediction returned {len(results)} results for {len(batch)} inputs')
+        except Exception as err:
+            logger.error(f'batch prediction failed: {err}')
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        for (_, future, _, _), result in zip(batch, results):
+            # the waiting request may have been cancelled by its client
+            if not future.done():
+                future.set_result(result)
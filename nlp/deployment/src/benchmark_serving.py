@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+serving benchmark
+
+compares the latency of the eager keras checkpoint with the exported
+serving signature for several batch sizes
+"""
+
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("deployment")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from typing import Any, Callable, Dict, List
+from loguru import logger
+from src.serving_model import ServingModel
+from utils.utils import get_file_path_relative
+from utils.variables import data_folder, models_folder, language_prediction_data_folder, \
+    language_prediction_checkpoints_folder, language_prediction_serving_folder
+
+
+def _time_calls(predict: Callable, batch_size: int, max_sequence_length: int,
+                iterations: int) -> Dict[str, float]:
+    inputs = tuple(np.ones((batch_size, max_sequence_length), dtype=np.int32)
+                   for _ in range(3))
+    # the first call includes tracing / kernel initialization
+    start = time.perf_counter()
+    predict(inputs)
+    first_call = time.perf_counter() - start
+
+    latencies: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        np.asarray(predict(inputs))
+        latencies.append(time.perf_counter() - start)
+    return {
+        'first_call_ms': first_call * 1000.,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000.,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000.,
+        'examples_per_sec': batch_size * iterations / sum(latencies),
+    }
+
+
+def _markdown_report(results: Dict[str, Dict[int, Dict[str, float]]], setup: Dict[str, Any]) -> str:
+    """
+    before / after table of the keras checkpoint and the serving signature,
+    preceded by the setup it was measured on
+    """
+    lines = ['setup:', '']
+    lines.extend(f'- {key}: {value}' for key, value in setup.items())
+    lines.extend([
+        '',
+        '| batch size | keras p50 ms | keras p99 ms | signature p50 ms | signature p99 ms | p50 speedup |'
+        ' keras first call ms | signature first call ms |',
+        '| --- | --- | --- | --- | --- | --- | --- | --- |',
+    ])
+    for batch_size, before in results['keras_eager'].items():
+        after = results['serving_signature'][batch_size]
+        lines.append(
+            f"| {batch_size} | {before['p50_ms']:.2f} | {before['p99_ms']:.2f} | {after['p50_ms']:.2f} "
+            f"| {after['p99_ms']:.2f} | {before['p50_ms'] / after['p50_ms']:.2f}x "
+            f"| {before['first_call_ms']:.0f} | {after['first_call_ms']:.0f} |")
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--max-sequence-length', type=int, default=64)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--report', type=str, default=None,
+                        help='also write a markdown before / after table with the setup to this file')
+    parser.add_argument('--xla', action='store_true',
+                        help='the serving signature was exported with --xla, recorded in the report')
+    args = parser.parse_args()
+
+    model_folder = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder))
+    keras_model = tf.keras.models.load_model(os.path.join(model_folder, language_prediction_checkpoints_folder))
+    serving_model = ServingModel(os.path.join(model_folder, language_prediction_serving_folder))
+
+    results = {}
+    for name, predict in [('keras_eager', keras_model), ('serving_signature', serving_model)]:
+        results[name] = {}
+        for batch_size in args.batch_sizes:
+            logger.info(f'benchmarking {name} with batch size {batch_size}')
+            results[name][batch_size] = _time_calls(predict, batch_size, args.max_sequence_length, args.iterations)
+    print(json.dumps(results, indent=2))
+
+    if args.report is not None:
+        setup = {
+            'tensorflow': tf.__version__,
+            'cpus': os.cpu_count(),
+            'gpus': len(tf.config.list_physical_devices('GPU')),
+            'xla': args.xla,
+            'max sequence length': args.max_sequence_length,
+            'iterations': args.iterations,
+        }
+        with open(args.report, 'w') as report_file:
+            report_file.write(_markdown_report(results, setup))
+        logger.success(f'report written to {args.report}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""
+prediction cache
+
+bounded in-process LRU cache with a time to live for prediction results.
+concurrent requests for the same key share a single computation
+"""
+
+import re
+import time
+import asyncio
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+_whitespace = re.compile(r'\s+')
+
+
+def normalize_query(query: str, lowercase: bool = False) -> str:
+    """
+    normalize a query so that trivially different queries share a cache entry
+    """
+    query = _whitespace.sub(' ', str(query)).strip()
+    return query.lower() if lowercase else query
+
+
+def cache_key(endpoint: str, query: str, **params: Any) -> Hashable:
+    """
+    key for the given endpoint, normalized query and request parameters
+    """
+    return (endpoint, query, tuple(sorted(params.items())))
+
+
+class PredictionCache:
+    """
+    LRU / TTL cache with request coalescing
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        max_size is the maximum number of entries, 0 disables caching.
+        ttl is the time to live of an entry in seconds
+        """
+        if max_size < 0:
+            raise ValueError('cache size must not be negative')
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._in_flight: Dict[Hashable, 'asyncio.Task[Any]'] = {}
+        # bumped on invalidation so that computations started against an old
+        # model are not stored
+        self._generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.coalesced: int = 0
+        self.evictions: int = 0
+        self.invalidations: int = 0
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        return the cached value for key, computing it if it is missing or
+        expired. if the same key is already being computed, wait for that
+        computation instead of starting another one
+        """
+        if self.max_size == 0:
+            return await compute()
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.coalesced += 1
+            # shield so that a cancelled waiter does not cancel the others
+            return await asyncio.shield(in_flight)
+
+        self.misses += 1
+        # the computation runs in its own task, so that the request that
+        # started it can go away without failing the ones waiting on it
+        task = asyncio.ensure_future(self._compute(key, compute, self._generation))
+        # mark the exception as retrieved when nobody is left waiting
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._in_flight[key] = task
+        return await asyncio.shield(task)
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        """
+        compute the value of key and store it, unless the cache was
+        invalidated in the meantime
+        """
+        try:
+            value = await compute()
+            if generation == self._generation:
+                self._store(key, value)
+            return value
+        finally:
+            if self._in_flight.get(key) is asyncio.current_task():
+                del self._in_flight[key]
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self) -> None:
+        """
+        drop every entry, e.g. after a model has been reloaded
+        """
+        self._entries.clear()
+        self._in_flight.clear()
+        self._generation += 1
+        self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """
+        cache counters
+        """
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+language prediction cascade
+
+the fast language model answers the queries it is confident about, the
+others are escalated to the albert model. the confidence threshold can be
+overridden per predicted language, and the number of queries answered by
+each tier is counted
+"""
+
+import numpy as np
+
+from typing import Any, Dict, List, Optional
+from src.metrics import LANGUAGE_TIER
+
+FAST_TIER: str = 'fast'
+ALBERT_TIER: str = 'albert'
+
+
+class LanguageCascade:
+    """
+    confidence thresholds of the fast tier and per-tier counts
+    """
+
+    def __init__(self, threshold: float, class_thresholds: Optional[Dict[str, float]] = None):
+        """
+        a query is answered by the fast tier if its best score is at least
+        the threshold of the best language, or the default threshold
+        """
+        self.threshold = threshold
+        self.class_thresholds = dict(class_thresholds or {})
+        self.counts: Dict[str, int] = {FAST_TIER: 0, ALBERT_TIER: 0}
+
+    def confident(self, classes: List[str], scores: np.ndarray) -> np.ndarray:
+        """
+        whether the fast tier's scores of every query pass the threshold of
+        their best language
+        """
+        scores = np.atleast_2d(scores)
+        best = np.argmax(scores, axis=1)
+        thresholds = np.array([self.class_thresholds.get(classes[i], self.threshold) for i in best],
+                              dtype=np.float32)
+        return scores[np.arange(len(scores)), best] >= thresholds
+
+    def record(self, fast: int, albert: int) -> None:
+        """
+        count queries answered by each tier
+        """
+        self.counts[FAST_TIER] += fast
+        self.counts[ALBERT_TIER] += albert
+        LANGUAGE_TIER.labels(FAST_TIER).inc(fast)
+        LANGUAGE_TIER.labels(ALBERT_TIER).inc(albert)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        thresholds and the share of queries answered by each tier
+        """
+        total = sum(self.counts.values())
+        return {
+            'threshold': self.threshold,
+            'class_thresholds': self.class_thresholds,
+            'queries': dict(self.counts),
+            'share': {tier: count / total if total > 0 else 0. for tier, count in self.counts.items()},
+        }
@@ -22,8 +22,8 @@ if __name__ == '__main__':
         pass
 #################################
 
-from os import getenv
-from typing import Optional
+from os import cpu_count, getenv
+from typing import Dict, List, Optional
 from utils.config import read_config as read_shared_config
 
 PORT: int = -1
@@ -32,6 +32,55 @@ DEFAULT_PORT: int = 8082
 VERSION: str = ''
 DEFAULT_VERSION: str = '0.0.1'
 ELASTICSEARCH_HOST: str = ''
+ELASTICSEARCH_MAX_CONNECTIONS: int = -1
+DEFAULT_ELASTICSEARCH_MAX_CONNECTIONS: int = 32
+ELASTICSEARCH_TIMEOUT: float = -1
+DEFAULT_ELASTICSEARCH_TIMEOUT: float = 2.
+
+WORKERS: int = -1
+DEFAULT_WORKERS: int = 1
+TF_INTRA_OP_THREADS: int = -1
+TF_INTER_OP_THREADS: int = -1
+
+INFERENCE_WORKERS: int = -1
+
+ADMISSION_MAX_IN_FLIGHT: int = -1
+DEFAULT_ADMISSION_MAX_IN_FLIGHT: int = 64
+ADMISSION_MAX_QUEUE: int = -1
+DEFAULT_ADMISSION_MAX_QUEUE: int = 32
+ADMISSION_MAX_WAIT_MS: float = -1
+DEFAULT_ADMISSION_MAX_WAIT_MS: float = 100.
+
+MODEL_WATCH_INTERVAL: float = -1
+DEFAULT_MODEL_WATCH_INTERVAL: float = 0.
+MODEL_DRAIN_TIMEOUT: float = -1
+DEFAULT_MODEL_DRAIN_TIMEOUT: float = 30.
+ADMIN_TOKEN: Optional[str] = None
+
+CACHE_MAX_SIZE: int = -1
+DEFAULT_CACHE_MAX_SIZE: int = 10000
+CACHE_TTL: float = -1
+DEFAULT_CACHE_TTL: float = 300.
+
+BATCH_MAX_SIZE: int = -1
+DEFAULT_BATCH_MAX_SIZE: int = 32
+BATCH_MAX_WAIT_MS: float = -1
+DEFAULT_BATCH_MAX_WAIT_MS: float = 5.
+# queries a single batch request may hold
+MAX_BATCH_QUERIES: int = -1
+DEFAULT_MAX_BATCH_QUERIES: int = 256
+QUANTIZED_MODEL: bool = False
+# sequence lengths batches are padded to, empty pads to the max sequence length
+PADDING_BUCKETS: List[int] = []
+
+# minimum fast model confidence to skip the albert model, none disables the cascade
+CASCADE_THRESHOLD: Optional[float] = None
+# per-language overrides of the cascade threshold
+CASCADE_CLASS_THRESHOLDS: Dict[str, float] = {}
+
+SLOW_REQUEST_MS: float = -1
+DEFAULT_SLOW_REQUEST_MS: float = 1000.
+SLOW_REQUEST_LOG: Optional[str] = None
 
 
 def read_config() -> None:
@@ -41,6 +90,29 @@ def read_config() -> None:
     global PORT
     global VERSION
     global ELASTICSEARCH_HOST
+    global ELASTICSEARCH_MAX_CONNECTIONS
+    global ELASTICSEARCH_TIMEOUT
+    global WORKERS
+    global TF_INTRA_OP_THREADS
+    global TF_INTER_OP_THREADS
+    global INFERENCE_WORKERS
+    global BATCH_MAX_SIZE
+    global CACHE_MAX_SIZE
+    global MODEL_WATCH_INTERVAL
+    global MODEL_DRAIN_TIMEOUT
+    global ADMIN_TOKEN
+    global ADMISSION_MAX_IN_FLIGHT
+    global ADMISSION_MAX_QUEUE
+    global ADMISSION_MAX_WAIT_MS
+    global CACHE_TTL
+    global BATCH_MAX_WAIT_MS
+    global MAX_BATCH_QUERIES
+    global PADDING_BUCKETS
+    global QUANTIZED_MODEL
+    global CASCADE_THRESHOLD
+    global CASCADE_CLASS_THRESHOLDS
+    global SLOW_REQUEST_MS
+    global SLOW_REQUEST_LOG
 
     read_shared_config()
     env_port: Optional[str] = getenv('NLP_PORT')
@@ -52,3 +124,84 @@ def read_config() -> None:
     if elasticsearch_host is None:
         raise ValueError('no elasticsearch host provided')
     ELASTICSEARCH_HOST = elasticsearch_host
+    env_elasticsearch_connections: Optional[str] = getenv(
+        'NLP_ELASTICSEARCH_MAX_CONNECTIONS')
+    ELASTICSEARCH_MAX_CONNECTIONS = DEFAULT_ELASTICSEARCH_MAX_CONNECTIONS \
+        if env_elasticsearch_connections is None else int(env_elasticsearch_connections)
+    env_elasticsearch_timeout: Optional[str] = getenv('NLP_ELASTICSEARCH_TIMEOUT')
+    ELASTICSEARCH_TIMEOUT = DEFAULT_ELASTICSEARCH_TIMEOUT \
+        if env_elasticsearch_timeout is None else float(env_elasticsearch_timeout)
+
+    env_workers: Optional[str] = getenv('NLP_WORKERS')
+    WORKERS = DEFAULT_WORKERS if env_workers is None else int(env_workers)
+    if WORKERS < 1:
+        raise ValueError('NLP_WORKERS must be at least 1')
+    # split the cores between the worker processes so they do not oversubscribe them
+    cores_per_worker = max((cpu_count() or 1) // WORKERS, 1)
+    # 0 keeps tensorflow's defaults, which use every core
+    env_intra_op_threads: Optional[str] = getenv('NLP_TF_INTRA_OP_THREADS')
+    TF_INTRA_OP_THREADS = (cores_per_worker if WORKERS > 1 else 0) \
+        if env_intra_op_threads is None else int(env_intra_op_threads)
+    env_inter_op_threads: Optional[str] = getenv('NLP_TF_INTER_OP_THREADS')
+    TF_INTER_OP_THREADS = (1 if WORKERS > 1 else 0) \
+        if env_inter_op_threads is None else int(env_inter_op_threads)
+
+    env_inference_workers: Optional[str] = getenv('NLP_INFERENCE_WORKERS')
+    INFERENCE_WORKERS = cores_per_worker if env_inference_workers is None \
+        else int(env_inference_workers)
+    if INFERENCE_WORKERS < 1:
+        raise ValueError('NLP_INFERENCE_WORKERS must be at least 1')
+
+    env_batch_max_size: Optional[str] = getenv('NLP_BATCH_MAX_SIZE')
+    BATCH_MAX_SIZE = DEFAULT_BATCH_MAX_SIZE if env_batch_max_size is None \
+        else int(env_batch_max_size)
+    env_batch_max_wait: Optional[str] = getenv('NLP_BATCH_MAX_WAIT_MS')
+    BATCH_MAX_WAIT_MS = DEFAULT_BATCH_MAX_WAIT_MS if env_batch_max_wait is None \
+        else float(env_batch_max_wait)
+    env_max_batch_queries: Optional[str] = getenv('NLP_MAX_BATCH_QUERIES')
+    MAX_BATCH_QUERIES = DEFAULT_MAX_BATCH_QUERIES if env_max_batch_queries is None \
+        else int(env_max_batch_queries)
+    # serve the quantized tflite model when training exported one
+    QUANTIZED_MODEL = getenv('NLP_QUANTIZED_MODEL') == 'true'
+    env_padding_buckets: Optional[str] = getenv('NLP_PADDING_BUCKETS')
+    PADDING_BUCKETS = [] if env_padding_buckets is None else \
+        sorted(int(bucket) for bucket in env_padding_buckets.split(',') if len(bucket.strip()) > 0)
+    env_cascade_threshold: Optional[str] = getenv('NLP_CASCADE_THRESHOLD')
+    CASCADE_THRESHOLD = None if env_cascade_threshold is None else float(env_cascade_threshold)
+    # e.g. java=0.9,python=0.8
+    env_cascade_class_thresholds: Optional[str] = getenv('NLP_CASCADE_CLASS_THRESHOLDS')
+    CASCADE_CLASS_THRESHOLDS = {} if env_cascade_class_thresholds is None else {
+        language.strip(): float(threshold) for language, threshold in
+        (pair.split('=') for pair in env_cascade_class_thresholds.split(',') if len(pair.strip()) > 0)
+    }
+
+    env_cache_max_size: Optional[str] = getenv('NLP_CACHE_MAX_SIZE')
+    CACHE_MAX_SIZE = DEFAULT_CACHE_MAX_SIZE if env_cache_max_size is None \
+        else int(env_cache_max_size)
+    env_cache_ttl: Optional[str] = getenv('NLP_CACHE_TTL')
+    CACHE_TTL = DEFAULT_CACHE_TTL if env_cache_ttl is None else float(env_cache_ttl)
+
+    env_admission_in_flight: Optional[str] = getenv('NLP_ADMISSION_MAX_IN_FLIGHT')
+    ADMISSION_MAX_IN_FLIGHT = DEFAULT_ADMISSION_MAX_IN_FLIGHT if env_admission_in_flight is None \
+        else int(env_admission_in_flight)
+    env_admission_queue: Optional[str] = getenv('NLP_ADMISSION_MAX_QUEUE')
+    ADMISSION_MAX_QUEUE = DEFAULT_ADMISSION_MAX_QUEUE if env_admission_queue is None \
+        else int(env_admission_queue)
+    env_admission_wait: Optional[str] = getenv('NLP_ADMISSION_MAX_WAIT_MS')
+    ADMISSION_MAX_WAIT_MS = DEFAULT_ADMISSION_MAX_WAIT_MS if env_admission_wait is None \
+        else float(env_admission_wait)
+
+    # 0 disables watching the model directories
+    env_model_watch_interval: Optional[str] = getenv('NLP_MODEL_WATCH_INTERVAL')
+    MODEL_WATCH_INTERVAL = DEFAULT_MODEL_WATCH_INTERVAL if env_model_watch_interval is None \
+        else float(env_model_watch_interval)
+    env_model_drain_timeout: Optional[str] = getenv('NLP_MODEL_DRAIN_TIMEOUT')
+    MODEL_DRAIN_TIMEOUT = DEFAULT_MODEL_DRAIN_TIMEOUT if env_model_drain_timeout is None \
+        else float(env_model_drain_timeout)
+    ADMIN_TOKEN = getenv('NLP_ADMIN_TOKEN')
+
+    # 0 disables the slow request log
+    env_slow_request: Optional[str] = getenv('NLP_SLOW_REQUEST_MS')
+    SLOW_REQUEST_MS = DEFAULT_SLOW_REQUEST_MS if env_slow_request is None \
+        else float(env_slow_request)
+    SLOW_REQUEST_LOG = getenv('NLP_SLOW_REQUEST_LOG')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+elasticsearch client
+
+non-blocking elasticsearch requests over a shared keep-alive connection
+pool, with per-request timeouts and bounded concurrency
+"""
+
+import json
+import asyncio
+
+from typing import Any, Dict, List, Optional
+from aiohttp import ClientError, ClientSession, ClientTimeout, TCPConnector
+from src.metrics import observe_phase, ELASTICSEARCH_PHASE
+
+_host: str = ''
+_session: Optional[ClientSession] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_timeout: Optional[ClientTimeout] = None
+
+
+async def initialize_elasticsearch(host: str, max_connections: int, timeout: float) -> None:
+    """
+    create the shared client session. must be called from the event loop
+    that serves requests, e.g. in an aiohttp startup hook
+    """
+    global _host
+    global _session
+    global _semaphore
+    global _timeout
+    if _session is not None:
+        raise RuntimeError('elasticsearch client already initialized')
+    _host = host.rstrip('/')
+    _timeout = ClientTimeout(total=timeout)
+    # the connector keeps connections alive and reuses them between requests
+    _session = ClientSession(
+        connector=TCPConnector(limit=max_connections),
+        timeout=_timeout,
+        json_serialize=json.dumps)
+    # requests beyond the pool size wait here instead of inside the connector,
+    # so that waiting does not count against their timeout
+    _semaphore = asyncio.Semaphore(max_connections)
+
+
+async def close_elasticsearch() -> None:
+    """
+    close the shared client session
+    """
+    global _session
+    if _session is None:
+        return
+    await _session.close()
+    _session = None
+
+
+async def _request(path: str, data: str, content_type: str) -> Any:
+    """
+    send a request to elasticsearch and return its json body. error statuses
+    raise aiohttp.ClientResponseError, so that they are handled like
+    connection errors and never returned or cached as results
+    """
+    if _session is None or _semaphore is None:
+        raise RuntimeError('elasticsearch client not initialized')
+    headers = {
+        'Content-Type': content_type
+    }
+    async with _semaphore:
+        with observe_phase(ELASTICSEARCH_PHASE):
+            async with _session.get(f'{_host}/{path}', data=data, headers=headers,
+                                    timeout=_timeout) as resp:
+                resp.raise_for_status()
+                return json.loads(await resp.text())
+
+
+async def search(index: str, query: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    run a single search against the given index.
+    raises asyncio.TimeoutError when elasticsearch does not answer in time,
+    and aiohttp.ClientError when it fails
+    """
+    return await _request(f'{index}/_search', json.dumps(query), 'application/json')
+
+
+async def multi_search(index: str, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    run several searches against the given index in one round-trip,
+    returning one response per query in order
+    """
+    # a header line and a query line per search
+    lines: List[str] = []
+    for query in queries:
+        lines.append(json.dumps({}))
+        lines.append(json.dumps(query))
+    body = '\n'.join(lines) + '\n'
+    res = await _request(f'{index}/_msearch', body, 'application/x-ndjson')
+    # every search of a multi search fails on its own, with a 200 status overall
+    errors = [response['error'] for response in res['responses'] if 'error' in response]
+    if len(errors) > 0:
+        raise ClientError(f'{len(errors)} of {len(queries)} searches failed: {errors[0]}')
+    return res['responses']
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+fixture models
+
+small stand-ins for the language prediction and related library models
+with the same interface as the real ones. they are cheap to build, need no
+trained model files, and simulate inference time, so that the server can
+be load tested on any machine
+"""
+
+import time
+import zlib
+import numpy as np
+import networkx as nx
+
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from src.initialize_models import TOKENIZER_MODEL, LANGUAGE_PREDICTION_MODEL, RLP_MODEL
+from language_prediction.tokenizer import bucket_length
+from utils.types import LanguageType
+
+
+def _hash(value: str, buckets: int) -> int:
+    """
+    stable hash of a string, unlike hash() it does not change between processes
+    """
+    return zlib.crc32(value.encode('utf-8')) % buckets
+
+
+class FixtureTokenizer:
+    """
+    hashes whitespace separated words into a fixed vocabulary
+    """
+
+    def __init__(self, classes: List[str], max_sequence_length: int, vocab_size: int):
+        self.classes = classes
+        self.max_sequence_length = max_sequence_length
+        self.vocab_size = vocab_size
+
+    def tokenize(self, sentences: List[str], buckets: Optional[List[int]] = None
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        tokenize inputs, in the layout of the real tokenizer
+        """
+        words_per_sentence = [sentence.split()[:self.max_sequence_length] for sentence in sentences]
+        sequence_length = self.max_sequence_length
+        if buckets is not None and len(sentences) > 0:
+            sequence_length = bucket_length(
+                max(len(words) for words in words_per_sentence), buckets, self.max_sequence_length)
+        input_ids = np.zeros((len(sentences), sequence_length), dtype=np.int32)
+        input_masks = np.zeros_like(input_ids)
+        for i, words in enumerate(words_per_sentence):
+            # 0 is reserved for padding
+            input_ids[i, :len(words)] = [1 + _hash(word, self.vocab_size - 1) for word in words]
+            input_masks[i, :len(words)] = 1
+        return input_ids, input_masks, np.zeros_like(input_ids)
+
+
+class FixtureLanguageModel:
+    """
+    averaged random embeddings followed by a linear layer and a softmax
+    """
+
+    # any padded length is accepted, like a serving signature with an open sequence length
+    variable_length: bool = True
+
+    def __init__(self, num_classes: int, vocab_size: int, embedding_size: int, max_sequence_length: int,
+                 latency_ms: float, latency_per_example_ms: float, seed: int):
+        """
+        every call sleeps latency_ms plus latency_per_example_ms for every
+        example in the batch padded to max_sequence_length (less for shorter
+        padding), releasing the gil like tensorflow does
+        """
+        rng = np.random.RandomState(seed)
+        self.embeddings = rng.normal(size=(vocab_size, embedding_size)).astype(np.float32)
+        self.weights = rng.normal(size=(embedding_size, num_classes)).astype(np.float32)
+        self.latency = latency_ms / 1000.
+        self.latency_per_example = latency_per_example_ms / 1000.
+        self.max_sequence_length = max_sequence_length
+
+    def __call__(self, inputs: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> np.ndarray:
+        input_ids, input_masks, _ = inputs
+        masks = input_masks[..., np.newaxis].astype(np.float32)
+        pooled = (self.embeddings[input_ids] * masks).sum(axis=1) / np.maximum(masks.sum(axis=1), 1.)
+        logits = pooled @ self.weights
+        scores = np.exp(logits - logits.max(axis=1, keepdims=True))
+        padding_share = input_ids.shape[1] / self.max_sequence_length
+        time.sleep(self.latency + self.latency_per_example * len(input_ids) * padding_share)
+        return scores / scores.sum(axis=1, keepdims=True)
+
+
+class FixtureRLPModel:
+    """
+    random weighted graph of made-up libraries, queried like the real
+    related library graph
+    """
+
+    def __init__(self, num_libraries: int, edges_per_library: int, seed: int):
+        rng = np.random.RandomState(seed)
+        self.vocabulary_list = [f'org.fixture.library{i}' for i in range(num_libraries)]
+        self.graph_representation = nx.Graph()
+        self.graph_representation.add_nodes_from(range(num_libraries))
+        for library in range(num_libraries):
+            for neighbor in rng.randint(0, num_libraries, size=edges_per_library):
+                self.graph_representation.add_edge(
+                    library, int(neighbor), weight=int(rng.randint(1, 1000)))
+
+    def _index(self, base_library: Union[str, int]) -> int:
+        try:
+            return int(base_library)
+        except ValueError:
+            return _hash(str(base_library), len(self.vocabulary_list))
+
+    def _get_n_nearest_indices(self, import_index: int, n: int) -> List[str]:
+        edges = sorted(self.graph_representation.edges(import_index, data=True),
+                       key=lambda i: i[2]['weight'], reverse=True)[:n]
+        return [self.vocabulary_list[e[1]] for e in edges]
+
+    def __call__(self, query: str, num_returns: int) -> List[str]:
+        return self._get_n_nearest_indices(self._index(query), num_returns)
+
+    def get_n_nearest_libraries_batch(self, base_libraries: List[Union[str, int]], n: int) -> List[List[str]]:
+        """
+        n nearest libraries of every library in the input
+        """
+        return [self._get_n_nearest_indices(self._index(library), n) for library in base_libraries]
+
+
+def fixture_model_loaders(max_sequence_length: int = 64, latency_ms: float = 0.,
+                          latency_per_example_ms: float = 0., seed: int = 0
+                          ) -> Dict[str, Callable[[], object]]:
+    """
+    loaders of the fixture models, keyed by the names the server uses for the real models
+    """
+    classes = sorted(LanguageType.get_values())
+    vocab_size = 30000
+    return {
+        TOKENIZER_MODEL: lambda: FixtureTokenizer(classes, max_sequence_length, vocab_size),
+        LANGUAGE_PREDICTION_MODEL: lambda: FixtureLanguageModel(
+            len(classes), vocab_size, 128, max_sequence_length, latency_ms, latency_per_example_ms, seed),
+        RLP_MODEL: lambda: FixtureRLPModel(5000, 20, seed),
+    }
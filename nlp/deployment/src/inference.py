@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+inference executor
+
+runs blocking model calls (tokenization, tensorflow forward passes, graph
+lookups) on a dedicated, sized thread pool so that the aiohttp event loop
+stays responsive while inference is running
+"""
+
+import asyncio
+import threading
+import contextvars
+
+from typing import Any, Callable, Dict, Optional, TypeVar
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+T = TypeVar('T')
+
+_executor: Optional[ThreadPoolExecutor] = None
+_num_workers: int = 0
+
+# number of inference calls submitted but not yet finished.
+# anything above the number of workers is waiting in the queue
+_pending: int = 0
+_pending_lock = threading.Lock()
+
+
+def initialize_inference_executor(num_workers: int) -> None:
+    """
+    create the inference thread pool. tensorflow releases the GIL during
+    op execution, so threads let concurrent requests overlap while sharing
+    a single copy of the model weights
+    """
+    global _executor
+    global _num_workers
+    if _executor is not None:
+        raise RuntimeError('inference executor already initialized')
+    _executor = ThreadPoolExecutor(
+        max_workers=num_workers, thread_name_prefix='inference')
+    _num_workers = num_workers
+    logger.info(f'inference executor started with {num_workers} workers')
+
+
+def shutdown_inference_executor() -> None:
+    """
+    wait for running inference calls and stop the thread pool
+    """
+    global _executor
+    if _executor is None:
+        return
+    _executor.shutdown(wait=True)
+    _executor = None
+
+
+def _decrement_pending(_future: Any) -> None:
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+async def run_inference(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    run the given blocking model call on the inference executor, in a copy
+    of the caller's context so that its phases land in the request's trace
+    """
+    global _pending
+    if _executor is None:
+        raise RuntimeError('inference executor not initialized')
+    with _pending_lock:
+        _pending += 1
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(_executor, partial(context.run, func, *args, **kwargs))
+    future.add_done_callback(_decrement_pending)
+    return await future
+
+
+def inference_stats() -> Dict[str, int]:
+    """
+    current state of the inference executor
+    """
+    with _pending_lock:
+        pending = _pending
+    return {
+        'workers': _num_workers,
+        'in_flight': min(pending, _num_workers),
+        'queue_depth': max(pending - _num_workers, 0),
+    }
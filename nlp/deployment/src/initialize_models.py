@@ -14,28 +14,127 @@ if __name__ == "__main__":
     except ValueError:  # Already removed
         pass
 #################################
+import os
 import sys
+import yaml
 import tensorflow as tf
+from typing import Any, Callable, Dict, List
+from functools import partial
 from loguru import logger
-from language_prediction.language_prediction_model import LanguagePredictionModel
+from language_prediction.tokenizer import LanguagePredictionTokenizer
+from language_prediction.quantization import TFLiteLanguageModel
+from language_prediction.fast_language_model import FastLanguageModel
 from related_library_prediction.related_library_prediction_model import RLP_Model
 from utils.utils import reScribeModel
+from src.serving_model import ServingModel
 
-tokenizer: reScribeModel = None
-language_prediction_model: reScribeModel = None
-rlp_model: reScribeModel = None
-
-def main(args, classes, lpm_path, rlp_path):
-    global tokenizer, language_prediction_model, rlp_model
-    
-    tokenizer = LanguagePredictionModel(
-                                    max_sequence_length=args.max_sequence_length,
-                                    classes=classes
-                                )
-    language_prediction_model = tf.keras.models.load_model(lpm_path)
-    logger.success("language_prediction model loaded")
+TOKENIZER_MODEL: str = 'tokenizer'
+LANGUAGE_PREDICTION_MODEL: str = 'language_prediction_model'
+RLP_MODEL: str = 'rlp_model'
+FAST_LANGUAGE_MODEL: str = 'fast_language_model'
+
+def _warm_up_batch_sizes() -> List[int]:
+    """
+    batch sizes to warm the serving signature up with: powers of two up to the max batch size
+    """
+    from src.config import BATCH_MAX_SIZE
+    batch_sizes = []
+    batch_size = 1
+    while batch_size < BATCH_MAX_SIZE:
+        batch_sizes.append(batch_size)
+        batch_size *= 2
+    batch_sizes.append(BATCH_MAX_SIZE)
+    return batch_sizes
+
+def load_tokenizer(args, classes_path, lpm_tokenizer_path) -> LanguagePredictionTokenizer:
+    """
+    load the language prediction tokenizer saved by training, with the
+    classes of the language prediction model
+    """
+    with open(classes_path) as stream:
+        classes = yaml.safe_load(stream)
+    if os.path.exists(lpm_tokenizer_path):
+        tokenizer = LanguagePredictionTokenizer.load(lpm_tokenizer_path)
+        if tokenizer.classes != classes:
+            raise ValueError(f'tokenizer has classes {tokenizer.classes}, expected {classes}')
+        if tokenizer.max_sequence_length != args.max_sequence_length:
+            raise ValueError(f'tokenizer has sequence length {tokenizer.max_sequence_length}, '
+                             f'expected {args.max_sequence_length}')
+    else:
+        # models trained before the tokenizer was saved, the vocabulary is downloaded
+        logger.warning(f"no tokenizer found at {lpm_tokenizer_path}, loading the pretrained tokenizer")
+        tokenizer = LanguagePredictionTokenizer(args.max_sequence_length, classes)
+    logger.success("language_prediction tokenizer loaded")
+    return tokenizer
+
+def load_language_prediction_model(args, lpm_path, lpm_serving_path, lpm_tflite_path) -> Any:
+    """
+    load the language prediction model: the quantized model if enabled, else
+    the exported serving signature, else the keras checkpoint
+    """
+    from src.config import QUANTIZED_MODEL, INFERENCE_WORKERS
+    if QUANTIZED_MODEL and os.path.exists(lpm_tflite_path):
+        # one interpreter per inference thread, so that none of them waits for another
+        language_prediction_model = TFLiteLanguageModel(lpm_tflite_path, INFERENCE_WORKERS)
+        if language_prediction_model.sequence_length != args.max_sequence_length:
+            raise ValueError(f'quantized model has sequence length {language_prediction_model.sequence_length}, '
+                             f'expected {args.max_sequence_length}')
+        language_prediction_model.warm_up(_warm_up_batch_sizes())
+        logger.success("language_prediction quantized model loaded")
+    elif os.path.exists(lpm_serving_path):
+        if QUANTIZED_MODEL:
+            logger.warning(f"no quantized model found at {lpm_tflite_path}, loading the float model")
+        language_prediction_model = ServingModel(lpm_serving_path)
+        from src.config import PADDING_BUCKETS
+        language_prediction_model.warm_up(args.max_sequence_length, _warm_up_batch_sizes(), PADDING_BUCKETS)
+        if len(PADDING_BUCKETS) > 0 and not language_prediction_model.variable_length:
+            logger.warning('the serving signature has a fixed sequence length, padding buckets are ignored')
+        logger.success("language_prediction serving signature loaded")
+    else:
+        # models trained before the serving signature was exported
+        logger.warning(f"no serving signature found at {lpm_serving_path}, loading keras checkpoint")
+        language_prediction_model = tf.keras.models.load_model(lpm_path)
+        logger.success("language_prediction model loaded")
+    return language_prediction_model
+
+def load_fast_language_model(classes_path, fast_lpm_path) -> FastLanguageModel:
+    """
+    load the fast language model of the cascade, trained on the same classes
+    as the language prediction model
+    """
+    with open(classes_path) as stream:
+        classes = yaml.safe_load(stream)
+    fast_language_model = FastLanguageModel.load(fast_lpm_path)
+    if fast_language_model.classes != classes:
+        raise ValueError(f'fast language model has classes {fast_language_model.classes}, expected {classes}')
+    # the first call initializes sklearn's lazy state
+    fast_language_model.predict_scores([''])
+    logger.success("fast language model loaded")
+    return fast_language_model
+
+def load_rlp_model(rlp_path, rlp_graph_and_vocabulary=None) -> reScribeModel:
+    """
+    load the related library prediction model, reusing the graph and
+    vocabulary if they were already loaded
+    """
     rlp_model = RLP_Model()
-    rlp_model.load_pretrained(rlp_path)
-    logger.success("related_library model loaded")            
-    
-    
\ No newline at end of file
+    rlp_model.load_pretrained(rlp_path, rlp_graph_and_vocabulary)
+    logger.success("related_library model loaded")
+    return rlp_model
+
+def main(args, classes_path, lpm_tokenizer_path, lpm_path, lpm_serving_path, lpm_tflite_path, fast_lpm_path, rlp_path,
+         rlp_graph_and_vocabulary=None) -> Dict[str, Callable[[], Any]]:
+    """
+    return a loader for every model, keyed by model name.
+    the loaders are independent of each other, so they can run concurrently.
+    the fast language model is only loaded when the cascade is enabled
+    """
+    from src.config import CASCADE_THRESHOLD
+    loaders = {
+        TOKENIZER_MODEL: partial(load_tokenizer, args, classes_path, lpm_tokenizer_path),
+        LANGUAGE_PREDICTION_MODEL: partial(load_language_prediction_model, args, lpm_path, lpm_serving_path, lpm_tflite_path),
+        RLP_MODEL: partial(load_rlp_model, rlp_path, rlp_graph_and_vocabulary),
+    }
+    if CASCADE_THRESHOLD is not None:
+        loaders[FAST_LANGUAGE_MODEL] = partial(load_fast_language_model, classes_path, fast_lpm_path)
+    return loaders
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""
+load test
+
+starts the server locally with fixture models and a stub elasticsearch
+(or targets a running server), drives a mix of prediction routes at a
+fixed concurrency or request rate with queries replayed from a file, and
+reports throughput and latency percentiles per route as json
+"""
+
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("deployment")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientError
+from loguru import logger
+
+# routes that can be part of the traffic mix
+ROUTES: List[str] = [
+    'predictLanguage',
+    'predictLibrary',
+    'predictRelatedLibrary',
+    'predict',
+]
+DEFAULT_MIX: List[str] = [
+    'predictLanguage=6',
+    'predictLibrary=2',
+    'predictRelatedLibrary=2',
+]
+DEFAULT_QUERIES_FILE: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'load_test_queries.txt')
+
+# seconds to wait for the local server to load its models
+STARTUP_TIMEOUT: float = 300.
+# lines of the local server's log shown when it fails to start
+STARTUP_LOG_LINES: int = 50
+
+
+def _run_server(port: int, elasticsearch_port: int, workers: int, latency_ms: float,
+                latency_per_example_ms: float, log_path: str) -> None:
+    """
+    run the server with fixture models, in a child process. its stderr goes
+    to the log file, so that it can be shown if the server fails to start
+    """
+    with open(log_path, 'a') as log_file:
+        os.dup2(log_file.fileno(), 2)
+    os.environ['NLP_PORT'] = str(port)
+    os.environ['ELASTICSEARCH_HOST'] = f'http://127.0.0.1:{elasticsearch_port}'
+    os.environ['NLP_WORKERS'] = str(workers)
+    from src.config import read_config
+    from src.server import start_server
+    from src.fixture_models import fixture_model_loaders
+    read_config()
+    loaders = fixture_model_loaders(latency_ms=latency_ms, latency_per_example_ms=latency_per_example_ms)
+    start_server(loaders, loaders, [])
+
+
+def _run_stub_elasticsearch(port: int, latency_ms: float) -> None:
+    from src.stub_elasticsearch import run_stub_elasticsearch
+    run_stub_elasticsearch(port, latency_ms)
+
+
+def _check_running(processes: List[multiprocessing.Process], server_log: str) -> None:
+    """
+    fail when a local process exited, with its exit code and the end of the
+    server's log
+    """
+    for process in processes:
+        if process.exitcode is not None:
+            with open(server_log, errors='replace') as log_file:
+                log = ''.join(log_file.readlines()[-STARTUP_LOG_LINES:])
+            raise RuntimeError(f'{process.name} exited with code {process.exitcode} before the server was ready. '
+                               f'server log ({server_log}):\n{log}')
+
+
+async def _wait_until_ready(url: str, timeout: float, check: Callable[[], None] = lambda: None) -> None:
+    """
+    poll the ready endpoint until all models are loaded. check is called
+    before every poll, and fails the wait by raising
+    """
+    deadline = time.monotonic() + timeout
+    async with ClientSession() as session:
+        while True:
+            check()
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except ClientError:
+                pass
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'{url} not ready after {timeout}s')
+            await asyncio.sleep(.5)
+
+
+def _parse_mix(mix: List[str]) -> Tuple[List[str], List[float]]:
+    """
+    parse route=weight pairs
+    """
+    routes: List[str] = []
+    weights: List[float] = []
+    for elem in mix:
+        route, _, weight = elem.partition('=')
+        route = route.lstrip('/')
+        if route not in ROUTES:
+            raise ValueError(f'unknown route {route}, expected one of {ROUTES}')
+        routes.append(route)
+        weights.append(float(weight) if len(weight) > 0 else 1.)
+    if sum(weights) <= 0:
+        raise ValueError('route weights must add up to more than 0')
+    return routes, weights
+
+
+def _read_queries(path: str) -> List[str]:
+    with open(path, 'r') as queries_file:
+        queries = [line.strip() for line in queries_file]
+    queries = [query for query in queries if len(query) > 0]
+    if len(queries) == 0:
+        raise ValueError(f'no queries found in {path}')
+    return queries
+
+
+class RouteStats:
+    """
+    results of the measured requests of a single route
+    """
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.status_codes: Dict[str, int] = {}
+        self.errors: int = 0
+
+    def record(self, status: Optional[int], latency: float) -> None:
+        """
+        record a response, or a failed request when status is None
+        """
+        if status is None:
+            self.errors += 1
+            return
+        self.status_codes[str(status)] = self.status_codes.get(str(status), 0) + 1
+        if 200 <= status < 300:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+
+    def merge(self, other: 'RouteStats') -> None:
+        """
+        add the results of another route
+        """
+        self.latencies.extend(other.latencies)
+        self.errors += other.errors
+        for status, count in other.status_codes.items():
+            self.status_codes[status] = self.status_codes.get(status, 0) + count
+
+    def report(self, duration: float) -> Dict[str, Any]:
+        """
+        throughput and latency percentiles, latencies of successful requests only
+        """
+        latencies = np.asarray(self.latencies) * 1000.
+        has_latencies = len(latencies) > 0
+        return {
+            'requests': len(self.latencies) + self.errors,
+            'ok': len(self.latencies),
+            'errors': self.errors,
+            'status_codes': self.status_codes,
+            'throughput_rps': len(self.latencies) / duration,
+            'mean_ms': float(latencies.mean()) if has_latencies else None,
+            'p50_ms': float(np.percentile(latencies, 50)) if has_latencies else None,
+            'p95_ms': float(np.percentile(latencies, 95)) if has_latencies else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if has_latencies else None,
+            'max_ms': float(latencies.max()) if has_latencies else None,
+        }
+
+
+class LoadGenerator:
+    """
+    sends the requests of a load test and collects their results
+    """
+
+    def __init__(self, base_url: str, routes: List[str], weights: List[float],
+                 queries: List[str], measure_from: float, measure_until: float, seed: int):
+        """
+        requests sent between the measure_from and measure_until time.monotonic()
+        timestamps are recorded, the ones before are warm up
+        """
+        self.base_url = base_url.rstrip('/')
+        self.routes = routes
+        self.weights = weights
+        self.queries = queries
+        self.measure_from = measure_from
+        self.measure_until = measure_until
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, RouteStats] = {route: RouteStats() for route in routes}
+
+    def next_request(self) -> Tuple[str, Dict[str, Any]]:
+        """
+        route and body of the next request
+        """
+        route = self.rng.choices(self.routes, weights=self.weights)[0]
+        return route, {'query': self.rng.choice(self.queries)}
+
+    async def send(self, session: ClientSession, route: str, body: Dict[str, Any]) -> None:
+        """
+        send a request and record its result if it was sent in the measured window
+        """
+        start = time.monotonic()
+        status: Optional[int] = None
+        try:
+            async with session.put(f'{self.base_url}/{route}', json=body) as resp:
+                await resp.read()
+                status = resp.status
+        except (ClientError, asyncio.TimeoutError):
+            pass
+        if self.measure_from <= start < self.measure_until:
+            self.stats[route].record(status, time.monotonic() - start)
+
+    async def run_closed_loop(self, session: ClientSession, concurrency: int) -> None:
+        """
+        concurrency clients, each sending its next request once the previous one finished
+        """
+        async def client() -> None:
+            while time.monotonic() < self.measure_until:
+                await self.send(session, *self.next_request())
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+
+    async def run_open_loop(self, session: ClientSession, qps: float) -> None:
+        """
+        send requests at a fixed rate, whether or not earlier ones finished
+        """
+        pending: List['asyncio.Future[None]'] = []
+        next_send = time.monotonic()
+        while next_send < self.measure_until:
+            delay = next_send - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            pending.append(asyncio.ensure_future(self.send(session, *self.next_request())))
+            next_send += 1. / qps
+        await asyncio.gather(*pending)
+
+
+async def _fetch_stats(base_url: str) -> Optional[Dict[str, Any]]:
+    try:
+        async with ClientSession() as session:
+            async with session.get(f'{base_url.rstrip("/")}/stats') as resp:
+                return json.loads(await resp.text())
+    except (ClientError, ValueError):
+        return None
+
+
+async def run_load_test(args: argparse.Namespace, base_url: str) -> Dict[str, Any]:
+    """
+    run the load test against the given server and build the report
+    """
+    routes, weights = _parse_mix(args.mix)
+    queries = _read_queries(args.queries)
+    start = time.monotonic()
+    generator = LoadGenerator(base_url, routes, weights, queries,
+                              start + args.warmup, start + args.warmup + args.duration, args.seed)
+    # open loop sends must not queue for a connection on the client side
+    connector = TCPConnector(limit=0 if args.qps is not None else args.concurrency)
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=args.timeout)) as session:
+        if args.qps is not None:
+            logger.info(f'sending {args.qps} requests per second for {args.warmup + args.duration}s')
+            await generator.run_open_loop(session, args.qps)
+        else:
+            logger.info(f'sending requests from {args.concurrency} clients for {args.warmup + args.duration}s')
+            await generator.run_closed_loop(session, args.concurrency)
+
+    total = RouteStats()
+    for route_stats in generator.stats.values():
+        total.merge(route_stats)
+    return {
+        'config': {
+            'url': base_url,
+            'mix': dict(zip(routes, weights)),
+            'concurrency': args.concurrency if args.qps is None else None,
+            'qps': args.qps,
+            'duration_s': args.duration,
+            'warmup_s': args.warmup,
+            'queries': len(queries),
+            'local_server': args.url is None,
+            'workers': args.workers if args.url is None else None,
+        },
+        'routes': {route: route_stats.report(args.duration)
+                   for route, route_stats in generator.stats.items()},
+        'total': total.report(args.duration),
+        'server_stats': await _fetch_stats(base_url),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--url', type=str, default=None,
+                        help='server to test, a local server with fixture models is started if not set')
+    parser.add_argument('--port', type=int, default=8190)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--elasticsearch-port', type=int, default=9290)
+    parser.add_argument('--elasticsearch-latency-ms', type=float, default=2.)
+    parser.add_argument('--model-latency-ms', type=float, default=5.)
+    parser.add_argument('--model-latency-per-example-ms', type=float, default=.5)
+    parser.add_argument('--mix', type=str, nargs='+', default=DEFAULT_MIX,
+                        help=f'route=weight pairs, routes: {ROUTES}')
+    parser.add_argument('--queries', type=str, default=DEFAULT_QUERIES_FILE,
+                        help='file with one query per line')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--qps', type=float, default=None,
+                        help='send requests at this rate instead of from a fixed number of clients')
+    parser.add_argument('--duration', type=float, default=30.)
+    parser.add_argument('--warmup', type=float, default=5.)
+    parser.add_argument('--timeout', type=float, default=10.)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='write the report to this file')
+    args = parser.parse_args()
+
+    processes: List[multiprocessing.Process] = []
+    base_url = args.url
+    server_log = None
+    if base_url is None:
+        # separate processes, so that the load generator does not compete with
+        # the server for the event loop. spawned, since tensorflow does not survive a fork
+        context = multiprocessing.get_context('spawn')
+        log_fd, server_log = tempfile.mkstemp(prefix='nlp-load-test-', suffix='.log')
+        os.close(log_fd)
+        logger.info(f'local server log: {server_log}')
+        processes.append(context.Process(name='stub elasticsearch', target=_run_stub_elasticsearch, args=(
+            args.elasticsearch_port, args.elasticsearch_latency_ms), daemon=True))
+        processes.append(context.Process(name='nlp server', target=_run_server, args=(
+            args.port, args.elasticsearch_port, args.workers, args.model_latency_ms,
+            args.model_latency_per_example_ms, server_log)))
+        for process in processes:
+            process.start()
+        base_url = f'http://127.0.0.1:{args.port}'
+
+    try:
+        if args.url is None:
+            logger.info('waiting for the local server')
+            asyncio.get_event_loop().run_until_complete(
+                _wait_until_ready(f'{base_url}/ready', STARTUP_TIMEOUT,
+                                  lambda: _check_running(processes, server_log)))
+        report = asyncio.get_event_loop().run_until_complete(run_load_test(args, base_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,14 +26,16 @@ if __name__ == "__main__":
 
 
 import os
-import yaml
 import argparse
 from src.config import read_config
 from src.server import start_server
 from utils.types import NLPType
 from utils.utils import get_file_path_relative
 from src.initialize_models import main as initialize_models
-from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, related_library_prediction_data_folder, clean_data_file_name, checkpoint_file, classes_file
+from related_library_prediction.related_library_prediction_model import RLP_Model
+from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, related_library_prediction_data_folder, clean_data_file_name, checkpoint_file, classes_file, \
+    language_prediction_checkpoints_folder, language_prediction_serving_folder, language_prediction_tflite_file, \
+    language_prediction_fast_model_file, language_prediction_tokenizer_folder
 
 def main():
     
@@ -44,15 +46,27 @@ def main():
     args = parser.parse_args()
     
     clean_folder = get_file_path_relative(os.path.join(data_folder, clean_data_folder, language_prediction_data_folder))
-    classes = []
-    with open(os.path.join(clean_folder, classes_file)) as stream:
-        classes = yaml.safe_load(stream)
+    classes_path = os.path.join(clean_folder, classes_file)
     
-    lpm_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, 'language_prediction_model_checkpoints'))
+    lpm_tokenizer_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_tokenizer_folder))
+    lpm_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_checkpoints_folder))
+    lpm_serving_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_serving_folder))
+    lpm_tflite_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_tflite_file))
+    fast_lpm_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_fast_model_file))
     rlp_path = get_file_path_relative(os.path.join(data_folder, models_folder, related_library_prediction_data_folder))
     read_config()
-    initialize_models(args, classes, lpm_path, rlp_path)
-    start_server()
+    # the server binds right away and loads the models in the background
+    model_loaders = initialize_models(args, classes_path, lpm_tokenizer_path, lpm_path, lpm_serving_path, lpm_tflite_path, fast_lpm_path, rlp_path)
+    # reloads read everything from disk again, including the shared structures
+    reload_loaders = initialize_models(args, classes_path, lpm_tokenizer_path, lpm_path, lpm_serving_path, lpm_tflite_path, fast_lpm_path, rlp_path)
+
+    def preload():
+        # with several workers, the large read-only structures are loaded once,
+        # before forking, so that the workers share them through copy-on-write
+        rlp_graph_and_vocabulary = RLP_Model.load_graph_and_vocabulary(rlp_path)
+        return initialize_models(args, classes_path, lpm_tokenizer_path, lpm_path, lpm_serving_path, lpm_tflite_path, fast_lpm_path, rlp_path, rlp_graph_and_vocabulary)
+    start_server(model_loaders, reload_loaders, [classes_path, lpm_tokenizer_path, lpm_path, lpm_serving_path, lpm_tflite_path, fast_lpm_path, rlp_path],
+                 preload=preload)
     
 if __name__ == '__main__':
     main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+prometheus metrics
+
+per-route request counts and latencies, time spent in each phase of a
+prediction, and the current in-flight request count. process metrics
+(including resident memory) come from the default prometheus registry
+"""
+
+import time
+
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from src.tracing import record_phase
+
+TOKENIZE_PHASE: str = 'tokenize'
+INFERENCE_PHASE: str = 'inference'
+FAST_INFERENCE_PHASE: str = 'fast_inference'
+ELASTICSEARCH_PHASE: str = 'elasticsearch'
+RLP_PHASE: str = 'rlp'
+SERIALIZE_PHASE: str = 'serialize'
+
+_latency_buckets = (.001, .0025, .005, .01, .025, .05, .075, .1, .25, .5, .75,
+                    1., 2.5, 5., 10.)
+
+REQUESTS = Counter('nlp_requests_total', 'Requests handled',
+                   ['route', 'method', 'status'])
+REQUEST_LATENCY = Histogram('nlp_request_duration_seconds', 'Request latency',
+                            ['route'], buckets=_latency_buckets)
+PHASE_LATENCY = Histogram('nlp_phase_duration_seconds',
+                          'Time spent in each phase of a prediction',
+                          ['phase'], buckets=_latency_buckets)
+IN_FLIGHT = Gauge('nlp_requests_in_flight', 'Requests currently being handled')
+INFERENCE_QUEUE_DEPTH = Gauge('nlp_inference_queue_depth',
+                              'Model calls waiting for an inference worker')
+LANGUAGE_TIER = Counter('nlp_language_predictions_total',
+                        'Language predictions answered by each tier of the cascade', ['tier'])
+
+
+@contextmanager
+def observe_phase(phase: str) -> Iterator[None]:
+    """
+    record the time spent in the enclosed block under the given phase, in
+    the phase metrics and in the trace of the current request
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        PHASE_LATENCY.labels(phase).observe(duration)
+        record_phase(phase, duration)
+
+
+def _route_name(request: web.Request) -> str:
+    # use the route template rather than the path to bound label cardinality
+    route = request.match_info.route
+    if route.resource is None:
+        return 'unmatched'
+    return route.resource.canonical
+
+
+@web.middleware
+async def metrics_middleware(request: web.Request,
+                             handler: Callable[[web.Request], Awaitable[web.StreamResponse]]
+                             ) -> web.StreamResponse:
+    """
+    count requests and measure their latency per route
+    """
+    route = _route_name(request)
+    status = 500
+    start = time.perf_counter()
+    IN_FLIGHT.inc()
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as err:
+        status = err.status
+        raise
+    finally:
+        IN_FLIGHT.dec()
+        REQUEST_LATENCY.labels(route).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, request.method, str(status)).inc()
+
+
+async def metrics() -> web.Response:
+    """
+    ---
+    description: Prometheus metrics resolver.
+    tags:
+    - Health check
+    responses:
+      '200':
+        description: successful operation. Return metrics in the prometheus text format.
+        content:
+          text/plain:
+            schema:
+              type: string
+    """
+    return web.Response(body=generate_latest(),
+                        headers={'Content-Type': CONTENT_TYPE_LATEST})
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+model registry
+
+holds the versioned set of models used to serve requests. a request
+uses a single model set from start to finish, so a new version can be
+swapped in atomically while requests on the old one drain, and the
+previous version is kept for instant rollback
+"""
+
+import time
+import asyncio
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from loguru import logger
+
+
+class ModelSet:
+    """
+    immutable set of models, keyed by model name
+    """
+
+    def __init__(self, version: str, models: Dict[str, Any]):
+        self.version = version
+        self.models = dict(models)
+        self.in_flight: int = 0
+        self.created = time.time()
+
+    def __getitem__(self, name: str) -> Any:
+        return self.models[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.models
+
+    def with_models(self, models: Dict[str, Any]) -> 'ModelSet':
+        """
+        copy of this set with the given models added or replaced, same version
+        """
+        return ModelSet(self.version, {**self.models, **models})
+
+
+class ModelRegistry:
+    """
+    active and previous model sets
+    """
+
+    def __init__(self, initial_version: str):
+        self.active = ModelSet(initial_version, {})
+        self.previous: Optional[ModelSet] = None
+        # called after every change of the active set
+        self.on_change: List[Callable[[], None]] = []
+
+    @contextmanager
+    def use(self) -> Iterator[ModelSet]:
+        """
+        the active model set, counted as in use until the block exits
+        """
+        model_set = self.active
+        model_set.in_flight += 1
+        try:
+            yield model_set
+        finally:
+            model_set.in_flight -= 1
+
+    def _changed(self) -> None:
+        for callback in self.on_change:
+            callback()
+
+    def update(self, models: Dict[str, Any]) -> None:
+        """
+        add models to the active version, e.g. while it is being loaded at startup
+        """
+        self.active = self.active.with_models(models)
+        self._changed()
+
+    def activate(self, version: str, models: Dict[str, Any]) -> None:
+        """
+        swap in a new version, keeping the current one for rollback
+        """
+        retiring = self.active
+        self.previous = retiring
+        self.active = ModelSet(version, models)
+        logger.info(f'model version {version} activated, previous version {retiring.version}')
+        self._changed()
+
+    def rollback(self) -> None:
+        """
+        swap the previous version back in
+        """
+        if self.previous is None:
+            raise ValueError('no previous model version to roll back to')
+        self.active, self.previous = self.previous, self.active
+        logger.info(f'rolled back to model version {self.active.version}')
+        self._changed()
+
+    @staticmethod
+    async def drain(model_set: ModelSet, timeout: float, poll_interval: float = .1) -> bool:
+        """
+        wait until no request is using the given model set.
+        returns false if requests were still running after the timeout
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while model_set.in_flight > 0:
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(poll_interval)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        versions and their usage
+        """
+        def describe(model_set: Optional[ModelSet]) -> Optional[Dict[str, Any]]:
+            if model_set is None:
+                return None
+            return {
+                'version': model_set.version,
+                'models': sorted(model_set.models.keys()),
+                'in_flight': model_set.in_flight,
+                'created': model_set.created,
+            }
+        return {
+            'active': describe(self.active),
+            'previous': describe(self.previous),
+        }
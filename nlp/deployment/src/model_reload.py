@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+hot model reload
+
+loads a new version of every model in the background, swaps it in once
+it is loaded and warmed up, and drains requests still running on the old
+version. reloads are triggered by the admin endpoint or by watching the
+model directories for changes
+"""
+
+import os
+import time
+import asyncio
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from loguru import logger
+from src.model_registry import ModelRegistry
+
+
+def _directory_fingerprint(paths: List[str]) -> Tuple[int, float]:
+    """
+    number of files and latest modification time of the given files and directories
+    """
+    num_files = 0
+    latest = 0.
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        if os.path.isfile(path):
+            latest = max(latest, os.path.getmtime(path))
+            num_files += 1
+            continue
+        for root, _dirs, files in os.walk(path):
+            for file_name in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, file_name)))
+                except FileNotFoundError:
+                    # removed while walking, the next poll sees the final state
+                    continue
+                num_files += 1
+    return num_files, latest
+
+
+class ModelReloader:
+    """
+    background reloads for a model registry
+    """
+
+    def __init__(self, registry: ModelRegistry, loaders: Dict[str, Callable[[], Any]],
+                 drain_timeout: float):
+        """
+        loaders read every model from disk again, keyed by model name.
+        they are expected to warm their model up before returning
+        """
+        self.registry = registry
+        self.loaders = loaders
+        self.drain_timeout = drain_timeout
+        self.reloading: bool = False
+        self.reloads: int = 0
+        self.last_error: Optional[str] = None
+        self._watch_task: Optional['asyncio.Future[None]'] = None
+
+    async def reload(self) -> str:
+        """
+        load and activate a new version of every model, returning its version.
+        the current version keeps serving until the new one is ready
+        """
+        if self.reloading:
+            raise RuntimeError('a model reload is already running')
+        self.reloading = True
+        try:
+            version = time.strftime('%Y%m%d-%H%M%S')
+            logger.info(f'loading model version {version}')
+            loop = asyncio.get_event_loop()
+            names = list(self.loaders.keys())
+            models = await asyncio.gather(*[
+                loop.run_in_executor(None, self.loaders[name]) for name in names])
+            retiring = self.registry.active
+            self.registry.activate(version, dict(zip(names, models)))
+            self.reloads += 1
+            self.last_error = None
+        except Exception as err:
+            self.last_error = str(err)
+            logger.exception(f'model reload failed, keeping version {self.registry.active.version}: {err}')
+            raise
+        finally:
+            self.reloading = False
+
+        # the retiring version stays available for rollback, but stops taking new requests
+        if await self.registry.drain(retiring, self.drain_timeout):
+            logger.info(f'model version {retiring.version} drained')
+        else:
+            logger.warning(
+                f'model version {retiring.version} still has {retiring.in_flight} requests after {self.drain_timeout}s')
+        return version
+
+    def start_watching(self, paths: List[str], interval: float) -> None:
+        """
+        poll the given model paths and reload when their content changes
+        """
+        self._watch_task = asyncio.ensure_future(self._watch(paths, interval))
+
+    def stop_watching(self) -> None:
+        """
+        stop polling the model paths
+        """
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    async def _watch(self, paths: List[str], interval: float) -> None:
+        loop = asyncio.get_event_loop()
+        current = await loop.run_in_executor(None, _directory_fingerprint, paths)
+        while True:
+            await asyncio.sleep(interval)
+            fingerprint = await loop.run_in_executor(None, _directory_fingerprint, paths)
+            if fingerprint == current:
+                continue
+            # wait for a quiet period so that a model still being copied is not loaded
+            await asyncio.sleep(interval)
+            settled = await loop.run_in_executor(None, _directory_fingerprint, paths)
+            if settled != fingerprint:
+                continue
+            logger.info('model files changed, reloading')
+            current = settled
+            if self.reloading:
+                continue
+            try:
+                await self.reload()
+            except Exception:
+                # already logged, keep watching
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        reload state
+        """
+        return {
+            'reloading': self.reloading,
+            'reloads': self.reloads,
+            'last_error': self.last_error,
+            'watching': self._watch_task is not None,
+        }
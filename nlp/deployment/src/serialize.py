@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+response serialization
+
+json responses encoded with orjson, which natively handles numpy arrays
+and scalars and is much faster than the standard library encoder
+"""
+
+import orjson
+
+from typing import Any
+from aiohttp import web
+from src.metrics import observe_phase, SERIALIZE_PHASE
+
+_options: int = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(data: Any) -> bytes:
+    """
+    encode the given data as json
+    """
+    with observe_phase(SERIALIZE_PHASE):
+        return orjson.dumps(data, option=_options)
+
+
+def json_response(data: Any, status: int = 200) -> web.Response:
+    """
+    drop-in replacement for aiohttp's json_response
+    """
+    return web.Response(body=dumps(data), status=status,
+                        content_type='application/json')
@@ -1,25 +1,89 @@
+import hmac
 import yaml
 import json
-import requests
-import tensorflow as tf
+import time
+import asyncio
+import socket
+import numpy as np
 
-from typing import cast
-from aiohttp import web
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
+from aiohttp import web, ClientError
 from loguru import logger
 from logging import Logger
 from utils.utils import get_file_path_relative, reScribeModel
 from aiohttp_swagger3 import SwaggerDocs, SwaggerUiSettings
+from src.inference import initialize_inference_executor, shutdown_inference_executor, run_inference, inference_stats
+from src.batcher import PredictionBatcher
+from src.model_registry import ModelRegistry, ModelSet
+from src.model_reload import ModelReloader
+from src.serialize import json_response
+from src.initialize_models import TOKENIZER_MODEL, LANGUAGE_PREDICTION_MODEL, RLP_MODEL, FAST_LANGUAGE_MODEL
+from src.metrics import metrics, metrics_middleware, observe_phase, INFERENCE_QUEUE_DEPTH, \
+    TOKENIZE_PHASE, INFERENCE_PHASE, FAST_INFERENCE_PHASE, RLP_PHASE
+from src.cascade import LanguageCascade
+from src.cache import PredictionCache, cache_key, normalize_query
+from src.admission import AdmissionController, admission_middleware
+from src.tracing import tracing_middleware, configure_slow_request_log
+from src.workers import configure_tensorflow_threads, create_listening_socket, run_workers
+from src.elastic import initialize_elasticsearch, close_elasticsearch, search, multi_search
 from utils.types import NLPType, LanguageType, PackageManager
 
 from aiohttp_swagger3.routes import _SWAGGER_SPECIFICATION as swaggerspec_key, CustomEncoder
 
 QUERY_KEY: str = 'query'
+QUERIES_KEY: str = 'queries'
 LANG_KEY: str = 'language'
 NUM_RES_KEY: str = 'limit'
 
-tokenizer: reScribeModel = None
-language_prediction_model: reScribeModel = None
-rlp_model: reScribeModel = None
+DEFAULT_LANGUAGE_LIMIT: int = 5
+DEFAULT_RELATED_LIBRARY_LIMIT: int = 10
+# elasticsearch's default number of hits
+DEFAULT_LIBRARY_LIMIT: int = 10
+
+# pipeline request parameters
+LIBRARY_LIMIT_KEY: str = 'library_limit'
+RELATED_LIMIT_KEY: str = 'related_limit'
+PACKAGE_MANAGER_KEY: str = 'package_manager'
+MIN_PAIRWISE_DIFFERENCE_KEY: str = 'min_pairwise_difference'
+# minimum mean pairwise difference of the language scores to trust the best language
+DEFAULT_MIN_PAIRWISE_DIFFERENCE: float = .1
+# seconds clients should wait before retrying while models are loading
+MODEL_LOADING_RETRY_AFTER: int = 5
+
+LIBRARY_INDEX: str = 'library'
+RELATED_LIBRARY_LANGUAGE: str = LanguageType.java.value
+RELATED_LIBRARY_PACKAGE_MANAGER: str = PackageManager.maven.value
+
+model_registry: ModelRegistry = None
+# sequence lengths language prediction batches are padded to, none for the max sequence length
+padding_buckets: Optional[List[int]] = None
+model_reloader: ModelReloader = None
+language_batcher: PredictionBatcher = None
+prediction_cache: PredictionCache = None
+# none when the cascade is disabled
+language_cascade: Optional[LanguageCascade] = None
+
+LOADING_STATUS: str = 'loading'
+LOADED_STATUS: str = 'loaded'
+FAILED_STATUS: str = 'failed'
+# load status of every model, keyed by model name
+model_status: Dict[str, str] = {}
+model_loading_task: 'asyncio.Future[None]' = None
+# admission controllers of the inference routes, keyed by path
+admission_controllers: Dict[str, AdmissionController] = {}
+# inference routes, guarded by admission control
+INFERENCE_ROUTES: List[str] = [
+    '/predict',
+    '/predictLanguage',
+    '/predictLanguageBatch',
+    '/predictRelatedLibrary',
+    '/predictRelatedLibraryBatch',
+]
+# seconds clients should wait before retrying a request shed by admission control
+ADMISSION_RETRY_AFTER: int = 1
+
+ADMIN_TOKEN_HEADER: str = 'X-Admin-Token'
 
 async def index() -> web.Response:
     """
@@ -36,7 +100,7 @@ async def index() -> web.Response:
             schema:
               $ref: "#/components/schemas/Message"
     """
-    return web.json_response({
+    return json_response({
         'message': 'nlp engine'
     })
     
@@ -55,7 +119,7 @@ async def hello() -> web.Response:
             schema:
               $ref: "#/components/schemas/Message"
     """
-    return web.json_response({
+    return json_response({
         'message': 'Hello World!'
     })
     
@@ -74,8 +138,337 @@ async def ping() -> web.Response:
               type: string
     """
     return web.Response(text='')
-    
-    
+
+
+async def ready() -> web.Response:
+    """
+    ---
+    description: Readiness request resolver. Unlike ping, only succeeds once all models are loaded.
+    tags:
+    - Health check
+    responses:
+      '200':
+        description: all models are loaded. Return the load status of every model.
+        content:
+          application/json:
+            schema:
+              type: object
+      '503':
+        description: some models are still loading or failed to load. Return the load status of every model.
+        content:
+          application/json:
+            schema:
+              type: object
+    """
+    is_ready = all(status == LOADED_STATUS for status in model_status.values())
+    return json_response({
+        'ready': is_ready,
+        'models': model_status
+    }, status=200 if is_ready else 503)
+
+
+def _require_models(*names: str) -> None:
+    """
+    fail with 503 if any of the given models is not loaded yet
+    """
+    missing = [name for name in names if model_status.get(name) != LOADED_STATUS]
+    if len(missing) > 0:
+        raise web.HTTPServiceUnavailable(
+            reason=f'models not loaded: {", ".join(missing)}',
+            headers={'Retry-After': str(MODEL_LOADING_RETRY_AFTER)})
+
+
+def _require_admin(request: web.Request) -> None:
+    """
+    check the admin token. without a configured token the admin routes are disabled
+    """
+    from src.config import ADMIN_TOKEN
+    if not ADMIN_TOKEN:
+        raise web.HTTPNotFound(reason='admin routes are disabled, set NLP_ADMIN_TOKEN to enable them')
+    if not hmac.compare_digest(request.headers.get(ADMIN_TOKEN_HEADER, '').encode('utf-8'),
+                               ADMIN_TOKEN.encode('utf-8')):
+        raise web.HTTPForbidden(reason='invalid admin token')
+
+
+async def reload_models(request: web.Request) -> web.Response:
+    """
+    ---
+    description: Load a new version of every model in the background and swap it in once it is warmed up.
+    tags:
+    - Admin
+    responses:
+      '202':
+        description: reload started.
+        content:
+          application/json:
+            schema:
+              type: object
+      '403':
+        description: invalid admin token.
+      '404':
+        description: no admin token is configured.
+      '409':
+        description: the startup models are still loading or a reload is already running.
+    """
+    _require_admin(request)
+    if model_loading_task is None or not model_loading_task.done():
+        raise web.HTTPConflict(reason='models are still loading')
+    if model_reloader.reloading:
+        raise web.HTTPConflict(reason='a model reload is already running')
+
+    async def reload() -> None:
+        try:
+            await model_reloader.reload()
+        except Exception:
+            # logged and reported on /stats by the reloader
+            pass
+    asyncio.ensure_future(reload())
+    return json_response({
+        'reloading': True,
+        'models': model_registry.stats()
+    }, status=202)
+
+
+async def rollback_models(request: web.Request) -> web.Response:
+    """
+    ---
+    description: Swap the previous model version back in.
+    tags:
+    - Admin
+    responses:
+      '200':
+        description: successful operation. Return the model versions.
+        content:
+          application/json:
+            schema:
+              type: object
+      '403':
+        description: invalid admin token.
+      '404':
+        description: no admin token is configured.
+      '409':
+        description: there is no previous version.
+    """
+    _require_admin(request)
+    try:
+        model_registry.rollback()
+    except ValueError as err:
+        raise web.HTTPConflict(reason=str(err))
+    return json_response({
+        'models': model_registry.stats()
+    })
+
+
+async def stats() -> web.Response:
+    """
+    ---
+    description: Server statistics resolver.
+    tags:
+    - Health check
+    responses:
+      '200':
+        description: successful operation. Return inference executor statistics.
+        content:
+          application/json:
+            schema:
+              type: object
+    """
+    return json_response({
+        'inference': inference_stats(),
+        'language_batching': language_batcher.stats(),
+        'cache': prediction_cache.stats(),
+        'cascade': language_cascade.stats() if language_cascade is not None else None,
+        'admission': {path: controller.stats() for path, controller in admission_controllers.items()},
+        'models': model_registry.stats(),
+        'reload': model_reloader.stats()
+    })
+
+
+def _predict_language_batch(items: List[Tuple[ModelSet, str]]) -> List[np.ndarray]:
+    """
+    blocking language prediction for a batch of (model set, query) pairs,
+    run on the inference executor. queries of the same model set are
+    tokenized together and go through a single forward pass. returns the
+    class scores of every query
+    """
+    # during a model swap a batch can hold requests of both versions
+    groups: Dict[int, List[int]] = {}
+    for i, (models, _) in enumerate(items):
+        groups.setdefault(id(models), []).append(i)
+
+    results: List[np.ndarray] = [None] * len(items)
+    for indices in groups.values():
+        models = items[indices[0]][0]
+        queries = [items[i][1] for i in indices]
+        # models with a fixed input length need every batch padded to it
+        buckets = padding_buckets if getattr(models[LANGUAGE_PREDICTION_MODEL], 'variable_length', False) else None
+        with observe_phase(TOKENIZE_PHASE):
+            inputs = models[TOKENIZER_MODEL].tokenize(queries, buckets)
+        with observe_phase(INFERENCE_PHASE):
+            res = np.asarray(models[LANGUAGE_PREDICTION_MODEL](inputs), dtype=np.float32)
+        for i, scores in zip(indices, res):
+            results[i] = scores
+    return results
+
+
+def _predict_language_fast(models: ModelSet, queries: List[str]) -> Optional[np.ndarray]:
+    """
+    class scores of the fast tier of the cascade, none if the cascade is
+    disabled or the fast model is not loaded
+    """
+    if language_cascade is None or FAST_LANGUAGE_MODEL not in models:
+        return None
+    with observe_phase(FAST_INFERENCE_PHASE):
+        return models[FAST_LANGUAGE_MODEL].predict_scores(queries)
+
+
+def _predict_language_cascade(items: List[Tuple[ModelSet, str]]) -> List[np.ndarray]:
+    """
+    blocking language prediction for a batch of (model set, query) pairs
+    through the cascade: the fast tier answers the queries it is confident
+    about, and only the others go through the albert model
+    """
+    if len(items) == 0:
+        return []
+    models = items[0][0]
+    queries = [query for _, query in items]
+    fast_scores = _predict_language_fast(models, queries)
+    if fast_scores is None:
+        return _predict_language_batch(items)
+    confident = language_cascade.confident(models[TOKENIZER_MODEL].classes, fast_scores)
+    results: List[np.ndarray] = list(fast_scores)
+    escalated = [i for i in range(len(items)) if not confident[i]]
+    if len(escalated) > 0:
+        for i, scores in zip(escalated, _predict_language_batch([items[i] for i in escalated])):
+            results[i] = scores
+    language_cascade.record(len(items) - len(escalated), len(escalated))
+    return results
+
+
+def _predict_related_libraries(models: ModelSet, query: str, limit: int) -> List[str]:
+    """
+    blocking related library lookup, run on the inference executor
+    """
+    with observe_phase(RLP_PHASE):
+        return models[RLP_MODEL](query, limit)
+
+
+def _predict_related_libraries_batch(models: ModelSet, queries: List[str], limit: int) -> List[List[str]]:
+    """
+    blocking related library lookup for a batch of libraries, run on the
+    inference executor
+    """
+    with observe_phase(RLP_PHASE):
+        return models[RLP_MODEL].get_n_nearest_libraries_batch(queries, limit)
+
+
+def _top_k_languages(models: ModelSet, scores: np.ndarray, limit: int) -> List[Dict[str, Any]]:
+    """
+    the limit highest scoring classes, best first
+    """
+    classes = models[TOKENIZER_MODEL].classes
+    limit = max(min(limit, len(scores)), 0)
+    best = np.argsort(-scores, kind='stable')[:limit]
+    return [{
+        'name': classes[i],
+        'score': float(scores[i])
+    } for i in best]
+
+
+def _read_limit(json_data, default: int, key: str = NUM_RES_KEY) -> int:
+    """
+    get the number of results to return from a request body
+    """
+    if key in json_data:
+        return int(json_data[key])
+    return default
+
+
+def _pairwise_difference(scores: List[float]) -> float:
+    """
+    mean absolute difference between every pair of scores. a low value
+    means the model cannot tell the candidates apart
+    """
+    differences = [abs(scores[i] - scores[j])
+                   for i in range(len(scores)) for j in range(i + 1, len(scores))]
+    if len(differences) == 0:
+        return 0.
+    return sum(differences) / len(differences)
+
+
+async def _language_scores(models: ModelSet, query: str) -> np.ndarray:
+    """
+    class scores of the query, through the cache, then the fast tier of the
+    cascade and the language batcher
+    """
+    async def compute() -> np.ndarray:
+        # a single query takes well under a millisecond on the fast model,
+        # less than handing it to the inference executor
+        fast_scores = _predict_language_fast(models, [query])
+        if fast_scores is not None:
+            if language_cascade.confident(models[TOKENIZER_MODEL].classes, fast_scores)[0]:
+                language_cascade.record(1, 0)
+                return fast_scores[0]
+            language_cascade.record(0, 1)
+        return await language_batcher.predict((models, query))
+    # the scores do not depend on the limit, so they are cached without it.
+    # the model version is part of the key, so that a computation that started
+    # on the models of before a reload is never served as a result of the new ones
+    key = cache_key('predictLanguage', normalize_query(query, lowercase=True), version=models.version)
+    return await prediction_cache.get_or_compute(key, compute)
+
+
+async def _search_libraries(query: str, lang: str, package_manager: str,
+                            limit: int = DEFAULT_LIBRARY_LIMIT) -> Dict[str, Any]:
+    """
+    cached elasticsearch library search
+    """
+    key = cache_key('predictLibrary', normalize_query(query, lowercase=True),
+                    language=lang, package_manager=package_manager, limit=limit)
+    return await prediction_cache.get_or_compute(key, lambda: search(
+        LIBRARY_INDEX, _library_search_query(query, lang, package_manager, limit)))
+
+
+async def _related_libraries(models: ModelSet, query: str, limit: int) -> List[str]:
+    """
+    cached related library lookup
+    """
+    # library names are case sensitive in the related library vocabulary
+    key = cache_key('predictRelatedLibrary', normalize_query(query), limit=limit, version=models.version)
+    return await prediction_cache.get_or_compute(
+        key, lambda: run_inference(_predict_related_libraries, models, query, limit))
+
+
+def _hit_libraries(res: Dict[str, Any]) -> List[str]:
+    """
+    library names of the hits of an elasticsearch library search, best first
+    """
+    return [hit['_source']['library'] for hit in res.get('hits', {}).get('hits', [])
+            if 'library' in hit.get('_source', {})]
+
+
+async def _related_libraries_of_hits(models: ModelSet, query: str, hits: List[str], limit: int) -> List[str]:
+    """
+    libraries related to the libraries found by the library search. the query
+    itself is only looked up when it is the name of one of the hits
+    """
+    libraries = [query] if query in hits else hits
+    if len(libraries) == 0:
+        return []
+    key = cache_key('predictRelatedLibraries', '\n'.join(libraries), limit=limit, version=models.version)
+    related = await prediction_cache.get_or_compute(
+        key, lambda: run_inference(_predict_related_libraries_batch, models, libraries, limit))
+    # the nearest neighbors of every library in turn, without the hits themselves
+    result: List[str] = []
+    for rank in range(limit):
+        for neighbors in related:
+            if len(result) == limit:
+                return result
+            if rank < len(neighbors) and neighbors[rank] not in result and neighbors[rank] not in hits:
+                result.append(neighbors[rank])
+    return result
+
+
 async def predict_language(request: web.Request) -> web.Response:
     """
     predict the language given the query input
@@ -89,41 +482,81 @@ async def predict_language(request: web.Request) -> web.Response:
         content:
           application/json:
             schema:
-              $ref: "#/components/schemas/Prediction"
+              $ref: "#/components/schemas/Predictions"
     """
+    _require_models(TOKENIZER_MODEL, LANGUAGE_PREDICTION_MODEL)
     json_data = await request.json()
     if QUERY_KEY not in json_data:
         raise ValueError(f'cannot find key {QUERY_KEY} in request body')      
 
-    res = language_prediction_model(tokenizer.tokenize([json_data[QUERY_KEY]]))
-    return web.json_response({
-        'data': str(tf.get_static_value(res))
-    })
+    query = json_data[QUERY_KEY]
+    lim = _read_limit(json_data, DEFAULT_LANGUAGE_LIMIT)
+    with model_registry.use() as models:
+        scores = await _language_scores(models, query)
+        return json_response({
+            'data': _top_k_languages(models, scores, lim)
+        })
 
 
 
-async def predict_library_elastic_request(request: web.Request): #, lang: LanguageType, package_manager: PackageManager):
-    lang = LanguageType.java.value
-    package_manager = PackageManager.maven.value
-    if not LanguageType.has_value(lang):
-        raise TypeError(
-            f"lang has value: {lang} expected {LanguageType.get_values()}")
-    if not PackageManager.has_value(package_manager):
-        raise TypeError(
-            f"lang has value: {package_manager} expected {PackageManager.get_values()}")
-  
+def _read_queries(json_data) -> List[str]:
+    """
+    get the list of queries from a batch request body
+    """
+    from src.config import MAX_BATCH_QUERIES
+    if QUERIES_KEY not in json_data:
+        raise web.HTTPBadRequest(reason=f'cannot find key {QUERIES_KEY} in request body')
+    queries = json_data[QUERIES_KEY]
+    if not isinstance(queries, list):
+        raise web.HTTPBadRequest(reason=f'{QUERIES_KEY} must be a list')
+    # a single request must not hold the inference executor or elasticsearch for long
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise web.HTTPBadRequest(reason=f'{len(queries)} queries, at most {MAX_BATCH_QUERIES} are allowed per batch')
+    return [str(query) for query in queries]
+
+
+async def predict_language_batch(request: web.Request) -> web.Response:
+    """
+    predict the language of every query in the input
+    ---
+    description: Batch language prediction resolver
+    tags:
+    - NLP
+    responses:
+      '200':
+        description: successful operation. Return language predictions in the order of the input queries.
+        content:
+          application/json:
+            schema:
+              $ref: "#/components/schemas/BatchPredictions"
+      '400':
+        description: queries missing, not a list or too many.
+    """
+    _require_models(TOKENIZER_MODEL, LANGUAGE_PREDICTION_MODEL)
     json_data = await request.json()
-    if QUERY_KEY not in json_data:
-        raise ValueError(f'cannot find key {QUERY_KEY} in request body')      
-        
-    from src.config import ELASTICSEARCH_HOST
-    query = json.dumps({
+    queries = _read_queries(json_data)
+    lim = _read_limit(json_data, DEFAULT_LANGUAGE_LIMIT)
+    with model_registry.use() as models:
+        scores = await run_inference(_predict_language_cascade, [
+            (models, query) for query in queries]) if len(queries) > 0 else []
+        return json_response({
+            'data': [_top_k_languages(models, row, lim) for row in scores]
+        })
+
+
+def _library_search_query(library: str, lang: str, package_manager: str,
+                          limit: int = DEFAULT_LIBRARY_LIMIT) -> Dict[str, Any]:
+    """
+    elasticsearch query for the limit best libraries matching the given name
+    """
+    return {
+        "size": limit,
         "query": {
             "bool": {
                 "must": [
                     {
                         "match": {
-                            "library": str(json_data[QUERY_KEY]),
+                            "library": library,
                         },
                     },
                     {
@@ -139,58 +572,346 @@ async def predict_library_elastic_request(request: web.Request): #, lang: Langua
                 ]
             }
         }
-    })
-
-    headers={
-        'Content-Type': 'application/json'
     }
-    resp = requests.get(f'{ELASTICSEARCH_HOST}/library/_search', data=query, headers=headers)
-    res = json.loads(resp.text)
-    return web.json_response({
+
+
+async def predict_library_elastic_request(request: web.Request): #, lang: LanguageType, package_manager: PackageManager):
+    lang = LanguageType.java.value
+    package_manager = PackageManager.maven.value
+    if not LanguageType.has_value(lang):
+        raise TypeError(
+            f"lang has value: {lang} expected {LanguageType.get_values()}")
+    if not PackageManager.has_value(package_manager):
+        raise TypeError(
+            f"lang has value: {package_manager} expected {PackageManager.get_values()}")
+  
+    json_data = await request.json()
+    if QUERY_KEY not in json_data:
+        raise ValueError(f'cannot find key {QUERY_KEY} in request body')      
+        
+    try:
+        query = str(json_data[QUERY_KEY])
+        res = await _search_libraries(query, lang, package_manager)
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout(reason='elasticsearch request timed out')
+    except ClientError as err:
+        raise web.HTTPBadGateway(reason=f'elasticsearch request failed: {err}')
+    return json_response({
         'data': res
     })
 
 
 
+async def predict_library_batch_elastic_request(request: web.Request) -> web.Response:
+    """
+    search libraries for every query in the input
+    ---
+    description: Batch library prediction resolver
+    tags:
+    - NLP
+    responses:
+      '200':
+        description: successful operation. Return one elasticsearch response per query, in order.
+        content:
+          application/json:
+            schema:
+              type: object
+      '400':
+        description: queries missing, not a list or too many.
+    """
+    json_data = await request.json()
+    lang = str(json_data.get(LANG_KEY, LanguageType.java.value))
+    if not LanguageType.has_value(lang):
+        raise ValueError(f'{LANG_KEY} has value: {lang} expected {LanguageType.get_values()}')
+    package_manager = str(json_data.get(PACKAGE_MANAGER_KEY, PackageManager.maven.value))
+    if not PackageManager.has_value(package_manager):
+        raise ValueError(
+            f'{PACKAGE_MANAGER_KEY} has value: {package_manager} expected {PackageManager.get_values()}')
+    queries = _read_queries(json_data)
+    if len(queries) == 0:
+        return json_response({
+            'data': []
+        })
+
+    try:
+        res = await multi_search(LIBRARY_INDEX, [
+            _library_search_query(query, lang, package_manager) for query in queries])
+    except asyncio.TimeoutError:
+        raise web.HTTPGatewayTimeout(reason='elasticsearch request timed out')
+    except ClientError as err:
+        raise web.HTTPBadGateway(reason=f'elasticsearch request failed: {err}')
+    return json_response({
+        'data': res
+    })
+
+
 async def predict_related_library(request: web.Request): #, lang: LanguageType
     lang = LanguageType.java.name
     if not LanguageType.has_value(lang):
         raise TypeError(
             f"lang has value: {lang} expected {LanguageType.get_values()}")
+    _require_models(RLP_MODEL)
     json_data = await request.json()
     if QUERY_KEY not in json_data: 
         raise ValueError(f"cannot find key {QUERY_KEY} in request body")
     query = json_data[QUERY_KEY]
-    lim = 10
-    if NUM_RES_KEY in json_data:
-        lim = int(json_data[NUM_RES_KEY])
+    lim = _read_limit(json_data, DEFAULT_RELATED_LIBRARY_LIMIT)
         
     try:
-        res = rlp_model(query, lim)#language_prediction_model(tokenizer.tokenize([json_data[QUERY_KEY]]))
+        with model_registry.use() as models:
+            res = await _related_libraries(models, query, lim)
     except Exception as err:
-        return web.json_response({
+        return json_response({
             'data': [],
             'error': True,
             'error_msg': str(err)
         })
-    return web.json_response({
+    return json_response({
         'data': res
     })
     
-def start_server():
+async def predict_related_library_batch(request: web.Request) -> web.Response:
     """
-    run web server
+    predict related libraries for every library in the input
+    ---
+    description: Batch related library prediction resolver
+    tags:
+    - NLP
+    responses:
+      '200':
+        description: successful operation. Return one list of related libraries per query, in order.
+        content:
+          application/json:
+            schema:
+              type: object
+      '400':
+        description: queries missing, not a list or too many.
     """
-    from src.config import PORT, VERSION
-    from src.initialize_models import language_prediction_model as lpm, tokenizer as tok, rlp_model as rlp
-    
-    global tokenizer
-    global language_prediction_model
-    global rlp_model
-    tokenizer = tok
-    language_prediction_model = lpm
-    rlp_model = rlp
-    app = web.Application()
+    _require_models(RLP_MODEL)
+    json_data = await request.json()
+    queries = _read_queries(json_data)
+    lim = _read_limit(json_data, DEFAULT_RELATED_LIBRARY_LIMIT)
+
+    try:
+        with model_registry.use() as models:
+            res = await run_inference(_predict_related_libraries_batch, models, queries, lim)
+    except Exception as err:
+        return json_response({
+            'data': [],
+            'error': True,
+            'error_msg': str(err)
+        })
+    return json_response({
+        'data': res
+    })
+
+
+async def predict(request: web.Request) -> web.Response:
+    """
+    run the whole search pipeline for a query in a single call
+    ---
+    description: Predicts the language of the query, then searches libraries in that language while looking up the libraries related to the query, and falls back to the libraries related to the search hits when the query is not a library name
+    tags:
+    - NLP
+    responses:
+      '200':
+        description: successful operation. Return the language predictions, the chosen language and the library results.
+        content:
+          application/json:
+            schema:
+              $ref: "#/components/schemas/PipelinePrediction"
+    """
+    _require_models(TOKENIZER_MODEL, LANGUAGE_PREDICTION_MODEL)
+    json_data = await request.json()
+    if QUERY_KEY not in json_data:
+        raise ValueError(f'cannot find key {QUERY_KEY} in request body')
+
+    query = str(json_data[QUERY_KEY])
+    language_limit = _read_limit(json_data, DEFAULT_LANGUAGE_LIMIT)
+    library_limit = _read_limit(json_data, DEFAULT_LIBRARY_LIMIT, LIBRARY_LIMIT_KEY)
+    related_limit = _read_limit(json_data, DEFAULT_RELATED_LIBRARY_LIMIT, RELATED_LIMIT_KEY)
+    package_manager = str(json_data.get(PACKAGE_MANAGER_KEY, PackageManager.maven.value))
+    if not PackageManager.has_value(package_manager):
+        raise ValueError(
+            f'{PACKAGE_MANAGER_KEY} has value: {package_manager} expected {PackageManager.get_values()}')
+    min_pairwise_difference = float(json_data.get(
+        MIN_PAIRWISE_DIFFERENCE_KEY, DEFAULT_MIN_PAIRWISE_DIFFERENCE))
+
+    with model_registry.use() as models:
+        scores = await _language_scores(models, query)
+        languages = _top_k_languages(models, scores, language_limit)
+        # over every class, so that the decision does not depend on how many languages are returned
+        pairwise_difference = _pairwise_difference([float(score) for score in scores])
+        result: Dict[str, Any] = {
+            'languages': languages,
+            'pairwise_difference': pairwise_difference,
+            'language': None,
+            'libraries': None,
+            'related_libraries': [],
+        }
+        if len(languages) == 0 or pairwise_difference <= min_pairwise_difference:
+            # the model is not confident enough to narrow the search down to a language
+            return json_response(result)
+        result['language'] = languages[0]['name']
+
+        async def libraries() -> Dict[str, Any]:
+            try:
+                return {'data': await _search_libraries(
+                    query, result['language'], package_manager, library_limit)}
+            except asyncio.TimeoutError:
+                return {'error': True, 'error_msg': 'elasticsearch request timed out'}
+            except ClientError as err:
+                return {'error': True, 'error_msg': f'elasticsearch request failed: {err}'}
+
+        # the related library graph only knows java libraries from maven
+        related_enabled = related_limit > 0 and result['language'] == RELATED_LIBRARY_LANGUAGE \
+            and package_manager == RELATED_LIBRARY_PACKAGE_MANAGER
+
+        async def query_related_libraries() -> Optional[List[str]]:
+            # run during the search, only used if the query is the name of a library it finds
+            if not related_enabled or RLP_MODEL not in models:
+                return None
+            try:
+                return await _related_libraries(models, query, related_limit)
+            except Exception:
+                # looked up again from the hits, which reports the error
+                return None
+
+        async def related_libraries(hits: List[str], query_related: Optional[List[str]]) -> Dict[str, Any]:
+            if not related_enabled:
+                return {'data': []}
+            if RLP_MODEL not in models:
+                return {'data': [], 'error': True, 'error_msg': f'{RLP_MODEL} is not loaded'}
+            if query in hits and query_related is not None:
+                return {'data': [library for library in query_related if library not in hits]}
+            try:
+                return {'data': await _related_libraries_of_hits(models, query, hits, related_limit)}
+            except Exception as err:
+                return {'data': [], 'error': True, 'error_msg': str(err)}
+
+        library_res, query_related = await asyncio.gather(libraries(), query_related_libraries())
+        # otherwise the related libraries are looked up from the library names the search found
+        related_res = await related_libraries(_hit_libraries(library_res.get('data') or {}), query_related)
+        result['libraries'] = library_res.get('data')
+        result['related_libraries'] = related_res['data']
+        errors = {name: res['error_msg'] for name, res in
+                  [('libraries', library_res), ('related_libraries', related_res)] if res.get('error')}
+        if len(errors) > 0:
+            # partial results are still useful to the search
+            result['error'] = True
+            result['error_msg'] = errors
+        return json_response(result)
+
+
+def set_models(models: Dict[str, reScribeModel]) -> None:
+    """
+    add models to the active model set, keyed by model name. cached
+    predictions were made with the previous models, so the cache is cleared
+    through the registry's change callback
+    """
+    model_registry.update(models)
+
+
+def _sync_model_status() -> None:
+    """
+    mark the models of the active model set as loaded after a reload or a
+    rollback, and the ones it lacks as failed, except those still loading
+    """
+    for name in model_status:
+        if name in model_registry.active:
+            model_status[name] = LOADED_STATUS
+        elif model_status[name] != LOADING_STATUS:
+            model_status[name] = FAILED_STATUS
+
+
+async def _load_model(name: str, loader: Callable[[], reScribeModel]) -> None:
+    """
+    run a model loader on its own thread and install the model once it is loaded
+    """
+    model_status[name] = LOADING_STATUS
+    try:
+        model = await asyncio.get_event_loop().run_in_executor(None, loader)
+    except Exception as err:
+        model_status[name] = FAILED_STATUS
+        logger.exception(f'failed to load {name}: {err}')
+        return
+    set_models({name: model})
+    model_status[name] = LOADED_STATUS
+
+
+async def load_models(loaders: Dict[str, Callable[[], reScribeModel]]) -> None:
+    """
+    load all models concurrently, so that cold start takes as long as the
+    slowest model instead of the sum of all of them
+    """
+    start = time.perf_counter()
+    await asyncio.gather(*[_load_model(name, loader) for name, loader in loaders.items()])
+    logger.info(f'model loading finished in {time.perf_counter() - start:.1f}s: {model_status}')
+
+
+def _create_app(model_loaders: Dict[str, Callable[[], reScribeModel]],
+                reload_loaders: Dict[str, Callable[[], reScribeModel]],
+                model_paths: List[str], write_swagger_spec: bool) -> web.Application:
+    """
+    create the web application of this process. the models are loaded in
+    the background with the given loaders, keyed by model name, and are
+    reloaded with the reload loaders on request or when the model paths change
+    """
+    from src.config import VERSION, INFERENCE_WORKERS, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, \
+        ELASTICSEARCH_HOST, ELASTICSEARCH_MAX_CONNECTIONS, ELASTICSEARCH_TIMEOUT, CACHE_MAX_SIZE, CACHE_TTL, \
+        ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_MS, MODEL_WATCH_INTERVAL, MODEL_DRAIN_TIMEOUT, \
+        SLOW_REQUEST_MS, SLOW_REQUEST_LOG, PADDING_BUCKETS, CASCADE_THRESHOLD, CASCADE_CLASS_THRESHOLDS
+
+    global language_batcher
+    global prediction_cache
+    global model_registry
+    global model_reloader
+    global padding_buckets
+    global language_cascade
+    padding_buckets = PADDING_BUCKETS if len(PADDING_BUCKETS) > 0 else None
+    language_cascade = LanguageCascade(CASCADE_THRESHOLD, CASCADE_CLASS_THRESHOLDS) \
+        if CASCADE_THRESHOLD is not None else None
+    prediction_cache = PredictionCache(CACHE_MAX_SIZE, CACHE_TTL)
+    model_registry = ModelRegistry('initial')
+    model_registry.on_change.append(prediction_cache.invalidate)
+    model_registry.on_change.append(_sync_model_status)
+    model_reloader = ModelReloader(model_registry, reload_loaders, MODEL_DRAIN_TIMEOUT)
+    for name in model_loaders:
+        model_status[name] = LOADING_STATUS
+    initialize_inference_executor(INFERENCE_WORKERS)
+    language_batcher = PredictionBatcher(
+        _predict_language_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+    INFERENCE_QUEUE_DEPTH.set_function(lambda: inference_stats()['queue_depth'])
+    for path in INFERENCE_ROUTES:
+        admission_controllers[path] = AdmissionController(
+            path, ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_MS, ADMISSION_RETRY_AFTER)
+    configure_slow_request_log(SLOW_REQUEST_LOG)
+    # tracing goes first, so that traces include the time waiting for admission
+    app = web.Application(middlewares=[
+        tracing_middleware(SLOW_REQUEST_MS), metrics_middleware, admission_middleware(admission_controllers)])
+
+    async def on_startup(_app: web.Application) -> None:
+        language_batcher.start()
+        await initialize_elasticsearch(
+            ELASTICSEARCH_HOST, ELASTICSEARCH_MAX_CONNECTIONS, ELASTICSEARCH_TIMEOUT)
+        global model_loading_task
+
+        async def load_and_watch() -> None:
+            await load_models(model_loaders)
+            # only watch once the startup models are in place, so a reload cannot race them
+            if MODEL_WATCH_INTERVAL > 0:
+                model_reloader.start_watching(model_paths, MODEL_WATCH_INTERVAL)
+        model_loading_task = asyncio.ensure_future(load_and_watch())
+
+    async def on_cleanup(_app: web.Application) -> None:
+        if model_loading_task is not None:
+            model_loading_task.cancel()
+        model_reloader.stop_watching()
+        await language_batcher.stop()
+        await close_elasticsearch()
+        shutdown_inference_executor()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
 
     current_folder: str = 'deployment'
     components_file = get_file_path_relative(
@@ -206,17 +927,109 @@ def start_server():
         web.get('/', index),
         web.get('/hello', hello),
         web.get('/ping', ping),
+        web.get('/ready', ready),
+        web.get('/stats', stats),
+        web.get('/metrics', metrics),
+        web.put('/admin/reload', reload_models),
+        web.put('/admin/rollback', rollback_models),
         web.put('/predictRelatedLibrary', predict_related_library),
         web.put('/predictLibrary', predict_library_elastic_request),
-        web.put('/predictLanguage', predict_language)
+        web.put('/predictLanguage', predict_language),
+        web.put('/predictRelatedLibraryBatch', predict_related_library_batch),
+        web.put('/predictLibraryBatch', predict_library_batch_elastic_request),
+        web.put('/predictLanguageBatch', predict_language_batch),
+        web.put('/predict', predict)
     ])
-    swagger_spec_dict = json.loads(
-        json.dumps(app[swaggerspec_key], cls=CustomEncoder))
-    swagger_spec_file_path = get_file_path_relative(
-        f'{current_folder}/swagger.yml')
-    with open(swagger_spec_file_path, 'w') as swagger_spec_file:
-        yaml.dump(swagger_spec_dict, swagger_spec_file)
-
-    logger.info(f'nlp started: http://localhost:{PORT} 🚀')
+    if write_swagger_spec:
+        swagger_spec_dict = json.loads(
+            json.dumps(app[swaggerspec_key], cls=CustomEncoder))
+        swagger_spec_file_path = get_file_path_relative(
+            f'{current_folder}/swagger.yml')
+        with open(swagger_spec_file_path, 'w') as swagger_spec_file:
+            yaml.dump(swagger_spec_dict, swagger_spec_file)
+    return app
+
+
+def _create_loading_app(model_names: List[str]) -> web.Application:
+    """
+    app answering on the shared socket while the parent process preloads,
+    before the workers are forked. every model is reported as loading
+    """
+    async def loading_ready(_request: web.Request) -> web.Response:
+        return json_response({
+            'ready': False,
+            'models': {name: LOADING_STATUS for name in model_names}
+        }, status=503)
+
+    async def loading_ping(_request: web.Request) -> web.Response:
+        return web.Response(text='')
+
+    async def loading(_request: web.Request) -> web.Response:
+        raise web.HTTPServiceUnavailable(
+            reason=f'models not loaded: {", ".join(model_names)}',
+            headers={'Retry-After': str(MODEL_LOADING_RETRY_AFTER)})
+
+    app = web.Application()
+    app.router.add_get('/ping', loading_ping)
+    app.router.add_get('/ready', loading_ready)
+    app.router.add_route('*', '/{tail:.*}', loading)
+    return app
+
+
+def _preload(sock: socket.socket, model_names: List[str],
+             preload: Callable[[], Dict[str, Callable[[], reScribeModel]]]
+             ) -> Dict[str, Callable[[], reScribeModel]]:
+    """
+    run preload while the loading app serves on the shared socket, and return
+    its result. the event loop and the thread are gone once it returns, so
+    that neither is carried into the forked workers
+    """
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    runner = web.AppRunner(_create_loading_app(model_names), access_log=None)
+    try:
+        loop.run_until_complete(runner.setup())
+        # serve on a duplicate, so that stopping the site keeps the shared socket open
+        loop.run_until_complete(web.SockSite(runner, sock.dup()).start())
+        return loop.run_until_complete(loop.run_in_executor(executor, preload))
+    finally:
+        loop.run_until_complete(runner.cleanup())
+        executor.shutdown(wait=True)
+        loop.close()
+
+
+def start_server(model_loaders: Dict[str, Callable[[], reScribeModel]],
+                 reload_loaders: Dict[str, Callable[[], reScribeModel]], model_paths: List[str],
+                 preload: Optional[Callable[[], Dict[str, Callable[[], reScribeModel]]]] = None):
+    """
+    run web server, in NLP_WORKERS pre-forked processes if more than one.
+    the models are loaded in the background with the given loaders, keyed by
+    model name, and hot reloaded with the reload loaders.
+    with several workers, preload runs in the parent once the socket is
+    bound, before forking, and returns the loaders the workers use instead,
+    e.g. ones sharing the structures it loaded through copy-on-write
+    """
+    from src.config import PORT, WORKERS, TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS
+
     web_logger = cast(Logger, logger)
-    web.run_app(app, host='0.0.0.0', port=PORT, access_log=web_logger)
+    if WORKERS == 1:
+        configure_tensorflow_threads(TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS)
+        app = _create_app(model_loaders, reload_loaders, model_paths, write_swagger_spec=True)
+        logger.info(f'nlp started: http://localhost:{PORT} 🚀')
+        web.run_app(app, host='0.0.0.0', port=PORT, access_log=web_logger)
+        return
+
+    sock = create_listening_socket('0.0.0.0', PORT)
+    logger.info(f'nlp listening: http://localhost:{PORT} 🚀')
+    if preload is not None:
+        # /ready reports the models as loading until the workers take over
+        model_loaders = _preload(sock, list(model_loaders.keys()), preload)
+
+    def run_worker(index: int) -> None:
+        # tensorflow is only initialized after the fork, it does not survive one
+        configure_tensorflow_threads(TF_INTRA_OP_THREADS, TF_INTER_OP_THREADS)
+        app = _create_app(model_loaders, reload_loaders, model_paths, write_swagger_spec=index == 0)
+        web.run_app(app, sock=sock, access_log=web_logger, print=None)
+
+    logger.info(f'nlp started with {WORKERS} workers')
+    run_workers(WORKERS, run_worker)
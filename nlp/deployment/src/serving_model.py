@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+serving model
+
+language prediction model loaded from the fixed-signature saved model
+exported by training, called as a compiled graph instead of eagerly
+through keras
+"""
+
+import bisect
+import numpy as np
+import tensorflow as tf
+
+from typing import Iterable, List, Optional, Sequence
+from loguru import logger
+from utils.variables import serving_input_names
+
+
+class ServingModel:
+    """
+    callable wrapper around the serving_default signature
+    """
+
+    def __init__(self, export_dir: str):
+        self._loaded = tf.saved_model.load(export_dir)
+        self._serve = self._loaded.signatures['serving_default']
+        # none for signatures exported with an open sequence length
+        self.sequence_length: Optional[int] = \
+            self._serve.structured_input_signature[1][serving_input_names[0]].shape[1]
+        # batch sizes the graph was warmed up with, ascending
+        self.batch_sizes: List[int] = []
+
+    @property
+    def variable_length(self) -> bool:
+        """
+        whether the inputs can be padded to any length, e.g. to length buckets
+        """
+        return self.sequence_length is None
+
+    def _serve_batch(self, inputs: Sequence[np.ndarray]) -> np.ndarray:
+        kwargs = {
+            name: tf.convert_to_tensor(value, dtype=tf.int32)
+            for name, value in zip(serving_input_names, inputs)
+        }
+        return self._serve(**kwargs)['scores'].numpy()
+
+    def __call__(self, inputs: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        inputs are the tokenized input ids, attention masks and segments.
+        once warmed up, batches are padded to the next warmed batch size, and
+        larger batches split into batches of the largest, so that every call
+        runs a shape that is already initialized (and compiled, with XLA)
+        """
+        batch_size = len(inputs[0])
+        if len(self.batch_sizes) == 0 or batch_size == 0:
+            return self._serve_batch(inputs)
+        max_batch_size = self.batch_sizes[-1]
+        scores = []
+        for start in range(0, batch_size, max_batch_size):
+            chunk = [np.asarray(value[start:start + max_batch_size], dtype=np.int32) for value in inputs]
+            size = len(chunk[0])
+            padded_size = self.batch_sizes[bisect.bisect_left(self.batch_sizes, size)]
+            if padded_size > size:
+                # all zero rows, masked out entirely, their scores are dropped
+                chunk = [np.pad(value, ((0, padded_size - size), (0, 0))) for value in chunk]
+            scores.append(self._serve_batch(chunk)[:size])
+        return np.concatenate(scores)
+
+    def warm_up(self, max_sequence_length: int, batch_sizes: Iterable[int],
+                sequence_lengths: Iterable[int] = ()) -> None:
+        """
+        run the graph once per batch size and sequence length so that the
+        first requests do not pay for kernel initialization (and XLA
+        compilation, which happens per input shape)
+        """
+        lengths = {max_sequence_length}
+        if self.variable_length:
+            lengths.update(length for length in sequence_lengths if length <= max_sequence_length)
+        batch_sizes = sorted(set(batch_sizes))
+        for batch_size in batch_sizes:
+            for length in sorted(lengths):
+                dummy = np.zeros((batch_size, length), dtype=np.int32)
+                self._serve_batch((dummy, dummy, dummy))
+        self.batch_sizes = batch_sizes
+        logger.info('language_prediction serving signature warmed up')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+stub elasticsearch
+
+answers the library searches of the server with canned hits after a
+configurable delay, so that load tests do not need a real cluster. like
+elasticsearch, it rejects searches with a negative size
+"""
+
+import json
+import asyncio
+
+from typing import Any, Dict, Optional
+from aiohttp import web
+
+
+def _error(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if int(query.get('size', 10)) >= 0:
+        return None
+    return {
+        'error': {
+            'type': 'illegal_argument_exception',
+            'reason': '[size] parameter cannot be negative',
+        },
+        'status': 400,
+    }
+
+
+def _hits(query: Dict[str, Any]) -> Dict[str, Any]:
+    error = _error(query)
+    if error is not None:
+        return error
+    size = int(query.get('size', 10))
+    return {
+        'took': 1,
+        'timed_out': False,
+        'hits': {
+            'total': {'value': size, 'relation': 'eq'},
+            'max_score': 1.,
+            'hits': [{
+                '_index': 'library',
+                '_id': str(i),
+                '_score': 1. / (i + 1),
+                '_source': {
+                    'library': f'org.fixture.library{i}',
+                    'language': 'java',
+                    'package_manager': 'maven',
+                },
+            } for i in range(size)],
+        },
+    }
+
+
+def create_stub_elasticsearch(latency_ms: float) -> web.Application:
+    """
+    web application serving _search and _msearch for any index
+    """
+    latency = latency_ms / 1000.
+
+    async def search(request: web.Request) -> web.Response:
+        body = await request.text()
+        await asyncio.sleep(latency)
+        res = _hits(json.loads(body) if len(body) > 0 else {})
+        return web.json_response(res, status=res.get('status', 200))
+
+    async def multi_search(request: web.Request) -> web.Response:
+        lines = [line for line in (await request.text()).split('\n') if len(line) > 0]
+        await asyncio.sleep(latency)
+        # every other line is a header
+        return web.json_response({
+            'took': 1,
+            'responses': [_hits(json.loads(line)) for line in lines[1::2]],
+        })
+
+    app = web.Application()
+    for method in ['GET', 'POST']:
+        app.router.add_route(method, '/{index}/_search', search)
+        app.router.add_route(method, '/{index}/_msearch', multi_search)
+    return app
+
+
+def run_stub_elasticsearch(port: int, latency_ms: float) -> None:
+    """
+    serve the stub until the process is stopped
+    """
+    web.run_app(create_stub_elasticsearch(latency_ms), host='127.0.0.1', port=port,
+                access_log=None, print=None)
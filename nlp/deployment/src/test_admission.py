@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+admission control tests
+"""
+
+import time
+import asyncio
+import pytest
+
+from typing import Any, Awaitable
+from aiohttp import web
+from src.admission import AdmissionController, QUEUE_FULL_REASON, QUEUE_TIMEOUT_REASON, DEADLINE_REASON
+
+
+def _run(coroutine: Awaitable[Any]) -> Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _controller(route: str, max_queue: int = 1, max_wait_ms: float = 1000.) -> AdmissionController:
+    # created on the running loop, which its semaphore binds to
+    return AdmissionController(route, max_in_flight=1, max_queue=max_queue, max_wait_ms=max_wait_ms, retry_after=3)
+
+
+def test_requests_within_the_limit_are_admitted():
+    """
+    a free slot is taken at once and given back on release
+    """
+    async def scenario() -> None:
+        controller = _controller('/test/admitted')
+        await controller.acquire(None)
+        assert controller.stats()['in_flight'] == 1
+        controller.release()
+        assert controller.stats()['in_flight'] == 0
+    _run(scenario())
+
+
+def test_queued_request_is_admitted_after_a_release():
+    """
+    a request waiting in the queue takes the slot of the one that finished
+    """
+    async def scenario() -> None:
+        controller = _controller('/test/queued')
+        await controller.acquire(None)
+        waiting = asyncio.ensure_future(controller.acquire(None))
+        await asyncio.sleep(0)
+        assert controller.stats()['queued'] == 1
+        controller.release()
+        await waiting
+        assert controller.stats() == {
+            'in_flight': 1,
+            'max_in_flight': 1,
+            'queued': 0,
+            'max_queue': 1,
+            'rejections': {QUEUE_FULL_REASON: 0, QUEUE_TIMEOUT_REASON: 0, DEADLINE_REASON: 0},
+        }
+    _run(scenario())
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    """
+    requests beyond the queue fail at once with 503
+    """
+    async def scenario() -> None:
+        controller = _controller('/test/full')
+        await controller.acquire(None)
+        waiting = asyncio.ensure_future(controller.acquire(None))
+        await asyncio.sleep(0)
+        with pytest.raises(web.HTTPServiceUnavailable) as rejection:
+            await controller.acquire(None)
+        assert rejection.value.headers['Retry-After'] == '3'
+        assert controller.stats()['rejections'][QUEUE_FULL_REASON] == 1
+        controller.release()
+        await waiting
+    _run(scenario())
+
+
+def test_queue_wait_is_bounded():
+    """
+    a request that waits longer than the max wait is shed
+    """
+    async def scenario() -> None:
+        controller = _controller('/test/timeout', max_wait_ms=10.)
+        await controller.acquire(None)
+        with pytest.raises(web.HTTPServiceUnavailable):
+            await controller.acquire(None)
+        assert controller.stats()['rejections'][QUEUE_TIMEOUT_REASON] == 1
+        assert controller.stats()['queued'] == 0
+    _run(scenario())
+
+
+def test_expired_deadline_is_rejected_without_taking_a_slot():
+    """
+    nobody waits for the answer of a request past its deadline
+    """
+    async def scenario() -> None:
+        controller = _controller('/test/deadline')
+        with pytest.raises(web.HTTPServiceUnavailable):
+            await controller.acquire(time.monotonic() - 1.)
+        assert controller.stats()['rejections'][DEADLINE_REASON] == 1
+        assert controller.stats()['in_flight'] == 0
+        # the slot was given back
+        await controller.acquire(None)
+    _run(scenario())
+
+
+def test_deadline_shortens_the_queue_wait():
+    """
+    a queued request is rejected when its deadline passes, before the max wait
+    """
+    async def scenario() -> None:
+        controller = _controller('/test/queued_deadline', max_wait_ms=10000.)
+        await controller.acquire(None)
+        start = time.monotonic()
+        with pytest.raises(web.HTTPServiceUnavailable):
+            await controller.acquire(start + .02)
+        assert time.monotonic() - start < 5.
+        assert controller.stats()['rejections'][DEADLINE_REASON] == 1
+    _run(scenario())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+micro-batching tests
+"""
+
+import asyncio
+import pytest
+
+from typing import Any, Awaitable, List
+from src.batcher import PredictionBatcher
+from src.inference import initialize_inference_executor, shutdown_inference_executor
+
+
+def _run(coroutine: Awaitable[Any]) -> Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture(autouse=True)
+def inference_executor():
+    """
+    the batcher runs its batches on the inference executor
+    """
+    initialize_inference_executor(2)
+    yield
+    shutdown_inference_executor()
+
+
+def _doubling(batch_sizes: List[int]):
+    def predict_batch(values: List[int]) -> List[int]:
+        batch_sizes.append(len(values))
+        return [value * 2 for value in values]
+    return predict_batch
+
+
+def test_concurrent_inputs_share_a_batch():
+    """
+    inputs queued within the wait window go through a single call, and every
+    request gets its own result
+    """
+    async def scenario() -> None:
+        batch_sizes: List[int] = []
+        batcher = PredictionBatcher(_doubling(batch_sizes), max_batch_size=8, max_wait_ms=50.)
+        batcher.start()
+        try:
+            assert await asyncio.gather(*[batcher.predict(i) for i in range(5)]) == [0, 2, 4, 6, 8]
+        finally:
+            await batcher.stop()
+        assert batch_sizes == [5]
+        assert batcher.stats()['mean_batch_size'] == 5.
+    _run(scenario())
+
+
+def test_batches_are_capped_at_the_max_batch_size():
+    """
+    a full batch is run without waiting for the window to end
+    """
+    async def scenario() -> None:
+        batch_sizes: List[int] = []
+        batcher = PredictionBatcher(_doubling(batch_sizes), max_batch_size=2, max_wait_ms=50.)
+        batcher.start()
+        try:
+            assert await asyncio.gather(*[batcher.predict(i) for i in range(5)]) == [0, 2, 4, 6, 8]
+        finally:
+            await batcher.stop()
+        assert sorted(batch_sizes) == [1, 2, 2]
+        assert batcher.stats()['batches'] == 3
+    _run(scenario())
+
+
+def test_a_failed_batch_fails_every_request_in_it():
+    """
+    the error of the batch call is raised to every waiting request
+    """
+    async def scenario() -> None:
+        def fail(values: List[int]) -> List[int]:
+            raise ValueError('model crashed')
+        batcher = PredictionBatcher(fail, max_batch_size=8, max_wait_ms=10.)
+        batcher.start()
+        try:
+            results = await asyncio.gather(*[batcher.predict(i) for i in range(3)], return_exceptions=True)
+        finally:
+            await batcher.stop()
+        assert all(isinstance(result, ValueError) for result in results)
+    _run(scenario())
+
+
+def test_a_wrong_number_of_results_fails_the_batch():
+    """
+    results are matched to requests by position, so a missing one is an error
+    """
+    async def scenario() -> None:
+        batcher = PredictionBatcher(lambda values: values[1:], max_batch_size=8, max_wait_ms=10.)
+        batcher.start()
+        try:
+            results = await asyncio.gather(*[batcher.predict(i) for i in range(3)], return_exceptions=True)
+        finally:
+            await batcher.stop()
+        assert all(isinstance(result, RuntimeError) for result in results)
+    _run(scenario())
+
+
+def test_predict_needs_a_started_batcher():
+    """
+    the queue only exists once the batcher runs on an event loop
+    """
+    batcher = PredictionBatcher(lambda values: values, max_batch_size=8, max_wait_ms=10.)
+    with pytest.raises(RuntimeError):
+        _run(batcher.predict(1))
+
+
+def test_invalid_settings_are_rejected():
+    """
+    a batch holds at least one input and the window cannot be negative
+    """
+    with pytest.raises(ValueError):
+        PredictionBatcher(lambda values: values, max_batch_size=0, max_wait_ms=10.)
+    with pytest.raises(ValueError):
+        PredictionBatcher(lambda values: values, max_batch_size=8, max_wait_ms=-1.)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+prediction cache tests
+"""
+
+import asyncio
+
+from typing import Any, Awaitable, Callable, List
+from src.cache import PredictionCache, cache_key, normalize_query
+
+
+def _run(coroutine: Awaitable[Any]) -> Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _slow_compute(calls: List[int], value: Any, release: asyncio.Event) -> Callable[[], Awaitable[Any]]:
+    async def compute() -> Any:
+        calls.append(1)
+        await release.wait()
+        return value
+    return compute
+
+
+def test_normalized_queries_share_a_key():
+    """
+    queries that differ in case and whitespace only share an entry
+    """
+    assert cache_key('predictLanguage', normalize_query('  Java   ArrayList ', lowercase=True)) == \
+        cache_key('predictLanguage', normalize_query('java arraylist', lowercase=True))
+
+
+def test_hit_after_miss():
+    """
+    the second request is answered from the cache
+    """
+    async def scenario() -> None:
+        cache = PredictionCache(10, 60.)
+        calls: List[int] = []
+        release = asyncio.Event()
+        release.set()
+        assert await cache.get_or_compute('key', _slow_compute(calls, 1, release)) == 1
+        assert await cache.get_or_compute('key', _slow_compute(calls, 2, release)) == 1
+        assert len(calls) == 1
+        assert cache.stats()['hits'] == 1
+    _run(scenario())
+
+
+def test_concurrent_requests_are_coalesced():
+    """
+    concurrent misses of a key wait for a single computation
+    """
+    async def scenario() -> None:
+        cache = PredictionCache(10, 60.)
+        calls: List[int] = []
+        release = asyncio.Event()
+        requests = [asyncio.ensure_future(cache.get_or_compute('key', _slow_compute(calls, 'value', release)))
+                    for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*requests) == ['value'] * 5
+        assert len(calls) == 1
+        assert cache.stats()['coalesced'] == 4
+    _run(scenario())
+
+
+def test_cancelled_leader_does_not_fail_waiters():
+    """
+    the computation outlives the request that started it
+    """
+    async def scenario() -> None:
+        cache = PredictionCache(10, 60.)
+        calls: List[int] = []
+        release = asyncio.Event()
+        leader = asyncio.ensure_future(cache.get_or_compute('key', _slow_compute(calls, 'value', release)))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_compute('key', _slow_compute(calls, 'other', release)))
+        await asyncio.sleep(0)
+        # the client that started the computation disconnects
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await waiter == 'value'
+        assert leader.cancelled()
+        assert len(calls) == 1
+        # the value computed for the cancelled leader is still cached
+        assert await cache.get_or_compute('key', _slow_compute(calls, 'other', release)) == 'value'
+    _run(scenario())
+
+
+def test_failed_computation_is_not_cached():
+    """
+    errors are raised to the caller and computed again next time
+    """
+    async def scenario() -> None:
+        cache = PredictionCache(10, 60.)
+
+        async def fail() -> Any:
+            raise ValueError('elasticsearch is down')
+
+        async def succeed() -> Any:
+            return 'value'
+        for _ in range(2):
+            try:
+                await cache.get_or_compute('key', fail)
+                assert False, 'the error was not raised'
+            except ValueError:
+                pass
+        assert await cache.get_or_compute('key', succeed) == 'value'
+    _run(scenario())
+
+
+def test_invalidation_drops_results_of_computations_in_flight():
+    """
+    a result computed by the old model is not cached after a reload
+    """
+    async def scenario() -> None:
+        cache = PredictionCache(10, 60.)
+        calls: List[int] = []
+        release = asyncio.Event()
+        request = asyncio.ensure_future(cache.get_or_compute('key', _slow_compute(calls, 'old model', release)))
+        await asyncio.sleep(0)
+        # a model reload while the old model is computing
+        cache.invalidate()
+        release.set()
+        assert await request == 'old model'
+        assert await cache.get_or_compute('key', _slow_compute(calls, 'new model', release)) == 'new model'
+        assert len(calls) == 2
+    _run(scenario())
+
+
+def test_lru_eviction():
+    """
+    the least recently used entry makes room for a new one
+    """
+    async def scenario() -> None:
+        cache = PredictionCache(2, 60.)
+        release = asyncio.Event()
+        release.set()
+        for key in ['a', 'b', 'c']:
+            await cache.get_or_compute(key, _slow_compute([], key, release))
+        assert cache.stats()['size'] == 2
+        assert cache.stats()['evictions'] == 1
+    _run(scenario())
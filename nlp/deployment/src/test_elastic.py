@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+elasticsearch client tests, against the stub elasticsearch
+"""
+
+import socket
+import asyncio
+import pytest
+
+from typing import Any, Awaitable, Callable
+from aiohttp import web, ClientError, ClientResponseError
+from src.elastic import initialize_elasticsearch, close_elasticsearch, search, multi_search
+from src.stub_elasticsearch import create_stub_elasticsearch
+
+
+def _run(coroutine: Awaitable[Any]) -> Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _with_stub(test: Callable[[], Awaitable[None]]) -> Awaitable[None]:
+    async def scenario() -> None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        runner = web.AppRunner(create_stub_elasticsearch(0.))
+        await runner.setup()
+        await web.SockSite(runner, sock).start()
+        await initialize_elasticsearch(f'http://127.0.0.1:{sock.getsockname()[1]}/', 4, 5.)
+        try:
+            await test()
+        finally:
+            await close_elasticsearch()
+            await runner.cleanup()
+    return scenario()
+
+
+def test_search_returns_the_response():
+    """
+    the json body of a successful search is returned as is
+    """
+    async def test() -> None:
+        res = await search('library', {'size': 3})
+        assert [hit['_source']['library'] for hit in res['hits']['hits']] == [
+            'org.fixture.library0', 'org.fixture.library1', 'org.fixture.library2']
+    _run(_with_stub(test))
+
+
+def test_search_error_status_raises():
+    """
+    an error status raises instead of returning the error body
+    """
+    async def test() -> None:
+        with pytest.raises(ClientResponseError) as error:
+            await search('library', {'size': -1})
+        assert error.value.status == 400
+    _run(_with_stub(test))
+
+
+def test_multi_search_returns_responses_in_order():
+    """
+    one response per query, in the order of the queries
+    """
+    async def test() -> None:
+        responses = await multi_search('library', [{'size': 1}, {'size': 2}, {'size': 0}])
+        assert [len(res['hits']['hits']) for res in responses] == [1, 2, 0]
+    _run(_with_stub(test))
+
+
+def test_multi_search_item_error_raises():
+    """
+    a failed search inside a successful multi search raises, so that the
+    partial responses are never returned or cached
+    """
+    async def test() -> None:
+        with pytest.raises(ClientError) as error:
+            await multi_search('library', [{'size': 1}, {'size': -1}])
+        assert '1 of 2 searches failed' in str(error.value)
+    _run(_with_stub(test))
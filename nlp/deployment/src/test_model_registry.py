@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+model registry tests
+"""
+
+import asyncio
+import pytest
+
+from typing import Any, Awaitable, List
+from src.model_registry import ModelRegistry
+
+
+def _run(coroutine: Awaitable[Any]) -> Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_update_adds_models_to_the_active_version():
+    """
+    models loaded at startup join the initial version
+    """
+    registry = ModelRegistry('v1')
+    registry.update({'tokenizer': 'tokenizer v1'})
+    registry.update({'model': 'model v1'})
+    assert registry.active.version == 'v1'
+    assert registry.active['tokenizer'] == 'tokenizer v1'
+    assert 'model' in registry.active
+    assert registry.previous is None
+
+
+def test_requests_keep_their_version_across_a_swap():
+    """
+    a request started before the swap finishes on the old models
+    """
+    registry = ModelRegistry('v1')
+    registry.update({'model': 'model v1'})
+    with registry.use() as models:
+        registry.activate('v2', {'model': 'model v2'})
+        assert models['model'] == 'model v1'
+        assert registry.previous.in_flight == 1
+        with registry.use() as new_models:
+            assert new_models['model'] == 'model v2'
+    assert registry.previous.in_flight == 0
+    assert registry.stats()['active']['version'] == 'v2'
+    assert registry.stats()['previous']['version'] == 'v1'
+
+
+def test_rollback_swaps_the_versions():
+    """
+    the previous version comes back, and the rolled back one can be restored
+    """
+    registry = ModelRegistry('v1')
+    registry.update({'model': 'model v1'})
+    registry.activate('v2', {'model': 'model v2'})
+    registry.rollback()
+    with registry.use() as models:
+        assert models['model'] == 'model v1'
+    assert registry.previous.version == 'v2'
+    registry.rollback()
+    assert registry.active.version == 'v2'
+
+
+def test_rollback_needs_a_previous_version():
+    """
+    there is nothing to roll back to before the first swap
+    """
+    registry = ModelRegistry('v1')
+    with pytest.raises(ValueError):
+        registry.rollback()
+
+
+def test_changes_are_reported():
+    """
+    every change of the active set calls the callbacks, e.g. to clear caches
+    """
+    registry = ModelRegistry('v1')
+    changes: List[str] = []
+    registry.on_change.append(lambda: changes.append(registry.active.version))
+    registry.update({'model': 'model v1'})
+    registry.activate('v2', {'model': 'model v2'})
+    registry.rollback()
+    assert changes == ['v1', 'v2', 'v1']
+
+
+def test_drain_waits_for_requests_on_the_old_version():
+    """
+    draining finishes once the last request using the set exits
+    """
+    async def scenario() -> None:
+        registry = ModelRegistry('v1')
+        old = registry.active
+
+        async def request() -> None:
+            with registry.use():
+                await asyncio.sleep(.05)
+        running = asyncio.ensure_future(request())
+        await asyncio.sleep(0)
+        registry.activate('v2', {})
+        assert await ModelRegistry.drain(old, timeout=5., poll_interval=.01)
+        assert running.done()
+        await running
+    _run(scenario())
+
+
+def test_drain_gives_up_after_the_timeout():
+    """
+    a request that never finishes does not block the reload forever
+    """
+    async def scenario() -> None:
+        registry = ModelRegistry('v1')
+        with registry.use() as models:
+            assert not await ModelRegistry.drain(models, timeout=.02, poll_interval=.01)
+    _run(scenario())
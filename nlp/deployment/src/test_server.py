@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+server tests, with the fixture models
+"""
+# the tests drive the server module's internals directly
+# pylint: disable=protected-access
+
+import json
+import socket
+import asyncio
+import pytest
+import urllib.error
+import urllib.request
+
+from typing import Any, Awaitable, Dict, Tuple
+from aiohttp import web
+from src import server
+from src.config import read_config
+from src.fixture_models import fixture_model_loaders
+from src.initialize_models import RLP_MODEL
+from src.workers import create_listening_socket
+
+
+def _run(coroutine: Awaitable[Any]) -> Any:
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    """
+    a single inference thread, and an elasticsearch host that is never called
+    """
+    monkeypatch.setenv('ELASTICSEARCH_HOST', 'http://127.0.0.1:9')
+    monkeypatch.setenv('NLP_INFERENCE_WORKERS', '1')
+    monkeypatch.setenv('NLP_WORKERS', '1')
+    read_config()
+
+
+def test_reload_recovers_a_model_that_failed_at_startup():
+    """
+    a model that failed to load is served, and reported ready, once a reload loads it
+    """
+    async def scenario() -> None:
+        loaders = fixture_model_loaders()
+        reload_loaders = dict(loaders)
+
+        def fail() -> Any:
+            raise OSError('graph file not found')
+        loaders[RLP_MODEL] = fail
+        runner = web.AppRunner(server._create_app(loaders, reload_loaders, [], write_swagger_spec=False))
+        await runner.setup()
+        try:
+            await server.model_loading_task
+            assert (await server.ready()).status == 503
+            assert server.model_status[RLP_MODEL] == server.FAILED_STATUS
+            with pytest.raises(web.HTTPServiceUnavailable):
+                server._require_models(RLP_MODEL)
+
+            await server.model_reloader.reload()
+            assert (await server.ready()).status == 200
+            server._require_models(RLP_MODEL)
+
+            # the startup version lacks the model again
+            server.model_registry.rollback()
+            assert server.model_status[RLP_MODEL] == server.FAILED_STATUS
+        finally:
+            await runner.cleanup()
+    _run(scenario())
+
+
+def test_invalid_batches_are_bad_requests(monkeypatch):
+    """
+    a missing, malformed or oversized list of queries is the client's error
+    """
+    monkeypatch.setenv('NLP_MAX_BATCH_QUERIES', '2')
+    read_config()
+    assert server._read_queries({'queries': ['a', 1]}) == ['a', '1']
+    for body in [{}, {'queries': 'a'}, {'queries': ['a', 'b', 'c']}]:
+        with pytest.raises(web.HTTPBadRequest):
+            server._read_queries(body)
+
+
+def test_ready_reports_loading_during_the_preload():
+    """
+    with several workers, the socket answers while the parent preloads, and
+    stays open for the workers afterwards
+    """
+    sock = create_listening_socket('127.0.0.1', 0)
+    url = f'http://127.0.0.1:{sock.getsockname()[1]}'
+    loaders = fixture_model_loaders()
+
+    def get(path: str) -> Tuple[int, str]:
+        try:
+            with urllib.request.urlopen(url + path, timeout=10) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as err:
+            return err.code, err.read().decode('utf-8')
+
+    responses: Dict[str, Tuple[int, str]] = {}
+
+    def preload() -> Dict[str, Any]:
+        for path in ['/ping', '/ready', '/predict']:
+            responses[path] = get(path)
+        return loaders
+    try:
+        assert server._preload(sock, list(loaders.keys()), preload) is loaders
+        assert responses['/ping'][0] == 200
+        status, body = responses['/ready']
+        assert status == 503
+        assert json.loads(body)['models'] == {name: server.LOADING_STATUS for name in loaders}
+        assert responses['/predict'][0] == 503
+        # the shared socket still listens, connections queue until the workers accept them
+        socket.create_connection(sock.getsockname(), timeout=10).close()
+    finally:
+        sock.close()
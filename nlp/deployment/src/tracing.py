@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+request tracing
+
+per-request breakdown of the time spent in each phase of a prediction.
+clients opt in with the X-Trace header or the trace query parameter and
+get the breakdown back in a Server-Timing header. requests slower than a
+threshold are logged with their breakdown and query either way
+"""
+
+import json
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+from aiohttp import web
+from loguru import logger
+
+TRACE_HEADER: str = 'X-Trace'
+TRACE_QUERY_PARAM: str = 'trace'
+SERVER_TIMING_HEADER: str = 'Server-Timing'
+
+# time spent waiting rather than working, only recorded in traces
+ADMISSION_WAIT_PHASE: str = 'admission_wait'
+BATCH_WAIT_PHASE: str = 'batch_wait'
+
+# longest query kept in the slow request log
+_MAX_LOGGED_QUERY_LENGTH: int = 1000
+
+
+class RequestTrace:
+    """
+    seconds spent in every phase of a single request
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, seconds: float) -> None:
+        """
+        add time to a phase. a phase entered several times is summed
+        """
+        self.phases[phase] = self.phases.get(phase, 0.) + seconds
+
+    def breakdown(self, total: float) -> Dict[str, float]:
+        """
+        milliseconds per phase, and for the whole request
+        """
+        res = {phase: seconds * 1000. for phase, seconds in self.phases.items()}
+        res['total'] = total * 1000.
+        return res
+
+    def server_timing(self, total: float) -> str:
+        """
+        the breakdown as a Server-Timing header value
+        """
+        return ', '.join(f'{phase};dur={duration:.3f}'
+                         for phase, duration in self.breakdown(total).items())
+
+
+class TraceGroup:
+    """
+    forwards phases to several traces, e.g. for a batch shared by several requests
+    """
+
+    def __init__(self, traces: List[RequestTrace]):
+        self.traces = traces
+
+    def add(self, phase: str, seconds: float) -> None:
+        """
+        add time to the phase of every trace
+        """
+        for trace in self.traces:
+            trace.add(phase, seconds)
+
+
+# trace of the request being handled. context variables are copied into
+# tasks, and run_inference copies them into the inference threads
+_current_trace: 'ContextVar[Optional[RequestTrace]]' = ContextVar('request_trace', default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    """
+    trace of the current request, none if it is not traced
+    """
+    return _current_trace.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[Any]) -> Iterator[None]:
+    """
+    record the phases of the enclosed block in the given trace
+    """
+    token = _current_trace.set(trace)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """
+    add time to a phase of the current trace, if any
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(phase, seconds)
+
+
+def _tracing_requested(request: web.Request) -> bool:
+    flag = request.headers.get(TRACE_HEADER, request.query.get(TRACE_QUERY_PARAM))
+    return flag is not None and flag.lower() not in ['', '0', 'false']
+
+
+async def _request_query(request: web.Request) -> Any:
+    """
+    query of a prediction request, for the slow request log. the handler
+    already read the body, so this does not wait on the client
+    """
+    if not request.can_read_body or request.content_type != 'application/json':
+        return None
+    try:
+        json_data = await request.json()
+    except Exception:
+        return None
+    if not isinstance(json_data, dict):
+        return None
+    query = json_data.get('query', json_data.get('queries'))
+    if query is None:
+        return None
+    if isinstance(query, list):
+        return [str(elem)[:_MAX_LOGGED_QUERY_LENGTH] for elem in query[:10]]
+    return str(query)[:_MAX_LOGGED_QUERY_LENGTH]
+
+
+def configure_slow_request_log(path: Optional[str]) -> None:
+    """
+    also write the slow request log to its own file, one json object per line
+    """
+    if path is None:
+        return
+    logger.add(path, format='{message}', filter=lambda record: record['extra'].get('slow_request', False))
+
+
+def tracing_middleware(slow_request_ms: float):
+    """
+    middleware tracing opted-in requests, and every request when the slow
+    request log is enabled (slow_request_ms > 0)
+    """
+    slow_request = slow_request_ms / 1000.
+
+    @web.middleware
+    async def middleware(request: web.Request,
+                         handler: Callable[[web.Request], Awaitable[web.StreamResponse]]
+                         ) -> web.StreamResponse:
+        traced = _tracing_requested(request)
+        if not traced and slow_request <= 0:
+            return await handler(request)
+        trace = RequestTrace()
+        status = 500
+        start = time.perf_counter()
+        try:
+            with use_trace(trace):
+                response = await handler(request)
+            status = response.status
+            if traced:
+                response.headers[SERVER_TIMING_HEADER] = trace.server_timing(time.perf_counter() - start)
+            return response
+        except web.HTTPException as err:
+            status = err.status
+            if traced:
+                err.headers[SERVER_TIMING_HEADER] = trace.server_timing(time.perf_counter() - start)
+            raise
+        finally:
+            total = time.perf_counter() - start
+            if 0 < slow_request <= total:
+                logger.bind(slow_request=True).warning(json.dumps({
+                    'path': request.path,
+                    'method': request.method,
+                    'status': status,
+                    'query': await _request_query(request),
+                    'phases_ms': trace.breakdown(total),
+                }))
+    return middleware
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+pre-fork workers
+
+runs several server processes accepting on the same listening socket.
+read-only python structures loaded before forking are shared between the
+workers through copy-on-write
+"""
+
+import gc
+import os
+import signal
+import socket
+
+from typing import Callable, Dict
+from loguru import logger
+
+
+def configure_tensorflow_threads(intra_op_threads: int, inter_op_threads: int) -> None:
+    """
+    size tensorflow's thread pools. must run before tensorflow executes any op
+    in this process. 0 leaves tensorflow's default
+    """
+    import tensorflow as tf
+    if intra_op_threads > 0:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+
+
+def create_listening_socket(host: str, port: int) -> socket.socket:
+    """
+    bind the socket shared by all workers
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _spawn_worker(index: int, run_worker: Callable[[int], None]) -> int:
+    pid = os.fork()
+    if pid != 0:
+        return pid
+    # child: restore default signal handling and serve until stopped
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    exit_code = 0
+    try:
+        run_worker(index)
+    except BaseException:
+        logger.exception(f'worker {index} crashed')
+        exit_code = 1
+    finally:
+        # never return into the parent's code path
+        os._exit(exit_code)
+    return 0
+
+
+def run_workers(num_workers: int, run_worker: Callable[[int], None]) -> None:
+    """
+    fork num_workers processes running run_worker(worker_index) and supervise
+    them, replacing workers that die, until the parent is asked to stop
+    """
+    # objects allocated so far (e.g. a preloaded graph) are never collected,
+    # so the garbage collector does not write to their pages and trigger
+    # copy-on-write in every worker
+    gc.collect()
+    gc.freeze()
+
+    stopping = False
+
+    def stop(signum, _frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    workers: Dict[int, int] = {}
+    for index in range(num_workers):
+        workers[_spawn_worker(index, run_worker)] = index
+    logger.info(f'started {num_workers} workers: {list(workers.keys())}')
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while len(workers) > 0:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if index is None:
+            continue
+        if stopping:
+            logger.info(f'worker {index} ({pid}) stopped')
+            continue
+        logger.error(f'worker {index} ({pid}) exited with status {status}, restarting')
+        workers[_spawn_worker(index, run_worker)] = index
@@ -0,0 +1,86 @@
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("training")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import sys
+import json
+import time
+import argparse
+import pandas as pd
+
+from typing import List
+from loguru import logger
+from language_prediction.tokenizer import LanguagePredictionTokenizer, mismatches
+from utils.utils import get_file_path_relative, read_from_disk
+from utils.variables import data_folder, clean_data_folder, language_prediction_data_folder, clean_data_file_name
+
+
+def _load_titles() -> List[str]:
+    """
+    titles of the clean language prediction data, the sentences tokenized in training
+    """
+    clean_folder = get_file_path_relative(os.path.join(data_folder, clean_data_folder, language_prediction_data_folder))
+    frames = read_from_disk(os.path.join(clean_folder, f'{clean_data_file_name}.tgz'), extension='tgz')
+    return pd.concat([frame['title'] for frame in frames]).astype(str).tolist()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--max-sequence-length', type=int, default=64)
+    args = parser.parse_args()
+
+    titles = _load_titles()
+    if len(titles) == 0:
+        raise RuntimeError('no titles found in the clean language prediction data')
+    tokenizer = LanguagePredictionTokenizer(args.max_sequence_length)
+    # load the slow tokenizer before timing it
+    tokenizer.tokenize_slow(titles[:1])
+
+    results = {}
+    identical = True
+    for size in args.sizes:
+        # repeat the titles when there are fewer than requested
+        sentences = (titles * (size // len(titles) + 1))[:size]
+        logger.info(f'tokenizing {size} sentences')
+        start = time.perf_counter()
+        expected = tokenizer.tokenize_slow(sentences)
+        slow = time.perf_counter() - start
+        start = time.perf_counter()
+        actual = tokenizer.tokenize(sentences)
+        fast = time.perf_counter() - start
+        different = mismatches(expected, actual)
+        identical = identical and len(different) == 0
+        results[size] = {
+            'slow_s': slow,
+            'fast_s': fast,
+            'speedup': slow / fast,
+            'fast_sentences_per_sec': size / fast,
+            'mismatches': len(different),
+            'mismatch_examples': [sentences[i] for i in different[:5]],
+        }
+    print(json.dumps(results, indent=2))
+    if not identical:
+        logger.error('fast tokenization differs from the reference tokenizer')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
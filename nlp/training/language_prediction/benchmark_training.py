@@ -0,0 +1,79 @@
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("training")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+from tempfile import TemporaryDirectory
+from loguru import logger
+
+
+def main() -> None:
+    """
+    train for a fixed number of steps with an increasing number of local
+    workers and report the training examples per second of each run
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--batch-size', type=int, default=64, help='batch size of every worker')
+    parser.add_argument('--steps', type=int, default=50, help='training steps of every run')
+    parser.add_argument('--tfrecord-cache', action='store_true',
+                        help='read the training data from the tokenized tfrecord cache instead of streaming the clean data')
+    args = parser.parse_args()
+
+    main_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    results = []
+    with TemporaryDirectory(prefix='benchmark_training_') as output_dir:
+        for workers in args.workers:
+            throughput_file = os.path.join(output_dir, f'{workers}.json')
+            logger.info(f'training {args.steps} steps with {workers} workers')
+            subprocess.run([
+                sys.executable, main_script,
+                '--tfrecord-cache' if args.tfrecord_cache else '--streaming',
+                '--workers', str(workers),
+                '--batch-size', str(args.batch_size),
+                '--steps-per-epoch', str(args.steps),
+                '--throughput-file', throughput_file,
+                '--skip-export',
+                # a fresh run every time, never resumed from the previous one
+                '--training-checkpoint-dir', os.path.join(output_dir, f'{workers}_checkpoints'),
+                '--restart',
+            ], check=True)
+            with open(throughput_file) as result_file:
+                epochs = json.load(result_file)['epochs']
+            results.append({'workers': workers, 'examples_per_sec': epochs[-1]['examples_per_sec']})
+
+    baseline = results[0]
+    for result in results:
+        result['speedup'] = result['examples_per_sec'] / baseline['examples_per_sec']
+        # 1 is perfect linear scaling from the first run
+        result['efficiency'] = result['speedup'] * baseline['workers'] / result['workers']
+    print(json.dumps({
+        'batch_size_per_worker': args.batch_size,
+        'steps': args.steps,
+        'runs': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+resumable training
+
+saves the model, the optimizer and the early stopping state after every
+epoch, resumes from the latest save when training is started again, stops
+once the validation loss has not improved for a number of epochs, and
+restores the weights of the best epoch at the end
+"""
+
+import os
+import math
+import tensorflow as tf
+
+from loguru import logger
+from language_prediction.distributed import is_chief, worker_index
+
+LATEST_FOLDER: str = 'latest'
+BEST_FOLDER: str = 'best'
+
+
+class TrainingCheckpoint(tf.keras.callbacks.Callback):
+    """
+    per-epoch checkpoints and early stopping that survive restarts
+    """
+
+    def __init__(self, model: tf.keras.Model, checkpoint_dir: str, patience: int, monitor: str = 'val_loss',
+                 min_delta: float = 0., max_to_keep: int = 2):
+        """
+        model must be compiled, its optimizer is saved with it. training stops
+        when monitor has not decreased by more than min_delta for patience epochs
+        """
+        super(TrainingCheckpoint, self).__init__()
+        self.tracked_model = model
+        self.checkpoint_dir = checkpoint_dir
+        self.patience = patience
+        self.monitor = monitor
+        self.min_delta = min_delta
+        self.epoch = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.best = tf.Variable(math.inf, dtype=tf.float64, trainable=False)
+        self.wait = tf.Variable(0, dtype=tf.int64, trainable=False)
+        self.stopped = tf.Variable(False, trainable=False)
+        self.checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer, epoch=self.epoch,
+                                              best=self.best, wait=self.wait, stopped=self.stopped)
+        self.best_checkpoint = tf.train.Checkpoint(model=model)
+        # with several workers every one saves, but only the chief's saves are kept and restored
+        save_dir = checkpoint_dir if is_chief() else os.path.join(checkpoint_dir, f'worker_{worker_index()}')
+        self.latest_manager = tf.train.CheckpointManager(
+            self.checkpoint, os.path.join(save_dir, LATEST_FOLDER), max_to_keep=max_to_keep)
+        self.best_manager = tf.train.CheckpointManager(
+            self.best_checkpoint, os.path.join(save_dir, BEST_FOLDER), max_to_keep=1)
+
+    def restore(self) -> int:
+        """
+        restore the latest checkpoint, if any, and return the epoch to resume from.
+        optimizer slots created later in training are restored when they are created
+        """
+        latest = tf.train.latest_checkpoint(os.path.join(self.checkpoint_dir, LATEST_FOLDER))
+        if latest is None:
+            return 0
+        self.checkpoint.restore(latest)
+        logger.info(f'resuming training from {latest}: epoch {int(self.epoch.numpy())}, '
+                    f'best {self.monitor} {float(self.best.numpy())}')
+        return int(self.epoch.numpy())
+
+    def finished(self, epochs: int) -> bool:
+        """
+        whether the restored training already stopped early or ran all epochs
+        """
+        return bool(self.stopped.numpy()) or int(self.epoch.numpy()) >= epochs
+
+    def restore_best(self) -> None:
+        """
+        restore the weights of the epoch with the best validation loss
+        """
+        best = tf.train.latest_checkpoint(os.path.join(self.checkpoint_dir, BEST_FOLDER))
+        if best is None:
+            return
+        # the best checkpoint holds the model only
+        self.best_checkpoint.restore(best).expect_partial()
+        logger.info(f'restored the best model, {self.monitor} {float(self.best.numpy())}')
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        self.epoch.assign(epoch + 1)
+        current = logs.get(self.monitor)
+        if current is None:
+            logger.warning(f'{self.monitor} is not available, early stopping is disabled for this epoch')
+        elif current < float(self.best.numpy()) - self.min_delta:
+            self.best.assign(current)
+            self.wait.assign(0)
+            self.best_manager.save(checkpoint_number=epoch + 1)
+        else:
+            self.wait.assign_add(1)
+            if int(self.wait.numpy()) >= self.patience:
+                logger.info(f'{self.monitor} has not improved for {self.patience} epochs, stopping')
+                self.stopped.assign(True)
+                self.model.stop_training = True
+        # saved last, so that a crash while saving resumes from the previous epoch
+        self.latest_manager.save(checkpoint_number=epoch + 1)
+
+    def on_train_end(self, logs=None):
+        self.restore_best()
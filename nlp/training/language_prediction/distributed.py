@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+local data-parallel training
+
+runs the training script in several local worker processes that train one
+model together with tensorflow's multi worker mirrored strategy. every
+worker is pinned to its own share of the cores, reads its own shard of the
+input, and the gradients are all-reduced between the workers every step
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+import tensorflow as tf
+
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+# set by the launcher in the environment of the local workers
+LOCAL_WORKERS_ENV: str = 'LANGUAGE_PREDICTION_LOCAL_WORKERS'
+
+
+def _free_ports(count: int) -> List[int]:
+    """
+    ports that are free on localhost right now
+    """
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('localhost', 0))
+            sockets.append(sock)
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+def is_local_worker() -> bool:
+    """
+    whether this process is a worker started by launch_local_workers
+    """
+    return LOCAL_WORKERS_ENV in os.environ
+
+
+def worker_index() -> int:
+    """
+    index of this worker in the cluster, 0 is the chief
+    """
+    tf_config = json.loads(os.environ.get('TF_CONFIG', '{}'))
+    return int(tf_config.get('task', {}).get('index', 0))
+
+
+def is_chief() -> bool:
+    """
+    whether this worker writes the model files
+    """
+    return worker_index() == 0
+
+
+def launch_local_workers(num_workers: int, argv: Optional[List[str]] = None) -> int:
+    """
+    run the current script in num_workers processes with the same arguments
+    and a cluster spec of local workers, and wait for them. if a worker
+    fails, the others are stopped. returns the exit code of the run
+    """
+    argv = sys.argv if argv is None else argv
+    workers = [f'localhost:{port}' for port in _free_ports(num_workers)]
+    processes: List[subprocess.Popen] = []
+    for index in range(num_workers):
+        env = dict(os.environ)
+        env['TF_CONFIG'] = json.dumps({'cluster': {'worker': workers}, 'task': {'type': 'worker', 'index': index}})
+        env[LOCAL_WORKERS_ENV] = str(num_workers)
+        processes.append(subprocess.Popen([sys.executable] + argv, env=env))
+    logger.info(f'started {num_workers} training workers: {", ".join(workers)}')
+
+    exit_code = 0
+    running = list(processes)
+    while len(running) > 0:
+        for process in list(running):
+            code = process.poll()
+            if code is None:
+                continue
+            running.remove(process)
+            if code != 0 and exit_code == 0:
+                exit_code = code
+                logger.error(f'training worker {processes.index(process)} exited with code {code}, stopping the others')
+                # the others would block forever in the next all-reduce
+                for other in running:
+                    other.terminate()
+        time.sleep(.5)
+    return exit_code
+
+
+def configure_worker_threads(num_workers: int) -> None:
+    """
+    pin this worker to its share of the cores and size tensorflow's thread
+    pools to it, so that the workers do not oversubscribe the machine. must
+    run before tensorflow executes any op in this process
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    cores_per_worker = max(len(cores) // num_workers, 1)
+    start = (worker_index() * cores_per_worker) % len(cores)
+    worker_cores = cores[start:start + cores_per_worker]
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, worker_cores)
+    tf.config.threading.set_intra_op_parallelism_threads(len(worker_cores))
+    # one pool thread for the model ops, one for the input pipeline
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+    logger.info(f'training worker {worker_index()} pinned to cores {worker_cores}')
+
+
+def shard_dataset(dataset: tf.data.Dataset, by_file: bool = False) -> tf.data.Dataset:
+    """
+    set how the strategy splits the input between workers: by input file if
+    every worker gets at least one, else every worker reads the whole input
+    and keeps its share of the examples
+    """
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.FILE \
+        if by_file else tf.data.experimental.AutoShardPolicy.DATA
+    return dataset.with_options(options)
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """
+    training examples per second of every epoch, over all workers. the first
+    batch of an epoch is not timed, it includes tracing and input warm up
+    """
+
+    def __init__(self, global_batch_size: int, num_workers: int, output_path: Optional[str] = None):
+        super(ThroughputLogger, self).__init__()
+        self.global_batch_size = global_batch_size
+        self.num_workers = num_workers
+        self.output_path = output_path
+        self.epochs: List[Dict[str, Any]] = []
+        self._start: float = 0.
+        self._batches: int = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = 0.
+        self._batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        if self._batches == 0:
+            self._start = time.perf_counter()
+        self._batches += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self._batches < 2:
+            return
+        elapsed = time.perf_counter() - self._start
+        examples_per_sec = (self._batches - 1) * self.global_batch_size / elapsed
+        self.epochs.append({'epoch': epoch, 'examples_per_sec': examples_per_sec})
+        logger.info(f'epoch {epoch}: {examples_per_sec:.1f} training examples/sec with {self.num_workers} workers')
+
+    def on_train_end(self, logs=None):
+        if self.output_path is None or not is_chief():
+            return
+        with open(self.output_path, 'w') as output_file:
+            json.dump({
+                'workers': self.num_workers,
+                'global_batch_size': self.global_batch_size,
+                'epochs': self.epochs,
+            }, output_file)
@@ -0,0 +1,132 @@
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("training")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import json
+import time
+import yaml
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from typing import Dict, List, Tuple
+from loguru import logger
+from language_prediction.prepare_data import prepare_data
+from language_prediction.tokenizer import LanguagePredictionTokenizer
+from utils.utils import get_file_path_relative, read_from_disk
+from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, \
+    clean_data_file_name, classes_file, language_prediction_serving_folder, serving_input_names, \
+    language_prediction_tokenizer_folder
+
+
+def _timed_scores(serve, inputs) -> Tuple[np.ndarray, float]:
+    kwargs = {name: tf.constant(value) for name, value in zip(serving_input_names, inputs)}
+    start = time.perf_counter()
+    scores = serve(**kwargs)['scores'].numpy()
+    return scores, time.perf_counter() - start
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000.,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000.,
+    }
+
+
+@logger.catch
+def main() -> None:
+    """
+    compare the holdout accuracy and the latency of fixed length padding with
+    length bucketed padding, using the exported serving signature
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--buckets', type=int, nargs='+', default=[16, 32, 64])
+    parser.add_argument('--limit', type=int, default=10000, help='maximum number of holdout examples')
+    args = parser.parse_args()
+
+    clean_folder = get_file_path_relative(os.path.join(data_folder, clean_data_folder, language_prediction_data_folder))
+    _ = read_from_disk(os.path.join(clean_folder, f'{clean_data_file_name}.tgz'), extension='tgz', extract_only=True)
+    with open(os.path.join(clean_folder, classes_file)) as stream:
+        classes = yaml.safe_load(stream)
+    _, x_test, _, y_test = prepare_data(clean_folder, f'{clean_data_file_name}.tgz', classes)
+    x_test, y_test = x_test[:args.limit], y_test[:args.limit]
+
+    model_folder = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder))
+    serving_dir = os.path.join(model_folder, language_prediction_serving_folder)
+    serve = tf.saved_model.load(serving_dir).signatures['serving_default']
+    if serve.structured_input_signature[1][serving_input_names[0]].shape[1] is not None:
+        raise RuntimeError(f'the serving signature at {serving_dir} has a fixed sequence length, export it again with this version')
+
+    # the tokenizer saved by training, which the server tokenizes with
+    tokenizer = LanguagePredictionTokenizer.load(os.path.join(model_folder, language_prediction_tokenizer_folder))
+    if tokenizer.classes != classes:
+        raise ValueError(f'tokenizer has classes {tokenizer.classes}, expected {classes}')
+    # compile / initialize every shape before timing
+    for length in set(args.buckets + [tokenizer.max_sequence_length]):
+        dummy = np.zeros((args.batch_size, length), dtype=np.int32)
+        _timed_scores(serve, (dummy, dummy, dummy))
+
+    fixed_scores: List[np.ndarray] = []
+    bucketed_scores: List[np.ndarray] = []
+    fixed_latencies: Dict[int, List[float]] = {}
+    bucketed_latencies: Dict[int, List[float]] = {}
+    for start in range(0, len(x_test), args.batch_size):
+        batch = list(x_test[start:start + args.batch_size])
+        fixed, fixed_latency = _timed_scores(serve, tokenizer.tokenize(batch))
+        bucketed_inputs = tokenizer.tokenize(batch, args.buckets)
+        bucketed, bucketed_latency = _timed_scores(serve, bucketed_inputs)
+        fixed_scores.append(fixed)
+        bucketed_scores.append(bucketed)
+        if len(batch) == args.batch_size:
+            # the last, partial batch has a shape of its own
+            bucket = bucketed_inputs[0].shape[1]
+            fixed_latencies.setdefault(bucket, []).append(fixed_latency)
+            bucketed_latencies.setdefault(bucket, []).append(bucketed_latency)
+
+    fixed_all = np.concatenate(fixed_scores)
+    bucketed_all = np.concatenate(bucketed_scores)
+    labels = np.argmax(y_test, axis=1)
+    accuracy_fixed = float(np.mean(np.argmax(fixed_all, axis=1) == labels))
+    accuracy_bucketed = float(np.mean(np.argmax(bucketed_all, axis=1) == labels))
+    num_batches = sum(len(latencies) for latencies in bucketed_latencies.values())
+    print(json.dumps({
+        'examples': len(x_test),
+        'batch_size': args.batch_size,
+        'buckets': args.buckets,
+        'accuracy_fixed': accuracy_fixed,
+        'accuracy_bucketed': accuracy_bucketed,
+        'accuracy_delta': accuracy_bucketed - accuracy_fixed,
+        'prediction_agreement': float(np.mean(np.argmax(fixed_all, axis=1) == np.argmax(bucketed_all, axis=1))),
+        'max_score_difference': float(np.max(np.abs(fixed_all - bucketed_all))),
+        'latency_per_bucket': {
+            bucket: {
+                'batches': len(bucketed_latencies[bucket]),
+                'share': len(bucketed_latencies[bucket]) / num_batches,
+                'fixed': _percentiles(fixed_latencies[bucket]),
+                'bucketed': _percentiles(bucketed_latencies[bucket]),
+                'speedup': sum(fixed_latencies[bucket]) / sum(bucketed_latencies[bucket]),
+            } for bucket in sorted(bucketed_latencies.keys())
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("training")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import json
+import time
+import yaml
+import argparse
+import numpy as np
+import tensorflow as tf
+
+from typing import Any, Callable, Dict, List, Tuple
+from loguru import logger
+from language_prediction.prepare_data import prepare_data
+from language_prediction.tokenizer import LanguagePredictionTokenizer
+from language_prediction.quantization import TFLiteLanguageModel
+from utils.utils import get_file_path_relative, read_from_disk
+from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, \
+    clean_data_file_name, classes_file, language_prediction_serving_folder, language_prediction_tflite_file, \
+    language_prediction_tokenizer_folder, serving_input_names
+
+
+def _size_on_disk(path: str) -> int:
+    """
+    size of a file, or of all files in a directory, in bytes
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file_name))
+               for root, _dirs, files in os.walk(path) for file_name in files)
+
+
+def _evaluate(predict: Callable[[Any], np.ndarray], batches: List[Tuple[np.ndarray, np.ndarray, np.ndarray]]
+              ) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    scores of every batch, and the latency of full batches
+    """
+    # initialize kernels before timing
+    predict(batches[0])
+    scores: List[np.ndarray] = []
+    latencies: List[float] = []
+    for inputs in batches:
+        start = time.perf_counter()
+        scores.append(np.asarray(predict(inputs)))
+        if len(inputs[0]) == len(batches[0][0]):
+            latencies.append(time.perf_counter() - start)
+    return np.concatenate(scores), {
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000.,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000.,
+        'examples_per_sec': len(batches[0][0]) * len(latencies) / sum(latencies),
+    }
+
+
+@logger.catch
+def main() -> None:
+    """
+    compare the quantized tflite model with the float serving signature on the holdout set
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--limit', type=int, default=10000, help='maximum number of holdout examples')
+    args = parser.parse_args()
+
+    clean_folder = get_file_path_relative(os.path.join(data_folder, clean_data_folder, language_prediction_data_folder))
+    _ = read_from_disk(os.path.join(clean_folder, f'{clean_data_file_name}.tgz'), extension='tgz', extract_only=True)
+    with open(os.path.join(clean_folder, classes_file)) as stream:
+        classes = yaml.safe_load(stream)
+    _, x_test, _, y_test = prepare_data(clean_folder, f'{clean_data_file_name}.tgz', classes)
+    x_test, y_test = x_test[:args.limit], y_test[:args.limit]
+
+    model_folder = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder))
+    serving_dir = os.path.join(model_folder, language_prediction_serving_folder)
+    tflite_path = os.path.join(model_folder, language_prediction_tflite_file)
+    serve = tf.saved_model.load(serving_dir).signatures['serving_default']
+    quantized_model = TFLiteLanguageModel(tflite_path)
+
+    def float_model(inputs) -> np.ndarray:
+        return serve(**{name: tf.constant(value) for name, value in zip(serving_input_names, inputs)})['scores']
+
+    # the tokenizer saved by training, which the server tokenizes with
+    tokenizer = LanguagePredictionTokenizer.load(os.path.join(model_folder, language_prediction_tokenizer_folder))
+    if tokenizer.classes != classes:
+        raise ValueError(f'tokenizer has classes {tokenizer.classes}, expected {classes}')
+    batches = [tokenizer.tokenize(list(x_test[start:start + args.batch_size]))
+               for start in range(0, len(x_test), args.batch_size)]
+    logger.info(f'evaluating {len(x_test)} holdout examples')
+    float_scores, float_latency = _evaluate(float_model, batches)
+    quantized_scores, quantized_latency = _evaluate(quantized_model, batches)
+
+    labels = np.argmax(y_test, axis=1)
+    accuracy_float = float(np.mean(np.argmax(float_scores, axis=1) == labels))
+    accuracy_quantized = float(np.mean(np.argmax(quantized_scores, axis=1) == labels))
+    float_size = _size_on_disk(serving_dir)
+    quantized_size = _size_on_disk(tflite_path)
+    print(json.dumps({
+        'examples': len(x_test),
+        'batch_size': args.batch_size,
+        'accuracy_float': accuracy_float,
+        'accuracy_quantized': accuracy_quantized,
+        'accuracy_delta': accuracy_quantized - accuracy_float,
+        'prediction_agreement': float(np.mean(np.argmax(float_scores, axis=1) == np.argmax(quantized_scores, axis=1))),
+        'size_float_bytes': float_size,
+        'size_quantized_bytes': quantized_size,
+        'size_ratio': quantized_size / float_size,
+        'latency_float': float_latency,
+        'latency_quantized': quantized_latency,
+        'speedup': float_latency['p50_ms'] / quantized_latency['p50_ms'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
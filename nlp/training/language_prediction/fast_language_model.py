@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+fast language model
+
+tiny language classifier, a linear model over hashed word and character
+n-grams. it runs in well under a millisecond per query, so the server asks
+it first and only sends queries it is unsure about to the albert model.
+only the weights are saved, as numpy arrays, so that a model trained with
+one scikit-learn version loads with another
+"""
+
+import numpy as np
+import scipy.sparse as sp
+
+from typing import List, Sequence
+from scipy.special import expit
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+
+
+class FastLanguageModel:
+    """
+    hashed n-gram features and a logistic regression trained with sgd
+    """
+
+    def __init__(self, classes: List[str], n_features: int = 2 ** 20, alpha: float = 1e-6, max_iter: int = 20):
+        self.classes = list(classes)
+        self.n_features = n_features
+        # hashing needs no vocabulary, so the model stays small and has nothing to fit
+        self.word_vectorizer = HashingVectorizer(
+            n_features=n_features, ngram_range=(1, 2), alternate_sign=False, lowercase=True,
+            token_pattern=r'[^\s]+')
+        self.char_vectorizer = HashingVectorizer(
+            n_features=n_features, analyzer='char_wb', ngram_range=(2, 4), alternate_sign=False, lowercase=True)
+        self.classifier = SGDClassifier(loss='log', alpha=alpha, max_iter=max_iter, tol=None, random_state=0)
+        # weights of the trained classifier: one row per class seen in training,
+        # a single row with two classes
+        self.coef: np.ndarray = None
+        self.intercept: np.ndarray = None
+        # index in classes of every class seen in training
+        self.class_indices: np.ndarray = None
+
+    def _features(self, sentences: Sequence[str]) -> sp.csr_matrix:
+        sentences = list(sentences)
+        return sp.hstack([
+            self.word_vectorizer.transform(sentences),
+            self.char_vectorizer.transform(sentences),
+        ], format='csr')
+
+    def fit(self, sentences: Sequence[str], labels: np.ndarray) -> None:
+        """
+        train on sentences and their one-hot labels, in the order of the classes
+        """
+        self.classifier.fit(self._features(sentences), np.argmax(labels, axis=1))
+        self.coef = self.classifier.coef_.astype(np.float32)
+        self.intercept = self.classifier.intercept_.astype(np.float32)
+        self.class_indices = self.classifier.classes_.astype(np.int64)
+
+    def predict_scores(self, sentences: Sequence[str]) -> np.ndarray:
+        """
+        class probabilities of every sentence, in the order of the classes
+        """
+        scores = np.zeros((len(sentences), len(self.classes)), dtype=np.float32)
+        if len(sentences) == 0:
+            return scores
+        # the probabilities of scikit-learn's logistic sgd: one vs rest, normalized
+        decision = np.asarray(self._features(sentences) @ self.coef.T) + self.intercept
+        probabilities = expit(decision)
+        if probabilities.shape[1] == 1:
+            probabilities = np.hstack([1. - probabilities, probabilities])
+        else:
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+        # classes missing from the training data never get a score
+        scores[:, self.class_indices] = probabilities
+        return scores
+
+    def save(self, path: str) -> None:
+        """
+        save the weights and the feature settings to a single npz file
+        """
+        # np.savez would append .npz to paths without it
+        with open(path, 'wb') as model_file:
+            np.savez_compressed(model_file, classes=np.array(self.classes), n_features=self.n_features,
+                                coef=self.coef, intercept=self.intercept, class_indices=self.class_indices)
+
+    @staticmethod
+    def load(path: str) -> 'FastLanguageModel':
+        """
+        load a model saved with save
+        """
+        with np.load(path) as saved:
+            model = FastLanguageModel(saved['classes'].tolist(), n_features=int(saved['n_features']))
+            model.coef = saved['coef']
+            model.intercept = saved['intercept']
+            model.class_indices = saved['class_indices']
+        return model
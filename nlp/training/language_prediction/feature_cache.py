@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+encoder feature cache
+
+the albert encoder of the language prediction model is frozen, so its
+outputs do not change during training. they are computed once and stored in
+a memory-mapped file, and the head is trained on them, reading one batch at
+a time from disk
+"""
+
+import os
+import math
+import yaml
+import hashlib
+import numpy as np
+import tensorflow as tf
+
+from typing import Any, Dict, List, Sequence, Tuple
+from loguru import logger
+from utils.variables import albert
+
+FEATURES_FILE: str = 'features.npy'
+# attention masks of the features, the head skips the padding
+MASKS_FILE: str = 'masks.npy'
+METADATA_FILE: str = 'metadata.yml'
+# float16 halves the cache, the head computes in float32
+FEATURES_DTYPE: str = 'float16'
+
+
+def features_fingerprint(sentences: Sequence[str], max_sequence_length: int) -> str:
+    """
+    fingerprint of the inputs of the cached features, in order
+    """
+    digest = hashlib.sha1()
+    digest.update(f'{albert}:{max_sequence_length}:{FEATURES_DTYPE}'.encode('utf-8'))
+    for sentence in sentences:
+        digest.update(str(sentence).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def cache_features(model, sentences: Sequence[str], cache_dir: str, batch_size: int = 64
+                   ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    encoder outputs of every sentence, padded to the model's max sequence
+    length, and their attention masks, read from the cache if it was built
+    from the same sentences and written to it otherwise. returns read-only
+    memory maps
+    """
+    fingerprint = features_fingerprint(sentences, model.max_sequence_length)
+    features_path = os.path.join(cache_dir, FEATURES_FILE)
+    masks_path = os.path.join(cache_dir, MASKS_FILE)
+    metadata_path = os.path.join(cache_dir, METADATA_FILE)
+    if os.path.exists(metadata_path):
+        with open(metadata_path) as metadata_file:
+            metadata: Dict[str, Any] = yaml.safe_load(metadata_file)
+        if metadata.get('fingerprint') == fingerprint and os.path.exists(features_path) \
+                and os.path.exists(masks_path):
+            logger.info(f'using cached encoder features from {cache_dir}')
+            return np.load(features_path, mmap_mode='r'), np.load(masks_path, mmap_mode='r')
+        logger.info('encoder feature cache is stale, rebuilding it')
+        # the metadata is written last, so a partly written cache is never used
+        os.remove(metadata_path)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    hidden_size = model.encoder.output_shape[-1]
+    shape = (len(sentences), model.max_sequence_length, hidden_size)
+    logger.info(f'caching encoder features of {len(sentences)} sentences to {features_path}')
+    features = np.lib.format.open_memmap(features_path, mode='w+', dtype=FEATURES_DTYPE, shape=shape)
+    masks = np.lib.format.open_memmap(masks_path, mode='w+', dtype=np.int32, shape=shape[:2])
+    for start in range(0, len(sentences), batch_size):
+        inputs = model.tokenize(list(sentences[start:start + batch_size]))
+        features[start:start + batch_size] = model.encoder(inputs, training=False).numpy()
+        masks[start:start + batch_size] = inputs[1]
+    features.flush()
+    masks.flush()
+    del features, masks
+    with open(metadata_path, 'w') as metadata_file:
+        yaml.dump({'fingerprint': fingerprint, 'shape': list(shape), 'dtype': FEATURES_DTYPE}, metadata_file)
+    logger.success(f'encoder features cached at {cache_dir}')
+    return np.load(features_path, mmap_mode='r'), np.load(masks_path, mmap_mode='r')
+
+
+class CachedFeatureSequence(tf.keras.utils.Sequence):
+    """
+    batches of cached features, their masks and their labels. shuffling
+    reorders the batches but keeps each batch a contiguous slice, so reads
+    from the memory maps stay sequential
+    """
+
+    def __init__(self, features: np.ndarray, masks: np.ndarray, labels: np.ndarray, batch_size: int,
+                 shuffle: bool = True, seed: int = 0):
+        self.features = features
+        self.masks = masks
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self._rng = np.random.RandomState(seed)
+        self._order = np.arange(len(self))
+        self.on_epoch_end()
+
+    def __len__(self) -> int:
+        return math.ceil(len(self.features) / self.batch_size)
+
+    def __getitem__(self, index: int) -> Tuple[List[np.ndarray], np.ndarray]:
+        start = self._order[index] * self.batch_size
+        end = start + self.batch_size
+        return [np.asarray(self.features[start:end], dtype=np.float32), np.asarray(self.masks[start:end])], \
+            self.labels[start:end]
+
+    def on_epoch_end(self) -> None:
+        if self.shuffle:
+            self._rng.shuffle(self._order)
+
+
+def split_cached_features(features: np.ndarray, masks: np.ndarray, labels: np.ndarray, validation_split: float,
+                          batch_size: int) -> Tuple[CachedFeatureSequence, CachedFeatureSequence]:
+    """
+    training and validation batches. like keras' validation_split, the
+    validation set is the last examples
+    """
+    split = int(len(features) * (1. - validation_split))
+    return CachedFeatureSequence(features[:split], masks[:split], labels[:split], batch_size), \
+        CachedFeatureSequence(features[split:], masks[split:], labels[split:], batch_size, shuffle=False)
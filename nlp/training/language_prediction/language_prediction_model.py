@@ -20,12 +20,31 @@ if __name__ == "__main__":
 import numpy as np
 import tensorflow as tf
 
-from typing import List
-from utils.variables import albert
+from typing import List, Optional
+from utils.variables import albert, serving_input_names
 from tensorflow.keras import layers
 from utils.utils import reScribeModel
+from language_prediction.tokenizer import LanguagePredictionTokenizer
 from transformers.modeling_albert import AlbertPreTrainedModel
-from transformers import AlbertTokenizer, AlbertConfig, TFAlbertModel
+from transformers import AlbertConfig, TFAlbertModel
+
+
+class MaskedGlobalMaxPool1D(layers.Layer):
+    """
+    max over the time steps that are not masked
+    """
+
+    def __init__(self, **kwargs):
+        super(MaskedGlobalMaxPool1D, self).__init__(**kwargs)
+        self.supports_masking = True
+
+    def call(self, inputs, mask=None):
+        if mask is not None:
+            inputs = tf.where(tf.expand_dims(mask, -1), inputs, inputs.dtype.min)
+        return tf.reduce_max(inputs, axis=1)
+
+    def compute_mask(self, inputs, mask=None):
+        return None
 
  
 class LanguagePredictionModel(reScribeModel):
@@ -34,38 +53,90 @@ class LanguagePredictionModel(reScribeModel):
         
         assert classes is not None
         self.classes = classes
+        self.max_sequence_length = max_sequence_length
         num_labels = len(classes)
 
-        self.tokenizer = AlbertTokenizer.from_pretrained(
-            albert, do_lower_case=True, add_special_tokens=True, max_length=64, pad_to_max_length=True)
+        self.tokenizer = LanguagePredictionTokenizer(max_sequence_length, classes)
 
         albert_config = self._load_albert_config(num_labels)
         transformer_model = TFAlbertModel.from_pretrained(
             albert, config=albert_config)
+        # the inputs have no fixed length, so batches can be padded to the
+        # longest sequence they contain, up to max_sequence_length
         input_ids = layers.Input(
-            shape=(max_sequence_length,), name='input_ids', dtype='int32')
+            shape=(None,), name='input_ids', dtype='int32')
         input_masks = layers.Input(
-            shape=(max_sequence_length,), name='input_masks_ids', dtype='int32')
+            shape=(None,), name='input_masks_ids', dtype='int32')
         input_segments = layers.Input(
-            shape=(max_sequence_length,), name='input_segments', dtype='int32')
+            shape=(None,), name='input_segments', dtype='int32')
         
         embedding_layer = transformer_model.albert(
             input_ids, attention_mask=input_masks, token_type_ids=input_segments)[0]
-            
-        X = layers.Bidirectional(layers.LSTM(
-            50, return_sequences=True, dropout=0.1, recurrent_dropout=0.1))(embedding_layer)
-        X = layers.GlobalMaxPool1D()(X)  # Dimension Reduction
-        X = layers.Dense(50, activation='relu')(X)
-        X = layers.Dropout(0.2)(X)
-        X = layers.Dense(num_labels, activation='softmax')(X) #maybe needs to be num labels -1
+
+        lstm = layers.Bidirectional(layers.LSTM(
+            50, return_sequences=True, dropout=0.1, recurrent_dropout=0.1))
+        pooling = MaskedGlobalMaxPool1D()  # Dimension Reduction
+        head_layers = [
+            layers.Dense(50, activation='relu'),
+            layers.Dropout(0.2),
+            layers.Dense(num_labels, activation='softmax'), #maybe needs to be num labels -1
+        ]
+
+        def apply_head(X, masks):
+            # padding tokens are skipped, so the scores do not depend on the
+            # length a batch is padded to
+            mask = tf.cast(masks, tf.bool)
+            X = pooling(lstm(X, mask=mask), mask=mask)
+            for layer in head_layers:
+                X = layer(X)
+            return X
         
-        self.model = tf.keras.Model(inputs=[input_ids, input_masks, input_segments], outputs=X)
-        for layer in self.model.layers[:4]:
-            layer.trainable = False
+        self.model = tf.keras.Model(inputs=[input_ids, input_masks, input_segments],
+                                    outputs=apply_head(embedding_layer, input_masks))
+        # only the head is trained, the albert encoder stays frozen
+        transformer_model.albert.trainable = False
+
+        # the frozen encoder and the trainable head on their own, sharing the
+        # layers of the full model, so that the head can be trained on cached
+        # encoder outputs
+        self.encoder = tf.keras.Model(inputs=[input_ids, input_masks, input_segments], outputs=embedding_layer)
+        embeddings = layers.Input(
+            shape=(None, albert_config.hidden_size), name='embeddings', dtype='float32')
+        embedding_masks = layers.Input(
+            shape=(None,), name='embedding_masks', dtype='int32')
+        self.head = tf.keras.Model(inputs=[embeddings, embedding_masks], outputs=apply_head(embeddings, embedding_masks))
         
     def call(self, inputs):
         return self.model(inputs)
     
+    def serving_function(self, xla: bool = False, sequence_length: Optional[int] = None):
+        """
+        inference graph with a fixed input signature, optionally compiled with XLA.
+        by default the sequence length is left open so that callers can pad to
+        length buckets. XLA compiles once per input shape, so callers should
+        keep the set of lengths small. returns the class scores under the
+        'scores' key
+        """
+        input_signature = [
+            tf.TensorSpec([None, sequence_length], tf.int32, name=name)
+            for name in serving_input_names
+        ]
+
+        @tf.function(input_signature=input_signature, experimental_compile=xla)
+        def serve(input_ids, input_masks_ids, input_segments):
+            scores = self.model([input_ids, input_masks_ids, input_segments], training=False)
+            return {'scores': scores}
+
+        return serve.get_concrete_function()
+
+    def export_serving(self, export_dir: str, xla: bool = False) -> None:
+        """
+        save the serving signature as a tensorflow saved model
+        """
+        tf.saved_model.save(self, export_dir, signatures={
+            'serving_default': self.serving_function(xla)
+        })
+
     def summary(self):
         self.model.summary()
         
@@ -84,20 +155,13 @@ class LanguagePredictionModel(reScribeModel):
         config.output_hidden_states = False
         return config
         
-    def tokenize(self, sentences):
+    def tokenize(self, sentences, buckets=None):
         """
-        tokenize inputs
+        tokenize inputs, padded to max_sequence_length or to the shortest of
+        the given length buckets that fits the batch
         """
-        input_ids, input_masks, input_segments = [], [], []
-        for sentence in sentences:
-            inputs = self.tokenizer.encode_plus(sentence, add_special_tokens=True, max_length=64, padding='max_length',
-                                                return_attention_mask=True, return_token_type_ids=True, truncation=True)
-            input_ids.append(inputs['input_ids'])
-            input_masks.append(inputs['attention_mask'])
-            input_segments.append(inputs['token_type_ids'])
-            
-        return np.asarray(input_ids, dtype='int32'), np.asarray(input_masks, dtype='int32'), np.asarray(input_segments, dtype='int32')
-    
+        return self.tokenizer.tokenize(sentences, buckets)
+
 
 def main():
     model = LanguagePredictionModel(64, ['cpp', 'java'])
@@ -18,19 +18,49 @@ if __name__ == "__main__":
 #################################
 
 import os
+import sys
 import yaml
+import shutil
 import argparse
+import numpy as np
 import tensorflow as tf
+from tempfile import TemporaryDirectory
 from loguru import logger
 from utils.types import NLPType
-from language_prediction.prepare_data import prepare_data
+from language_prediction.prepare_data import prepare_data, prepare_dataset, split_clean_data
+from language_prediction.tokenizer import TokenizedInputs, LanguagePredictionTokenizer
+from language_prediction.distributed import launch_local_workers, is_local_worker, is_chief, configure_worker_threads, \
+    shard_dataset, ThroughputLogger
 from utils.utils import get_file_path_relative, read_from_disk, reScribeModel
 from language_prediction.language_prediction_model import LanguagePredictionModel
+from language_prediction.checkpoints import TrainingCheckpoint
+from language_prediction.tfrecord_cache import build_cache, cached_dataset
+from language_prediction.feature_cache import cache_features, split_cached_features
+from language_prediction.quantization import convert_to_tflite, QUANTIZATION_MODES, INT8_QUANTIZATION
 from language_prediction.config import read_config_language_prediction as read_config
-from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, clean_data_file_name, checkpoint_file, classes_file
+from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, clean_data_file_name, checkpoint_file, classes_file, \
+    language_prediction_checkpoints_folder, language_prediction_serving_folder, language_prediction_tflite_file, \
+    language_prediction_tokenizer_folder, language_prediction_features_folder, \
+    language_prediction_tfrecord_folder, language_prediction_training_checkpoints_folder, \
+    language_prediction_split_folder
 
 language_prediction_model: reScribeModel = None
 
+
+def take_inputs(dataset: tf.data.Dataset, size: int) -> TokenizedInputs:
+    """
+    the tokenized inputs of the first size examples of a batched dataset
+    """
+    batches = []
+    count = 0
+    for inputs, _labels in dataset:
+        batches.append([tensor.numpy() for tensor in inputs])
+        count += len(batches[-1][0])
+        if count >= size:
+            break
+    return tuple(np.concatenate(arrays)[:size] for arrays in zip(*batches))
+
+
 @logger.catch
 def main() -> None: 
     read_config()
@@ -39,52 +69,217 @@ def main() -> None:
     
     parser.add_argument('--batch-size', type=int, default=64)
     parser.add_argument('--max-sequence-length', type=int, default=64)
+    parser.add_argument('--epochs', type=int, default=1)
+    parser.add_argument('--patience', type=int, default=3,
+                        help='stop after this many epochs without a lower validation loss')
+    parser.add_argument('--training-checkpoint-dir', type=str, default=None,
+                        help='where the model and optimizer are saved after every epoch, to resume an interrupted run. '
+                             'it is cleared once the model is exported')
+    parser.add_argument('--restart', action='store_true',
+                        help='discard the saved training state and train from scratch')
+    parser.add_argument('--xla', action='store_true',
+                        help='compile the exported serving signature with XLA')
+    parser.add_argument('--quantize', type=str, choices=QUANTIZATION_MODES, default=None,
+                        help='also export a quantized tflite model')
+    parser.add_argument('--calibration-size', type=int, default=500,
+                        help='number of training examples used to calibrate int8 quantization')
+    parser.add_argument('--cached-features', action='store_true',
+                        help='run the frozen encoder once, cache its outputs and train the head on them')
+    parser.add_argument('--streaming', action='store_true',
+                        help='stream and tokenize the training data with tf.data instead of loading it into memory')
+    parser.add_argument('--shuffle-buffer', type=int, default=10000,
+                        help='number of examples in the shuffle buffer when streaming')
+    parser.add_argument('--tfrecord-cache', action='store_true',
+                        help='stream the training data from a cache of tokenized tfrecord shards, '
+                             'only tokenizing the chunks that changed since the last run')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of local worker processes training the model together, on a share of the cores each')
+    parser.add_argument('--steps-per-epoch', type=int, default=None,
+                        help='stop every epoch after this many steps')
+    parser.add_argument('--throughput-file', type=str, default=None,
+                        help='write the training examples per second to this json file')
+    parser.add_argument('--skip-export', action='store_true',
+                        help='train without saving or exporting the model, e.g. to measure throughput')
     args = parser.parse_args()
+    # the tfrecord cache is streamed like the clean data
+    streaming = args.streaming or args.tfrecord_cache
+    if streaming and args.cached_features:
+        parser.error('--cached-features needs the training data in memory, it cannot be used with --streaming '
+                     'or --tfrecord-cache')
+    if args.workers > 1 and not streaming:
+        parser.error('--workers shards a tf.data input between the workers, it needs --streaming or --tfrecord-cache')
     
     # load our classes so that we can pass them to train and the language prediction model
     clean_folder = get_file_path_relative(os.path.join(data_folder, clean_data_folder, language_prediction_data_folder))
-    _ = read_from_disk(os.path.join(clean_folder, f'{clean_data_file_name}.tgz'), extension='tgz', extract_only=True)
+    clean_data_path = os.path.join(clean_folder, f'{clean_data_file_name}.tgz')
+    tfrecord_dir = os.path.join(clean_folder, language_prediction_tfrecord_folder)
+    split_dir = os.path.join(clean_folder, language_prediction_split_folder)
+    training_checkpoint_dir = args.training_checkpoint_dir if args.training_checkpoint_dir is not None else \
+        get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_training_checkpoints_folder))
+    if not is_local_worker():
+        # the launcher extracts the data once for all local workers
+        _ = read_from_disk(clean_data_path, extension='tgz', extract_only=True)
+        if args.restart and os.path.exists(training_checkpoint_dir):
+            shutil.rmtree(training_checkpoint_dir)
     
     classes = []
     with open(os.path.join(clean_folder, classes_file)) as stream:
         classes = yaml.safe_load(stream)
+
+    if args.workers > 1:
+        if not is_local_worker():
+            if args.tfrecord_cache:
+                # built before starting the workers, so that they only read it
+                build_cache(clean_data_path, LanguagePredictionTokenizer(args.max_sequence_length, classes),
+                            len(classes), tfrecord_dir)
+            else:
+                # split before starting the workers, so that they only read the splits
+                split_clean_data(clean_data_path, len(classes), split_dir, validation_split=0.20)
+            sys.exit(launch_local_workers(args.workers))
+        configure_worker_threads(args.workers)
+        strategy = tf.distribute.experimental.MultiWorkerMirroredStrategy()
+    else:
+        strategy = tf.distribute.get_strategy()
+    # every step trains on a batch per worker
+    global_batch_size = args.batch_size * args.workers
     
     # declare global again because we want to change the value of the global variable
     global language_prediction_model
-    language_prediction_model = LanguagePredictionModel(
-                                    max_sequence_length=args.max_sequence_length,
-                                    classes=classes
-                                )
+    with strategy.scope():
+        language_prediction_model = LanguagePredictionModel(
+                                        max_sequence_length=args.max_sequence_length,
+                                        classes=classes
+                                    )
                                 
 
 
-    checkpoint_dir = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, 'language_prediction_model_checkpoints'))
+    checkpoint_dir = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_checkpoints_folder))
+    serving_dir = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_serving_folder))
+    tokenizer_dir = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_tokenizer_folder))
+    tflite_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_tflite_file))
                                                         
-    x_train, x_test, y_train, y_test = prepare_data(clean_folder, f'{clean_data_file_name}.tgz', classes)
-
-    language_prediction_model.compile(optimizer='rmsprop', 
-                                        loss=tf.keras.losses.CategoricalCrossentropy(), 
-                                        metrics=[
-                                            tf.keras.metrics.Accuracy(),
-                                            tf.keras.metrics.AUC(),
-                                            tf.keras.metrics.Precision(),
-                                            tf.keras.metrics.Recall()
-                                        ])
+    if args.tfrecord_cache:
+        shard_paths = build_cache(clean_data_path, language_prediction_model.tokenizer, len(classes), tfrecord_dir)
+        train_dataset, validation_dataset, _ = cached_dataset(
+            shard_paths, len(classes), args.max_sequence_length, global_batch_size,
+            validation_split=0.20, shuffle_buffer=args.shuffle_buffer)
+        # workers read whole shards when there are enough to go around
+        train_dataset = shard_dataset(train_dataset, by_file=len(shard_paths) >= args.workers)
+        validation_dataset = shard_dataset(validation_dataset, by_file=len(shard_paths) >= args.workers)
+    elif args.streaming:
+        # the tgz is split once into tfrecord files, by the same title hash as prepare_data
+        train_dataset, validation_dataset, _ = prepare_dataset(
+            clean_folder, f'{clean_data_file_name}.tgz', classes, language_prediction_model.tokenizer, global_batch_size,
+            validation_split=0.20, shuffle_buffer=args.shuffle_buffer, split_dir=split_dir)
+        train_dataset = shard_dataset(train_dataset)
+        validation_dataset = shard_dataset(validation_dataset)
+    else:
+        x_train, x_test, y_train, y_test = prepare_data(clean_folder, f'{clean_data_file_name}.tgz', classes)
+
+    with strategy.scope():
+        language_prediction_model.compile(optimizer='rmsprop', 
+                                            loss=tf.keras.losses.CategoricalCrossentropy(), 
+                                            metrics=[
+                                                tf.keras.metrics.Accuracy(),
+                                                tf.keras.metrics.AUC(),
+                                                tf.keras.metrics.Precision(),
+                                                tf.keras.metrics.Recall()
+                                            ])
+    throughput = ThroughputLogger(global_batch_size, args.workers, args.throughput_file)
+
+    def fit(name: str, model: tf.keras.Model, *inputs, **kwargs) -> None:
+        """
+        train the model, resuming from the training state saved under its name and stopping early
+        """
+        checkpointing = TrainingCheckpoint(model, os.path.join(training_checkpoint_dir, name), args.patience)
+        initial_epoch = checkpointing.restore()
+        if checkpointing.finished(args.epochs):
+            logger.info(f'training already finished at epoch {initial_epoch}')
+            checkpointing.restore_best()
+            return
+        model.fit(*inputs,
+                  epochs=args.epochs,
+                  initial_epoch=initial_epoch,
+                  callbacks=[throughput, checkpointing],
+                  **kwargs)
                                    
     logger.info('training language_prediction model')     
     language_prediction_model.training = True
-    language_prediction_model.fit(language_prediction_model.tokenize(x_train), 
-                                    y_train, 
-                                    batch_size=args.batch_size, 
-                                    epochs=1, 
-                                    verbose=1, 
-                                    validation_split=0.20)
+    if streaming:
+        fit('model',
+            language_prediction_model,
+            train_dataset,
+            validation_data=validation_dataset,
+            steps_per_epoch=args.steps_per_epoch,
+            verbose=1 if is_chief() else 0)
+    elif args.cached_features:
+        features, masks = cache_features(language_prediction_model, x_train, os.path.join(clean_folder, language_prediction_features_folder),
+                                  batch_size=args.batch_size)
+        train_batches, validation_batches = split_cached_features(features, masks, y_train, 0.20, args.batch_size)
+        # the head shares its layers with the full model, so training it trains the model
+        language_prediction_model.head.compile(optimizer='rmsprop',
+                                                loss=tf.keras.losses.CategoricalCrossentropy(),
+                                                metrics=[
+                                                    tf.keras.metrics.Accuracy(),
+                                                    tf.keras.metrics.AUC(),
+                                                    tf.keras.metrics.Precision(),
+                                                    tf.keras.metrics.Recall()
+                                                ])
+        fit('head',
+            language_prediction_model.head,
+            train_batches,
+            validation_data=validation_batches,
+            verbose=1)
+        # build the full model before saving it
+        language_prediction_model.predict(language_prediction_model.tokenize(x_train[:1]))
+    else:
+        fit('model',
+            language_prediction_model,
+            language_prediction_model.tokenize(x_train), 
+            y_train, 
+            batch_size=args.batch_size, 
+            steps_per_epoch=args.steps_per_epoch,
+            verbose=1, 
+            validation_split=0.20)
     language_prediction_model.training = False
     logger.success('language_prediction model trained')
+    if args.skip_export:
+        return
     
+    if not is_chief():
+        # every worker takes part in saving, only the chief's copy is kept
+        with TemporaryDirectory(prefix='language_prediction_worker_') as worker_dir:
+            language_prediction_model.save(worker_dir, save_format='tf')
+        return
     logger.info(f'saving trained language_prediction model to {checkpoint_dir}')
     language_prediction_model.save(checkpoint_dir, save_format='tf')
     logger.success(f'trained model saved at {checkpoint_dir}')
+
+    # serving loads the tokenizer on its own instead of building the model to tokenize
+    language_prediction_model.tokenizer.save(tokenizer_dir)
+    logger.success(f'tokenizer saved at {tokenizer_dir}')
+
+    logger.info(f'exporting language_prediction serving signature to {serving_dir}')
+    language_prediction_model.export_serving(serving_dir, xla=args.xla)
+    logger.success(f'serving signature exported at {serving_dir}')
+
+    if args.quantize is not None:
+        calibration_inputs = None
+        if args.quantize == INT8_QUANTIZATION and streaming:
+            # the training set is shuffled, so its first examples are a random sample
+            calibration_inputs = take_inputs(train_dataset, args.calibration_size)
+        elif args.quantize == INT8_QUANTIZATION:
+            # calibrate on training data only, the holdout set stays unseen for evaluation
+            calibration_indices = np.random.RandomState(0).choice(
+                len(x_train), min(args.calibration_size, len(x_train)), replace=False)
+            calibration_inputs = language_prediction_model.tokenize(x_train[calibration_indices])
+        logger.info(f'exporting {args.quantize} quantized language_prediction model to {tflite_path}')
+        with open(tflite_path, 'wb') as tflite_file:
+            tflite_file.write(convert_to_tflite(language_prediction_model, args.quantize, calibration_inputs))
+        logger.success(f'quantized model exported at {tflite_path}')
+
+    # the run is complete, the next one trains from scratch instead of resuming it
+    shutil.rmtree(training_checkpoint_dir, ignore_errors=True)
     
     
 if __name__ == '__main__':
@@ -1,12 +1,22 @@
 import os
 import ast
+import yaml
+import tarfile
 import numpy as np
 import pandas as pd
 from loguru import logger
 import tensorflow as tf
-from sklearn.model_selection import train_test_split
+from typing import Any, Dict, Iterator, Optional, Tuple
 from utils.utils import read_from_disk
-from utils.variables import holdout
+from utils.variables import holdout, language_prediction_split_folder
+
+# rows read from a chunk csv at a time while streaming
+STREAM_CHUNK_SIZE: int = 10000
+# titles are hashed into this many buckets to split them
+SPLIT_BUCKETS: int = 1000
+SPLITS: Tuple[str, str, str] = ('train', 'validation', 'holdout')
+SPLIT_MANIFEST_FILE: str = 'manifest.yml'
+SPLIT_COMPRESSION: str = 'GZIP'
 
 def label_count(values, label):
     """
@@ -19,7 +29,13 @@ def label_count(values, label):
 
     return count
         
-def prepare_data(clean_folder, clean_data_file, classes):
+def prepare_data(clean_folder, clean_data_file, classes, random_state=0):
+    """
+    load the clean data and split it into train and holdout sets. titles are
+    held out by their hash bucket, like in the streaming and cached datasets,
+    so every training mode and evaluation script sees the same holdout set.
+    the training set is shuffled with random_state
+    """
     
     # Load the clean data from disk
     clean_data = read_from_disk(os.path.join(clean_folder, clean_data_file), extension='tgz')
@@ -61,7 +77,11 @@ def prepare_data(clean_folder, clean_data_file, classes):
     
     
     # get the train test split
-    X_train, X_test, y_train, y_test = train_test_split(data.title.to_numpy(), data.tags_cat.to_numpy(), test_size=holdout)
+    titles = data.title.to_numpy()
+    in_holdout = holdout_mask(titles)
+    train_order = np.random.RandomState(random_state).permutation(np.flatnonzero(~in_holdout))
+    X_train, X_test = titles[train_order], titles[in_holdout]
+    y_train, y_test = data.tags_cat.to_numpy()[train_order], data.tags_cat.to_numpy()[in_holdout]
     
     logger.info(f"x_train length {len(X_train)}")
     logger.info(f"x_test length {len(X_test)}")
@@ -74,4 +94,162 @@ def prepare_data(clean_folder, clean_data_file, classes):
     y_test = list(y_test)
     y_test = np.asarray(y_test)
     
-    return X_train, X_test, y_train, y_test
\ No newline at end of file
+    return X_train, X_test, y_train, y_test
+
+
+def stream_clean_data(clean_data_path: str, num_classes: int) -> Iterator[Tuple[str, np.ndarray]]:
+    """
+    titles and one-hot labels of the clean data, read chunk by chunk from the
+    csv files of the tgz without extracting it
+    """
+    with tarfile.open(clean_data_path, 'r|gz') as tar:
+        for member in tar:
+            if not member.isfile() or member.name.split('.')[-1] != 'csv':
+                continue
+            for frame in pd.read_csv(tar.extractfile(member), chunksize=STREAM_CHUNK_SIZE,
+                                     usecols=['title', 'tags_cat']):
+                for title, tags_cat in zip(frame['title'], frame['tags_cat']):
+                    label = np.asarray(ast.literal_eval(tags_cat), dtype=np.float32)
+                    if len(label) != num_classes:
+                        raise ValueError(f'label {tags_cat} of "{title}" does not have {num_classes} classes')
+                    yield str(title), label
+
+
+def split_buckets(validation_split: float) -> Tuple[int, int]:
+    """
+    hash buckets of the splits: titles in buckets below the first value are
+    held out, below the second used for validation, and the rest for training
+    """
+    holdout_buckets = int(SPLIT_BUCKETS * holdout)
+    return holdout_buckets, holdout_buckets + int((SPLIT_BUCKETS - holdout_buckets) * validation_split)
+
+
+def split_bucket(titles) -> tf.Tensor:
+    """
+    hash bucket of every title, stable across runs and processes
+    """
+    return tf.strings.to_hash_bucket_fast(titles, SPLIT_BUCKETS)
+
+
+def holdout_mask(titles) -> np.ndarray:
+    """
+    whether every title is in the holdout set, the hash buckets that
+    split_clean_data and the tokenized dataset cache hold out
+    """
+    holdout_buckets, _ = split_buckets(0.)
+    return split_bucket([str(title) for title in titles]).numpy() < holdout_buckets
+
+
+def split_clean_data(clean_data_path: str, num_classes: int, split_dir: str,
+                     validation_split: float = 0.2) -> Dict[str, str]:
+    """
+    split the clean data into a gzip compressed tfrecord file of titles and
+    labels per split, in a single pass over the tgz, and return the path of
+    every split. the files are reused as long as the tgz and the split
+    settings do not change
+    """
+    source_stat = os.stat(clean_data_path)
+    source: Dict[str, Any] = {
+        'size': source_stat.st_size,
+        'mtime_ns': source_stat.st_mtime_ns,
+        'num_classes': num_classes,
+        'holdout': holdout,
+        'validation_split': validation_split,
+        'split_buckets': SPLIT_BUCKETS,
+    }
+    paths = {split: os.path.join(split_dir, f'{split}.tfrecord.gz') for split in SPLITS}
+    manifest_path = os.path.join(split_dir, SPLIT_MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest: Dict[str, Any] = yaml.safe_load(manifest_file)
+        if manifest.get('source') == source and all(os.path.exists(path) for path in paths.values()):
+            return paths
+        # the manifest is written last, so a partly written split is never used
+        os.remove(manifest_path)
+
+    os.makedirs(split_dir, exist_ok=True)
+    logger.info(f'splitting {clean_data_path} into {split_dir}')
+    holdout_buckets, validation_buckets = split_buckets(validation_split)
+    options = tf.io.TFRecordOptions(compression_type=SPLIT_COMPRESSION)
+    writers = {split: tf.io.TFRecordWriter(f'{path}.tmp', options=options) for split, path in paths.items()}
+    counts = {split: 0 for split in SPLITS}
+    try:
+        titles, labels = [], []
+
+        def write_chunk() -> None:
+            for title, label, bucket in zip(titles, labels, split_bucket(titles).numpy()):
+                split = 'holdout' if bucket < holdout_buckets else \
+                    'validation' if bucket < validation_buckets else 'train'
+                writers[split].write(tf.train.Example(features=tf.train.Features(feature={
+                    'title': tf.train.Feature(bytes_list=tf.train.BytesList(value=[title.encode('utf-8')])),
+                    'label': tf.train.Feature(float_list=tf.train.FloatList(value=label)),
+                })).SerializeToString())
+                counts[split] += 1
+
+        for title, label in stream_clean_data(clean_data_path, num_classes):
+            titles.append(title)
+            labels.append(label)
+            if len(titles) == STREAM_CHUNK_SIZE:
+                write_chunk()
+                titles, labels = [], []
+        if len(titles) > 0:
+            write_chunk()
+    finally:
+        for writer in writers.values():
+            writer.close()
+    for split, path in paths.items():
+        os.replace(f'{path}.tmp', path)
+    with open(manifest_path, 'w') as manifest_file:
+        yaml.dump({'source': source, 'examples': counts}, manifest_file)
+    logger.success(f'split the clean data: {counts}')
+    return paths
+
+
+def prepare_dataset(clean_folder, clean_data_file, classes, tokenizer, batch_size: int,
+                    validation_split: float = 0.2, shuffle_buffer: int = 10000, seed: int = 0,
+                    split_dir: Optional[str] = None
+                    ) -> Tuple[tf.data.Dataset, tf.data.Dataset, tf.data.Dataset]:
+    """
+    streaming train, validation and holdout datasets of tokenized, batched
+    titles and one-hot labels. memory use does not grow with the dataset.
+    titles are split by a hash of their text, so the split is the same on
+    every run and a title is in a single split: the holdout fraction is held
+    out, and validation_split of the rest is used for validation.
+    the tgz is split once into split_dir, by default next to it, so every
+    epoch reads its own split only. only the training set is shuffled,
+    through a bounded buffer
+    """
+    clean_data_path = os.path.join(clean_folder, clean_data_file)
+    num_classes = len(classes)
+    if split_dir is None:
+        split_dir = os.path.join(clean_folder, language_prediction_split_folder)
+    paths = split_clean_data(clean_data_path, num_classes, split_dir, validation_split)
+    feature_spec = {
+        'title': tf.io.FixedLenFeature([], tf.string),
+        'label': tf.io.FixedLenFeature([num_classes], tf.float32),
+    }
+
+    def examples(split: str) -> tf.data.Dataset:
+        def parse(record):
+            example = tf.io.parse_single_example(record, feature_spec)
+            return example['title'], example['label']
+        return tf.data.TFRecordDataset(paths[split], compression_type=SPLIT_COMPRESSION) \
+            .map(parse, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+    def tokenize(titles):
+        return tokenizer.tokenize([title.decode('utf-8') for title in titles])
+
+    def tokenize_batch(titles, labels):
+        inputs = tf.numpy_function(tokenize, [titles], (tf.int32, tf.int32, tf.int32))
+        for tensor in inputs:
+            tensor.set_shape([None, tokenizer.max_sequence_length])
+        return tuple(inputs), labels
+
+    def batches(dataset: tf.data.Dataset) -> tf.data.Dataset:
+        # titles are tokenized a batch at a time, several batches in parallel
+        return dataset.batch(batch_size) \
+            .map(tokenize_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE) \
+            .prefetch(tf.data.experimental.AUTOTUNE)
+
+    train = examples('train').shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return batches(train), batches(examples('validation')), batches(examples('holdout'))
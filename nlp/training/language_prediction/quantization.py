@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+language model quantization
+
+post-training quantization of the language prediction model to tensorflow
+lite, with dynamic range (int8 weights, float activations) or full integer
+quantization calibrated on a sample of the training data, and a callable
+wrapper to run the quantized model
+"""
+
+import queue
+import numpy as np
+import tensorflow as tf
+
+from typing import Iterator, List, Sequence
+from utils.variables import serving_input_names
+from language_prediction.tokenizer import TokenizedInputs
+
+DYNAMIC_RANGE_QUANTIZATION: str = 'dynamic'
+INT8_QUANTIZATION: str = 'int8'
+QUANTIZATION_MODES: List[str] = [DYNAMIC_RANGE_QUANTIZATION, INT8_QUANTIZATION]
+
+
+def convert_to_tflite(model, quantization: str, calibration_inputs: TokenizedInputs = None) -> bytes:
+    """
+    convert the model's serving graph at its max sequence length to a
+    quantized tflite flatbuffer. int8 quantization needs calibration inputs
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f'quantization has value: {quantization} expected {QUANTIZATION_MODES}')
+    # tflite runs fixed shapes best, the batch size is resized at run time
+    serve = model.serving_function(sequence_length=model.max_sequence_length)
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([serve])
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == INT8_QUANTIZATION:
+        if calibration_inputs is None:
+            raise ValueError('int8 quantization needs calibration inputs')
+
+        def representative_dataset() -> Iterator[List[np.ndarray]]:
+            # one example at a time, in the order of the serving inputs
+            for i in range(len(calibration_inputs[0])):
+                yield [inputs[i:i + 1] for inputs in calibration_inputs]
+        converter.representative_dataset = representative_dataset
+        # ops without an int8 kernel (e.g. parts of the lstm) stay in float
+        # instead of failing the conversion
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+            tf.lite.OpsSet.SELECT_TF_OPS,
+        ]
+    else:
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+            tf.lite.OpsSet.SELECT_TF_OPS,
+        ]
+    return converter.convert()
+
+
+class _Interpreter:
+    """
+    a tflite interpreter with the indices of its serving inputs and output
+    """
+
+    def __init__(self, model_content: bytes):
+        self.interpreter = tf.lite.Interpreter(model_content=model_content)
+        self.interpreter.allocate_tensors()
+        details = self.interpreter.get_input_details()
+        # the tensor names carry the serving input names, possibly with a prefix
+        self.input_indices = [
+            next(detail['index'] for detail in details if name in detail['name'])
+            for name in serving_input_names
+        ]
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = int(details[0]['shape'][0])
+        self.sequence_length = int(details[0]['shape'][1])
+
+    def __call__(self, inputs: Sequence[np.ndarray]) -> np.ndarray:
+        batch_size = len(inputs[0])
+        if batch_size != self.batch_size:
+            # reallocating is expensive, so only resize when the batch size changes
+            for index in self.input_indices:
+                self.interpreter.resize_tensor_input(index, [batch_size, self.sequence_length])
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+        for index, value in zip(self.input_indices, inputs):
+            self.interpreter.set_tensor(index, np.asarray(value, dtype=np.int32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+
+class TFLiteLanguageModel:
+    """
+    callable wrapper around a tflite language prediction model. an
+    interpreter is not thread safe, so every call borrows one from a pool of
+    num_interpreters, created and warmed up at load, sharing the model buffer
+    """
+
+    # the sequence length is fixed at conversion time
+    variable_length: bool = False
+
+    def __init__(self, model_path: str, num_interpreters: int = 1):
+        with open(model_path, 'rb') as model_file:
+            self.model_content = model_file.read()
+        self._interpreters: 'queue.Queue[_Interpreter]' = queue.Queue()
+        interpreters = [_Interpreter(self.model_content) for _ in range(num_interpreters)]
+        self.sequence_length: int = interpreters[0].sequence_length
+        # ops exported with SELECT_TF_OPS only run where the flex delegate is linked in
+        dummy = np.zeros((1, self.sequence_length), dtype=np.int32)
+        try:
+            interpreters[0]((dummy, dummy, dummy))
+        except (RuntimeError, ValueError) as err:
+            raise RuntimeError(f'{model_path} does not run in this tensorflow lite interpreter, '
+                               f'check that it supports the ops of the model: {err}') from err
+        for interpreter in interpreters:
+            self._interpreters.put(interpreter)
+
+    def __call__(self, inputs: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        inputs are the tokenized input ids, attention masks and segments,
+        padded to the sequence length of the model
+        """
+        interpreter = self._interpreters.get()
+        try:
+            return interpreter(inputs)
+        finally:
+            self._interpreters.put(interpreter)
+
+    def warm_up(self, batch_sizes: Sequence[int]) -> None:
+        """
+        run every interpreter of the pool once per batch size
+        """
+        interpreters = [self._interpreters.get() for _ in range(self._interpreters.qsize())]
+        try:
+            for interpreter in interpreters:
+                for batch_size in batch_sizes:
+                    dummy = np.zeros((batch_size, self.sequence_length), dtype=np.int32)
+                    interpreter((dummy, dummy, dummy))
+        finally:
+            for interpreter in interpreters:
+                self._interpreters.put(interpreter)
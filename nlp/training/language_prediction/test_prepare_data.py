@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+data preparation tests: every training mode holds out the same titles
+"""
+
+import io
+import tarfile
+import pytest
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('pandas')
+
+import numpy as np
+import tensorflow as tf
+from language_prediction.prepare_data import holdout_mask, split_clean_data, SPLIT_COMPRESSION
+
+NUM_CLASSES = 2
+
+
+def _write_clean_data(path: str, titles) -> None:
+    rows = [f'{i},{title},"[{i % NUM_CLASSES}, {1 - i % NUM_CLASSES}]"' for i, title in enumerate(titles)]
+    data = ('\n'.join(['id,title,tags_cat'] + rows) + '\n').encode('utf-8')
+    with tarfile.open(path, 'w:gz') as tar:
+        info = tarfile.TarInfo('clean/0.csv')
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+
+
+def test_holdout_mask_matches_the_streaming_split(tmp_path):
+    """
+    the in memory holdout set is the holdout split of the streaming dataset
+    """
+    titles = [f'question number {i}' for i in range(500)]
+    path = str(tmp_path / 'clean.tgz')
+    _write_clean_data(path, titles)
+    paths = split_clean_data(path, NUM_CLASSES, str(tmp_path / 'split'))
+    feature_spec = {'title': tf.io.FixedLenFeature([], tf.string)}
+    streamed = {tf.io.parse_single_example(record, feature_spec)['title'].numpy().decode('utf-8')
+                for record in tf.data.TFRecordDataset(paths['holdout'], compression_type=SPLIT_COMPRESSION)}
+    in_holdout = holdout_mask(titles)
+    assert streamed == set(np.asarray(titles)[in_holdout])
+    assert 0 < in_holdout.sum() < len(titles)
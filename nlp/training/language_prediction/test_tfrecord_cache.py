@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+"""
+tokenized dataset cache tests: shards are only rebuilt when their chunk or
+the tokenizer changed
+"""
+
+import io
+import os
+import tarfile
+import pytest
+
+from types import SimpleNamespace
+from typing import Dict, List
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('transformers')
+
+import yaml
+import numpy as np
+from language_prediction.tfrecord_cache import build_cache, cached_dataset, MANIFEST_FILE
+
+NUM_CLASSES = 2
+
+
+class _CountingTokenizer:
+    """
+    stand-in for the albert tokenizer that counts the titles it tokenizes
+    """
+
+    def __init__(self, name: str = 'counting', max_sequence_length: int = 4):
+        self.max_sequence_length = max_sequence_length
+        self.fast_tokenizer = SimpleNamespace(vocab_file=None, name_or_path=name)
+        self.tokenized: List[str] = []
+
+    def tokenize(self, titles: List[str]):
+        self.tokenized.extend(titles)
+        shape = (len(titles), self.max_sequence_length)
+        input_ids = np.zeros(shape, dtype=np.int32)
+        input_ids[:, 0] = [len(title) for title in titles]
+        return input_ids, np.ones(shape, dtype=np.int32), np.zeros(shape, dtype=np.int32)
+
+
+def _chunk(titles: List[str]) -> str:
+    rows = [f'{i},{title},"[{i % NUM_CLASSES}, {1 - i % NUM_CLASSES}]"' for i, title in enumerate(titles)]
+    return '\n'.join(['id,title,tags_cat'] + rows) + '\n'
+
+
+def _write_clean_data(path: str, chunks: Dict[str, str]) -> None:
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in chunks.items():
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture
+def clean_data(tmp_path):
+    """
+    clean data tgz of two chunks and an empty cache directory
+    """
+    path = str(tmp_path / 'clean.tgz')
+    chunks = {
+        'clean/0.csv': _chunk([f'java question {i}' for i in range(10)]),
+        'clean/1.csv': _chunk([f'python question {i}' for i in range(6)]),
+    }
+    _write_clean_data(path, chunks)
+    return path, chunks, str(tmp_path / 'cache')
+
+
+def _manifest(cache_dir: str) -> dict:
+    with open(os.path.join(cache_dir, MANIFEST_FILE)) as manifest_file:
+        return yaml.safe_load(manifest_file)
+
+
+def test_first_build_tokenizes_every_chunk(clean_data):
+    """
+    every chunk gets a shard, listed in the manifest with its example count
+    """
+    path, _, cache_dir = clean_data
+    tokenizer = _CountingTokenizer()
+    shards = build_cache(path, tokenizer, NUM_CLASSES, cache_dir)
+    assert len(shards) == 2
+    assert all(os.path.exists(shard) for shard in shards)
+    assert len(tokenizer.tokenized) == 16
+    manifest = _manifest(cache_dir)
+    assert sorted(shard['examples'] for shard in manifest['shards'].values()) == [6, 10]
+
+
+def test_up_to_date_cache_is_reused(clean_data):
+    """
+    a second build with the same data and tokenizer tokenizes nothing
+    """
+    path, _, cache_dir = clean_data
+    build_cache(path, _CountingTokenizer(), NUM_CLASSES, cache_dir)
+    manifest = _manifest(cache_dir)
+    tokenizer = _CountingTokenizer()
+    build_cache(path, tokenizer, NUM_CLASSES, cache_dir)
+    assert tokenizer.tokenized == []
+    assert _manifest(cache_dir) == manifest
+
+
+def test_only_changed_chunks_are_rebuilt(clean_data):
+    """
+    a chunk with new content is tokenized again, the others are kept
+    """
+    path, chunks, cache_dir = clean_data
+    build_cache(path, _CountingTokenizer(), NUM_CLASSES, cache_dir)
+    chunks['clean/1.csv'] = _chunk([f'python question {i}' for i in range(8)])
+    _write_clean_data(path, chunks)
+    tokenizer = _CountingTokenizer()
+    build_cache(path, tokenizer, NUM_CLASSES, cache_dir)
+    assert len(tokenizer.tokenized) == 8
+    assert all(title.startswith('python') for title in tokenizer.tokenized)
+
+
+def test_changed_tokenizer_rebuilds_every_shard(clean_data):
+    """
+    shards tokenized with another vocabulary or sequence length are stale
+    """
+    path, _, cache_dir = clean_data
+    build_cache(path, _CountingTokenizer(), NUM_CLASSES, cache_dir)
+    tokenizer = _CountingTokenizer(max_sequence_length=8)
+    build_cache(path, tokenizer, NUM_CLASSES, cache_dir)
+    assert len(tokenizer.tokenized) == 16
+    tokenizer = _CountingTokenizer(name='other vocabulary', max_sequence_length=8)
+    build_cache(path, tokenizer, NUM_CLASSES, cache_dir)
+    assert len(tokenizer.tokenized) == 16
+
+
+def test_removed_chunks_are_deleted(clean_data):
+    """
+    the shard of a chunk that left the clean data is removed with its entry
+    """
+    path, chunks, cache_dir = clean_data
+    shards = build_cache(path, _CountingTokenizer(), NUM_CLASSES, cache_dir)
+    del chunks['clean/1.csv']
+    _write_clean_data(path, chunks)
+    remaining = build_cache(path, _CountingTokenizer(), NUM_CLASSES, cache_dir)
+    assert len(remaining) == 1
+    assert len(_manifest(cache_dir)['shards']) == 1
+    # shards are sorted by chunk name
+    assert remaining == shards[:1]
+    assert not os.path.exists(shards[1])
+
+
+def test_cached_dataset_reads_every_example_once(clean_data):
+    """
+    the splits of the cached dataset together hold every example
+    """
+    path, _, cache_dir = clean_data
+    shards = build_cache(path, _CountingTokenizer(), NUM_CLASSES, cache_dir)
+    splits = cached_dataset(shards, NUM_CLASSES, 4, batch_size=4)
+    examples = 0
+    for split in splits:
+        for (input_ids, _, _), labels in split:
+            assert input_ids.shape[1] == 4
+            assert labels.shape[1] == NUM_CLASSES
+            examples += int(input_ids.shape[0])
+    assert examples == 16
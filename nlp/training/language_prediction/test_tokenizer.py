@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+tokenizer tests: the fast tokenizer must match the reference implementation
+"""
+
+import pytest
+
+pytest.importorskip('transformers')
+
+import numpy as np
+from language_prediction.tokenizer import LanguagePredictionTokenizer, bucket_length, mismatches
+
+SENTENCES = [
+    'how to sort an ArrayList in java',
+    'python read csv with pandas',
+    'std::vector<int> push_back c++',
+    'Ünïcödé — quotes “like these” and émojis 🙂',
+    '',
+    '   leading and trailing whitespace   ',
+    'a very long question ' * 20,
+]
+
+
+@pytest.fixture(scope='module')
+def tokenizer() -> LanguagePredictionTokenizer:
+    """
+    the pretrained albert tokenizer, skipped when it cannot be downloaded
+    """
+    try:
+        return LanguagePredictionTokenizer(max_sequence_length=16, classes=['java', 'python'])
+    except (OSError, ValueError) as err:
+        pytest.skip(f'pretrained tokenizer not available: {err}')
+
+
+def test_fast_tokenizer_matches_the_reference(tokenizer):
+    """
+    the batched rust tokenizer returns the same arrays as the per sentence one
+    """
+    fast = tokenizer.tokenize(SENTENCES)
+    slow = tokenizer.tokenize_slow(SENTENCES)
+    assert mismatches(slow, fast) == []
+    assert all(array.dtype == np.int32 for array in fast)
+    assert fast[0].shape == (len(SENTENCES), 16)
+
+
+def test_bucketed_padding_keeps_the_tokens(tokenizer):
+    """
+    padding to a bucket only drops padding, the tokens are the same
+    """
+    sentences = SENTENCES[:3]
+    full = tokenizer.tokenize(sentences)
+    bucketed = tokenizer.tokenize(sentences, buckets=[4, 8, 12])
+    length = bucketed[0].shape[1]
+    assert length in (4, 8, 12, 16)
+    assert int(full[1].sum(axis=1).max()) <= length
+    for full_array, bucketed_array in zip(full, bucketed):
+        np.testing.assert_array_equal(full_array[:, :length], bucketed_array)
+
+
+def test_saved_tokenizer_tokenizes_the_same(tokenizer, tmp_path):
+    """
+    the saved artifact the server loads gives the same inputs as training
+    """
+    tokenizer.save(str(tmp_path))
+    loaded = LanguagePredictionTokenizer.load(str(tmp_path))
+    assert loaded.max_sequence_length == 16
+    assert loaded.classes == ['java', 'python']
+    assert mismatches(tokenizer.tokenize(SENTENCES), loaded.tokenize(SENTENCES)) == []
+
+
+def test_bucket_length():
+    """
+    the shortest bucket that fits, the max sequence length otherwise
+    """
+    assert bucket_length(3, [16, 8, 32], 64) == 8
+    assert bucket_length(8, [8, 16], 64) == 8
+    assert bucket_length(40, [8, 16], 64) == 64
+    # buckets above the max sequence length are never used
+    assert bucket_length(20, [128], 64) == 64
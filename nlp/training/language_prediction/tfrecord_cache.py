@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+tokenized dataset cache
+
+the clean data tokenized once and stored as gzip compressed tfrecord files,
+one shard per chunk csv of the clean data. every shard is keyed by the
+content of its chunk and a fingerprint of the tokenizer and the max sequence
+length, so that only the shards whose chunk or tokenizer changed are
+tokenized again
+"""
+
+import io
+import os
+import re
+import ast
+import yaml
+import hashlib
+import tarfile
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import transformers
+
+from typing import Any, Dict, List, Tuple
+from loguru import logger
+from language_prediction.prepare_data import STREAM_CHUNK_SIZE, SPLIT_BUCKETS, split_bucket, split_buckets
+
+MANIFEST_FILE: str = 'manifest.yml'
+SHARD_EXTENSION: str = '.tfrecord.gz'
+COMPRESSION: str = 'GZIP'
+# bump when the record layout changes, to invalidate every shard
+CACHE_VERSION: int = 1
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """
+    fingerprint of everything that determines the tokenized inputs
+    """
+    digest = hashlib.sha1()
+    digest.update(f'{CACHE_VERSION}:{transformers.__version__}:{tokenizer.max_sequence_length}'.encode('utf-8'))
+    vocab_file = getattr(tokenizer.fast_tokenizer, 'vocab_file', None)
+    if vocab_file is not None and os.path.exists(vocab_file):
+        with open(vocab_file, 'rb') as vocab:
+            digest.update(vocab.read())
+    else:
+        digest.update(tokenizer.fast_tokenizer.name_or_path.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def cache_fingerprint(manifest: Dict[str, Any]) -> str:
+    """
+    fingerprint of the whole cache, from the tokenizer and the data of every shard
+    """
+    digest = hashlib.sha1(manifest['tokenizer'].encode('utf-8'))
+    for name in sorted(manifest['shards']):
+        digest.update(f"{name}:{manifest['shards'][name]['data']}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _int64_feature(values) -> tf.train.Feature:
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+
+def _write_shard(path: str, data: bytes, tokenizer, num_classes: int) -> int:
+    """
+    tokenize a chunk csv into a tfrecord file, returns the number of examples
+    """
+    examples = 0
+    # written to a temporary file first, so that an interrupted build never leaves a partial shard
+    temporary_path = f'{path}.tmp'
+    with tf.io.TFRecordWriter(temporary_path, options=tf.io.TFRecordOptions(compression_type=COMPRESSION)) as writer:
+        for frame in pd.read_csv(io.BytesIO(data), chunksize=STREAM_CHUNK_SIZE, usecols=['title', 'tags_cat']):
+            titles = [str(title) for title in frame['title']]
+            labels = [np.asarray(ast.literal_eval(tags_cat)) for tags_cat in frame['tags_cat']]
+            input_ids, input_masks, input_segments = tokenizer.tokenize(titles)
+            buckets = split_bucket(titles).numpy()
+            for i, label in enumerate(labels):
+                if len(label) != num_classes:
+                    raise ValueError(f'label {label} of "{titles[i]}" does not have {num_classes} classes')
+                writer.write(tf.train.Example(features=tf.train.Features(feature={
+                    'input_ids': _int64_feature(input_ids[i]),
+                    'attention_mask': _int64_feature(input_masks[i]),
+                    'token_type_ids': _int64_feature(input_segments[i]),
+                    'label': _int64_feature([int(np.argmax(label))]),
+                    'split_bucket': _int64_feature([int(buckets[i])]),
+                })).SerializeToString())
+                examples += 1
+    os.replace(temporary_path, path)
+    return examples
+
+
+def build_cache(clean_data_path: str, tokenizer, num_classes: int, cache_dir: str) -> List[str]:
+    """
+    bring the cache up to date with the clean data and the tokenizer, and
+    return the paths of its shards
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    fingerprint = tokenizer_fingerprint(tokenizer)
+    previous: Dict[str, Any] = {'tokenizer': None, 'shards': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            previous = yaml.safe_load(manifest_file)
+    # shards tokenized differently cannot be reused
+    reusable: Dict[str, Any] = previous['shards'] if previous['tokenizer'] == fingerprint else {}
+    manifest: Dict[str, Any] = {'tokenizer': fingerprint, 'shards': {}}
+
+    rebuilt = 0
+    with tarfile.open(clean_data_path, 'r|gz') as tar:
+        for member in tar:
+            if not member.isfile() or member.name.split('.')[-1] != 'csv':
+                continue
+            data = tar.extractfile(member).read()
+            data_fingerprint = hashlib.sha1(data).hexdigest()
+            name = re.sub(r'[^A-Za-z0-9_.-]', '_', member.name)
+            path = os.path.join(cache_dir, f'{name}{SHARD_EXTENSION}')
+            shard = reusable.get(name)
+            if shard is not None and shard['data'] == data_fingerprint and os.path.exists(path):
+                manifest['shards'][name] = shard
+                continue
+            logger.info(f'tokenizing {member.name} into {path}')
+            examples = _write_shard(path, data, tokenizer, num_classes)
+            manifest['shards'][name] = {'data': data_fingerprint, 'examples': examples}
+            rebuilt += 1
+            # saved after every shard, so that an interrupted build keeps the finished ones
+            with open(manifest_path, 'w') as manifest_file:
+                yaml.dump({'tokenizer': fingerprint, 'shards': {**reusable, **manifest['shards']}}, manifest_file)
+
+    # shards of chunks that are not in the clean data anymore
+    stale = set(previous['shards']) - set(manifest['shards'])
+    for name in stale:
+        stale_path = os.path.join(cache_dir, f'{name}{SHARD_EXTENSION}')
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    # an up to date cache is only read, so that several processes can check it at once
+    if rebuilt > 0 or len(stale) > 0 or previous['tokenizer'] != fingerprint:
+        with open(manifest_path, 'w') as manifest_file:
+            yaml.dump(manifest, manifest_file)
+    if len(manifest['shards']) == 0:
+        raise RuntimeError(f'no data found in {clean_data_path}')
+    logger.success(f'tokenized dataset cache {cache_fingerprint(manifest)}: {rebuilt} of '
+                   f"{len(manifest['shards'])} shards rebuilt, "
+                   f"{sum(shard['examples'] for shard in manifest['shards'].values())} examples")
+    return [os.path.join(cache_dir, f'{name}{SHARD_EXTENSION}') for name in sorted(manifest['shards'])]
+
+
+def cached_dataset(shard_paths: List[str], num_classes: int, max_sequence_length: int, batch_size: int,
+                   validation_split: float = 0.2, shuffle_buffer: int = 10000, seed: int = 0
+                   ) -> Tuple[tf.data.Dataset, tf.data.Dataset, tf.data.Dataset]:
+    """
+    train, validation and holdout datasets read from the cache shards, with
+    the same hash split and batches as prepare_dataset
+    """
+    feature_spec = {
+        'input_ids': tf.io.FixedLenFeature([max_sequence_length], tf.int64),
+        'attention_mask': tf.io.FixedLenFeature([max_sequence_length], tf.int64),
+        'token_type_ids': tf.io.FixedLenFeature([max_sequence_length], tf.int64),
+        'label': tf.io.FixedLenFeature([], tf.int64),
+        'split_bucket': tf.io.FixedLenFeature([], tf.int64),
+    }
+    holdout_buckets, validation_buckets = split_buckets(validation_split)
+
+    def parse(record):
+        example = tf.io.parse_single_example(record, feature_spec)
+        inputs = tuple(tf.cast(example[name], tf.int32) for name in ['input_ids', 'attention_mask', 'token_type_ids'])
+        return inputs, tf.one_hot(example['label'], num_classes), example['split_bucket']
+
+    def records(shuffle: bool) -> tf.data.Dataset:
+        files = tf.data.Dataset.from_tensor_slices(shard_paths)
+        if shuffle:
+            files = files.shuffle(len(shard_paths), seed=seed, reshuffle_each_iteration=True)
+        # several shards are read and decompressed at once
+        return files.interleave(lambda path: tf.data.TFRecordDataset(path, compression_type=COMPRESSION),
+                                cycle_length=min(len(shard_paths), 8),
+                                num_parallel_calls=tf.data.experimental.AUTOTUNE) \
+            .map(parse, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+    def split(dataset: tf.data.Dataset, start: int, end: int) -> tf.data.Dataset:
+        return dataset.filter(lambda _inputs, _label, bucket: tf.logical_and(bucket >= start, bucket < end)) \
+            .map(lambda inputs, label, _bucket: (inputs, label))
+
+    def batches(dataset: tf.data.Dataset) -> tf.data.Dataset:
+        return dataset.batch(batch_size).prefetch(tf.data.experimental.AUTOTUNE)
+
+    train = split(records(shuffle=True), validation_buckets, SPLIT_BUCKETS) \
+        .shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    validation = split(records(shuffle=False), holdout_buckets, validation_buckets)
+    holdout_examples = split(records(shuffle=False), 0, holdout_buckets)
+    return batches(train), batches(validation), batches(holdout_examples)
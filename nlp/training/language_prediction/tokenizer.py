@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+language prediction tokenizer
+
+albert tokenization of the model inputs. whole lists of sentences are
+encoded at once by the rust fast tokenizer and written straight into
+preallocated int32 arrays, padded to the maximum sequence length or to the
+shortest length bucket that fits the batch. the tokenizer can be saved as a
+self-contained artifact, so that serving does not need the albert model or
+network access to tokenize
+"""
+
+import os
+import yaml
+import numpy as np
+
+from typing import List, Optional, Sequence, Tuple
+from utils.variables import albert, language_prediction_tokenizer_config_file
+from transformers import AlbertTokenizer, AlbertTokenizerFast
+
+TokenizedInputs = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def bucket_length(length: int, buckets: Sequence[int], max_sequence_length: int) -> int:
+    """
+    shortest bucket that holds length tokens, max_sequence_length if none does.
+    a small fixed set of lengths keeps the number of compiled graphs bounded
+    """
+    for bucket in sorted(buckets):
+        if length <= bucket <= max_sequence_length:
+            return bucket
+    return max_sequence_length
+
+
+class LanguagePredictionTokenizer:
+    """
+    turns sentences into the input ids, attention masks and segment ids of the model
+    """
+
+    def __init__(self, max_sequence_length: int = 64, classes: Optional[List[str]] = None,
+                 pretrained: str = albert):
+        """
+        pretrained is the name of the pretrained tokenizer or the directory of
+        a saved one. classes are the labels of the model the inputs are for
+        """
+        self.max_sequence_length = max_sequence_length
+        self.classes = classes
+        self.fast_tokenizer = AlbertTokenizerFast.from_pretrained(pretrained, do_lower_case=True)
+        # only loaded when the reference implementation is used
+        self._slow_tokenizer: AlbertTokenizer = None
+
+    def save(self, directory: str) -> None:
+        """
+        save the vocabulary, the maximum sequence length and the classes to a directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.fast_tokenizer.save_pretrained(directory)
+        with open(os.path.join(directory, language_prediction_tokenizer_config_file), 'w') as config_file:
+            yaml.dump({
+                'max_sequence_length': self.max_sequence_length,
+                'classes': self.classes,
+            }, config_file)
+
+    @staticmethod
+    def load(directory: str) -> 'LanguagePredictionTokenizer':
+        """
+        load a tokenizer saved with save, without network access
+        """
+        with open(os.path.join(directory, language_prediction_tokenizer_config_file)) as config_file:
+            config = yaml.safe_load(config_file)
+        return LanguagePredictionTokenizer(config['max_sequence_length'], config['classes'], pretrained=directory)
+
+    def tokenize(self, sentences: Sequence[str], buckets: Optional[Sequence[int]] = None) -> TokenizedInputs:
+        """
+        tokenize a batch of sentences, truncated to max_sequence_length. without
+        buckets the batch is padded to max_sequence_length, otherwise to the
+        shortest bucket that fits its longest sentence
+        """
+        encoded = self.fast_tokenizer(list(sentences), add_special_tokens=True, truncation=True,
+                                      max_length=self.max_sequence_length, padding=False,
+                                      return_attention_mask=False, return_token_type_ids=True)
+        sequence_length = self.max_sequence_length
+        if buckets is not None and len(sentences) > 0:
+            longest = max(len(ids) for ids in encoded['input_ids'])
+            sequence_length = bucket_length(longest, buckets, self.max_sequence_length)
+        shape = (len(sentences), sequence_length)
+        input_ids = np.full(shape, self.fast_tokenizer.pad_token_id, dtype=np.int32)
+        input_masks = np.zeros(shape, dtype=np.int32)
+        input_segments = np.full(shape, self.fast_tokenizer.pad_token_type_id, dtype=np.int32)
+        for i, (ids, segments) in enumerate(zip(encoded['input_ids'], encoded['token_type_ids'])):
+            # padding goes on the right, so the tokens are a prefix of every row
+            length = len(ids)
+            input_ids[i, :length] = ids
+            input_masks[i, :length] = 1
+            input_segments[i, :length] = segments
+        return input_ids, input_masks, input_segments
+
+    def tokenize_slow(self, sentences: Sequence[str]) -> TokenizedInputs:
+        """
+        reference implementation, one python sentencepiece call per sentence.
+        tokenize must return exactly the same arrays
+        """
+        if self._slow_tokenizer is None:
+            self._slow_tokenizer = AlbertTokenizer.from_pretrained(albert, do_lower_case=True)
+        input_ids, input_masks, input_segments = [], [], []
+        for sentence in sentences:
+            inputs = self._slow_tokenizer.encode_plus(sentence, add_special_tokens=True, max_length=self.max_sequence_length,
+                                                      padding='max_length', return_attention_mask=True,
+                                                      return_token_type_ids=True, truncation=True)
+            input_ids.append(inputs['input_ids'])
+            input_masks.append(inputs['attention_mask'])
+            input_segments.append(inputs['token_type_ids'])
+        shape = (len(sentences), self.max_sequence_length)
+        return np.asarray(input_ids, dtype='int32').reshape(shape), np.asarray(input_masks, dtype='int32').reshape(shape), \
+            np.asarray(input_segments, dtype='int32').reshape(shape)
+
+
+def mismatches(expected: TokenizedInputs, actual: TokenizedInputs) -> List[int]:
+    """
+    indices of the sentences whose tokenization differs
+    """
+    different = np.zeros(len(expected[0]), dtype=bool)
+    for expected_array, actual_array in zip(expected, actual):
+        different |= np.any(expected_array != actual_array, axis=1)
+    return np.flatnonzero(different).tolist()
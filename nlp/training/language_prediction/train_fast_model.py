@@ -0,0 +1,84 @@
+#################################
+# for handling relative imports #
+#################################
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    current_file = Path(__file__).resolve()
+    root = next(
+        elem for elem in current_file.parents if str(elem).endswith("training")
+    )
+    sys.path.append(str(root))
+    # remove the current file's directory from sys.path
+    try:
+        sys.path.remove(str(current_file.parent))
+    except ValueError:  # Already removed
+        pass
+#################################
+
+import os
+import json
+import yaml
+import argparse
+import numpy as np
+
+from loguru import logger
+from language_prediction.prepare_data import prepare_data
+from language_prediction.fast_language_model import FastLanguageModel
+from language_prediction.config import read_config_language_prediction as read_config
+from utils.utils import get_file_path_relative, read_from_disk
+from utils.variables import data_folder, models_folder, clean_data_folder, language_prediction_data_folder, \
+    clean_data_file_name, classes_file, language_prediction_fast_model_file
+
+
+@logger.catch
+def main() -> None:
+    """
+    train the fast language model on the clean data, and report how many
+    holdout queries it would answer at each confidence threshold, and how well
+    """
+    read_config()
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--alpha', type=float, default=1e-6, help='regularization strength')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[.5, .7, .8, .9, .95, .99])
+    args = parser.parse_args()
+
+    clean_folder = get_file_path_relative(os.path.join(data_folder, clean_data_folder, language_prediction_data_folder))
+    _ = read_from_disk(os.path.join(clean_folder, f'{clean_data_file_name}.tgz'), extension='tgz', extract_only=True)
+    with open(os.path.join(clean_folder, classes_file)) as stream:
+        classes = yaml.safe_load(stream)
+    x_train, x_test, y_train, y_test = prepare_data(clean_folder, f'{clean_data_file_name}.tgz', classes)
+
+    logger.info('training fast language model')
+    model = FastLanguageModel(classes, alpha=args.alpha, max_iter=args.epochs)
+    model.fit(x_train, y_train)
+    logger.success('fast language model trained')
+
+    model_path = get_file_path_relative(os.path.join(data_folder, models_folder, language_prediction_data_folder, language_prediction_fast_model_file))
+    model.save(model_path)
+    logger.success(f'fast language model saved at {model_path}')
+
+    scores = model.predict_scores(x_test)
+    confidence = scores.max(axis=1)
+    correct = np.argmax(scores, axis=1) == np.argmax(y_test, axis=1)
+    report = {
+        'holdout_examples': len(x_test),
+        'accuracy': float(correct.mean()),
+        'thresholds': {},
+    }
+    for threshold in args.thresholds:
+        answered = confidence >= threshold
+        report['thresholds'][threshold] = {
+            # share of queries the server would answer without the albert model
+            'fast_tier_share': float(answered.mean()),
+            'fast_tier_accuracy': float(correct[answered].mean()) if answered.any() else None,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
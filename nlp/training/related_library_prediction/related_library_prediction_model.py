@@ -76,19 +76,37 @@ class RLP_Model(reScribeModel):
         # x_train, y_train, x_test, y_test = prepare_data(directory, args)
         # r = RLP_Model(params)
 
-    def load_pretrained(self, directory: str):
+    @staticmethod
+    def load_graph_and_vocabulary(directory: str) -> Tuple[nx.Graph, List[str]]:
+        """
+        Load the pure python part of the saved state: the graph and the vocabulary.
+        These do not depend on tensorflow, so they can be loaded once before forking
+        server workers and shared between them
+        """
+        graph_location = join(directory, inter_library_graph_file)
+        vocab_location = join(directory, inter_library_vocabulary_file)
+        graph_representation = nx.read_gpickle(graph_location)
+        with open(vocab_location, "r") as f:
+            vocabulary_list = yaml.full_load(f)
+        return graph_representation, vocabulary_list
+
+    def load_pretrained(
+        self,
+        directory: str,
+        graph_and_vocabulary: Optional[Tuple[nx.Graph, List[str]]] = None,
+    ):
         """
             Note, this assumes you're training locally... no touching S3 right now
+
+            graph_and_vocabulary can be given if they were already loaded with load_graph_and_vocabulary
         """
         # TODO: Add support for S3 loading using the PRODUCTION variable.
-        graph_location = join(directory, inter_library_graph_file)
         tok_location = join(directory, inter_library_tokenization_model_path)
-        vocab_location = join(directory, inter_library_vocabulary_file)
-        self.graph_representation = nx.read_gpickle(graph_location)
+        if graph_and_vocabulary is None:
+            graph_and_vocabulary = self.load_graph_and_vocabulary(directory)
+        self.graph_representation, self.vocabulary_list = graph_and_vocabulary
         self.tokenization_model = tf.keras.models.load_model(tok_location)
         self.tokenization_model.compile()
-        with open(vocab_location, "r") as f:
-            self.vocabulary_list = yaml.full_load(f)
         if not (
             self.graph_representation
             and self.tokenization_model
@@ -283,14 +301,59 @@ class RLP_Model(reScribeModel):
         except ValueError:
             import_to_try = self.tokenization_model.predict([import_to_try])[0][0]
 
-        edges = list(self.graph_representation.edges(import_to_try, data=True))
+        return self._get_n_nearest_indices(import_to_try, max_num_imports_to_show)
+
+    def _get_n_nearest_indices(self, import_index: int, n: int) -> List[str]:
+        """
+        Return the names of the n libraries with the heaviest edges to the given vocab index
+        """
+        edges = list(self.graph_representation.edges(import_index, data=True))
         edges = sorted(edges, key=lambda i: i[2]["weight"], reverse=True)
         # TODO: It is probably faster to do some sort of ranking with n best maintained and iterate through the list than this inefficient sort-and-crop method
-        edges = edges[:max_num_imports_to_show]
+        edges = edges[:n]
         return [self.vocabulary_list[e[1]] for e in edges]
         # To return name, weight:
         # return [(self.vocabulary[e[1]], e[2]["weight"]) for e in edges]
 
+    def get_n_nearest_libraries_batch(
+        self, base_libraries: List[Union[str, int]], n: int
+    ) -> List[List[str]]:
+        """
+        Batched version of _get_n_nearest_libraries
+
+        All library names are vectorized with a single call to the tokenization model.
+        Libraries that are not in the graph get an empty list.
+
+        Params:
+            base_libraries: Names of libraries or their indices in the vocab
+            n: How many closest libraries you want for each of them
+
+        Returns:
+            One list of library names per input, in the same order
+        """
+        indices: List[Optional[int]] = []
+        names: List[str] = []
+        name_positions: List[int] = []
+        for i, library in enumerate(base_libraries):
+            try:
+                indices.append(int(library))
+            except ValueError:
+                indices.append(None)
+                names.append(library)
+                name_positions.append(i)
+
+        if len(names) > 0:
+            vectorized = self.tokenization_model.predict(names)
+            for position, row in zip(name_positions, vectorized):
+                indices[position] = int(row[0])
+
+        return [
+            self._get_n_nearest_indices(index, n)
+            if self.graph_representation.has_node(index)
+            else []
+            for index in indices
+        ]
+
     def run_interactive_test_loop(self):
         """
         Only for debugging -> runs interactively to help ensure everything is working